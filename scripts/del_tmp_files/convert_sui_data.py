@@ -1,42 +1,22 @@
-import json
-import csv
+import sys
 from pathlib import Path
 
-# Read the JSON file
-json_path = Path(__file__).parent / 'tmp_sui_data.json'
-with open(json_path, 'r') as f:
-    data = json.load(f)
+from vault_csv_converter import convert_json_to_csv
 
-# Define the CSV headers
-headers = [
-    'id',
-    'packageId',
-    'parentPoolId',
-    'poolId',
-    'investorId',
-    'assetTypes',
-    'apr'
-]
+# CSV column -> path in the Sui vault record
+SUI_VAULT_COLUMNS = {
+    'id': 'id',
+    'packageId': 'packageId',
+    'parentPoolId': 'parentPoolId',
+    'poolId': 'poolId',
+    'investorId': 'investorId',
+    'assetTypes': {'path': 'assetTypes', 'join': '|'},  # Join multiple asset types with pipe
+    'apr': 'apr'
+}
 
-# Prepare the data for CSV
-csv_data = []
-for item in data['data']:
-    row = {
-        'id': item['id'],
-        'packageId': item['packageId'],
-        'parentPoolId': item['parentPoolId'],
-        'poolId': item['poolId'],
-        'investorId': item['investorId'],
-        'assetTypes': '|'.join(item['assetTypes']),  # Join multiple asset types with pipe
-        'apr': item['apr']
-    }
-    csv_data.append(row)
+# Stream the "data" array of the JSON dump into the CSV
+json_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / 'tmp_sui_data.json'
+csv_path = Path(sys.argv[2]) if len(sys.argv) > 2 else Path(__file__).parent / 'vaults_data_sui.csv'
+stats = convert_json_to_csv(str(json_path), str(csv_path), SUI_VAULT_COLUMNS, array_key='data')
 
-# Write to CSV
-csv_path = Path(__file__).parent / 'vaults_data_sui.csv'
-with open(csv_path, 'w', newline='') as f:
-    writer = csv.DictWriter(f, fieldnames=headers)
-    writer.writeheader()
-    writer.writerows(csv_data)
-
-print(f"CSV file has been created at: {csv_path}") 
\ No newline at end of file
+print(f"CSV file has been created at: {csv_path} ({stats['rows']} rows in {stats['elapsed_s']:.2f}s)")
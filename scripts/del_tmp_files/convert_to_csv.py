@@ -1,68 +1,35 @@
-import json
-import csv
+import sys
 from pathlib import Path
 
-# Read the JSON file
-json_path = Path(__file__).parent / 'tmp_sui_data.json'
-with open(json_path, 'r') as f:
-    data = json.load(f)
+from vault_csv_converter import convert_json_to_csv
 
-# Define the CSV headers and corresponding JSON paths
-headers = [
-    'name',
-    'address',
-    'network',
-    'protocol',
-    'token_name',
-    'token_symbol',
-    'token_address',
-    'tvl_usd',
-    'locked_usd',
-    'liquid_usd',
-    'number_of_holders',
-    'apy_1day',
-    'apy_7day',
-    'apy_30day',
-    'vault_score',
-    'vault_tvl_score',
-    'protocol_tvl_score',
-    'holder_score',
-    'network_score',
-    'asset_score'
-]
+# CSV column -> path in the vault record, missing fields and nulls become empty cells
+VAULT_COLUMNS = {
+    'name': 'name',
+    'address': 'address',
+    'network': 'network',
+    'protocol': 'protocol',
+    'token_name': 'token.name',
+    'token_symbol': 'token.symbol',
+    'token_address': 'token.assetAddress',
+    'tvl_usd': 'tvlDetails.tvlUsd',
+    'locked_usd': 'tvlDetails.lockedUsd',
+    'liquid_usd': 'tvlDetails.liquidUsd',
+    'number_of_holders': 'numberOfHolders',
+    'apy_1day': 'apy.total.1day',
+    'apy_7day': 'apy.total.7day',
+    'apy_30day': 'apy.total.30day',
+    'vault_score': 'score.vaultScore',
+    'vault_tvl_score': 'score.vaultTvlScore',
+    'protocol_tvl_score': 'score.protocolTvlScore',
+    'holder_score': 'score.holderScore',
+    'network_score': 'score.networkScore',
+    'asset_score': 'score.assetScore'
+}
 
-# Prepare the data for CSV
-csv_data = []
-for item in data:
-    row = {
-        'name': item['name'],
-        'address': item['address'],
-        'network': item['network'],
-        'protocol': item['protocol'],
-        'token_name': item['token']['name'],
-        'token_symbol': item['token']['symbol'],
-        'token_address': item['token']['assetAddress'],
-        'tvl_usd': item['tvlDetails']['tvlUsd'],
-        'locked_usd': item['tvlDetails']['lockedUsd'],
-        'liquid_usd': item['tvlDetails']['liquidUsd'],
-        'number_of_holders': item['numberOfHolders'],
-        'apy_1day': item['apy']['total']['1day'],
-        'apy_7day': item['apy']['total']['7day'],
-        'apy_30day': item['apy']['total']['30day'],
-        'vault_score': item['score']['vaultScore'],
-        'vault_tvl_score': item['score']['vaultTvlScore'],
-        'protocol_tvl_score': item['score']['protocolTvlScore'],
-        'holder_score': item['score']['holderScore'],
-        'network_score': item['score']['networkScore'],
-        'asset_score': item['score']['assetScore']
-    }
-    csv_data.append(row)
+# Stream the JSON dump (a top-level array of vaults) into the CSV
+json_path = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(__file__).parent / 'tmp.json'
+csv_path = Path(sys.argv[2]) if len(sys.argv) > 2 else Path(__file__).parent / 'vaults_data.csv'
+stats = convert_json_to_csv(str(json_path), str(csv_path), VAULT_COLUMNS)
 
-# Write to CSV
-csv_path = Path(__file__).parent / 'vaults_data.csv'
-with open(csv_path, 'w', newline='') as f:
-    writer = csv.DictWriter(f, fieldnames=headers)
-    writer.writeheader()
-    writer.writerows(csv_data)
-
-print(f"CSV file has been created at: {csv_path}") 
\ No newline at end of file
+print(f"CSV file has been created at: {csv_path} ({stats['rows']} rows in {stats['elapsed_s']:.2f}s)")
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: latency_tracker.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Rolling window of latency samples with percentiles, safe to record from worker threads
+"""
+################################################################################
+# built-in modules
+import threading
+from collections import deque
+from typing import Optional
+
+# third-party modules
+import numpy as np
+
+################################################################################
+class LatencyTracker:
+    '''
+    Rolling window of the last window latencies in seconds.
+    '''
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples)
+        if not samples:
+            return None
+        return float(np.percentile(np.asarray(samples, dtype=np.float64), q))
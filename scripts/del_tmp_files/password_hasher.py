@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: password_hasher.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Bounded off-loop executor for bcrypt hashing and verification with backpressure and metrics
+"""
+################################################################################
+# built-in modules
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# third-party modules
+from passlib.context import CryptContext
+
+# developed modules
+from latency_tracker import LatencyTracker
+
+################################################################################
+class HashingPoolSaturated(RuntimeError):
+    '''Raised when a hashing job waited queue_timeout seconds for a slot, answer with 429/503'''
+    pass
+
+class PasswordHasher:
+    '''
+    Runs bcrypt hash/verify on a small thread pool so the event loop never executes them.
+    The bcrypt backend releases the GIL while hashing, so the workers run in parallel with
+    the loop and with each other.
+
+    At most max_workers jobs run and at most max_pending jobs are admitted (running or
+    queued); a job that cannot be admitted within queue_timeout seconds raises
+    HashingPoolSaturated instead of growing the queue, so a login burst is shed at the door
+    rather than delaying everything behind it.
+    '''
+    def __init__(self, pwd_context: Optional[CryptContext] = None, max_workers: Optional[int] = None,
+                 max_pending: int = 64, queue_timeout: float = 2.0):
+        """
+        Args:
+            pwd_context (CryptContext): Hashing context, bcrypt by default
+            max_workers (int): Concurrent hashing jobs, defaults to the number of cores (at most 8)
+            max_pending (int): Jobs admitted at once, running plus queued
+            queue_timeout (float): Seconds a job may wait for admission before it is rejected
+        """
+        self.pwd_context = pwd_context or CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.max_workers = max_workers or min(8, os.cpu_count() or 1)
+        self.max_pending = max(max_pending, self.max_workers)
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hasher")
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # statistics, _running is updated from the worker threads under _running_lock
+        self._pending = 0
+        self._running = 0
+        self._running_lock = threading.Lock()
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._queue_wait = LatencyTracker(window=1000)
+        self._hash_time = LatencyTracker(window=1000)
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._slots_loop is not loop:
+            self._slots = asyncio.Semaphore(self.max_pending)
+            self._slots_loop = loop
+        return self._slots
+
+    def _timed(self, submitted: float, fn: Callable, *args) -> Any:
+        started = time.perf_counter()
+        self._queue_wait.record(started - submitted)
+        with self._running_lock:
+            self._running += 1
+        try:
+            return fn(*args)
+        finally:
+            with self._running_lock:
+                self._running -= 1
+            self._hash_time.record(time.perf_counter() - started)
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        slots = self._get_slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise HashingPoolSaturated(
+                f"Password hashing pool saturated ({self._pending} pending, {self.max_workers} workers)") from None
+        self._pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._timed, time.perf_counter(), fn, *args)
+            self._completed += 1
+            return result
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            self._pending -= 1
+            slots.release()
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """One bcrypt verification off the event loop; a malformed hash counts as a mismatch"""
+        try:
+            return await self._run(self.pwd_context.verify, plain_password, hashed_password)
+        except (ValueError, TypeError):
+            return False
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.pwd_context.hash, password)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and latency of the hashing pool"""
+        def ms(tracker: LatencyTracker, q: float) -> Optional[float]:
+            value = tracker.percentile(q)
+            return None if value is None else value * 1000
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "running": self._running,
+            "queue_depth": max(self._pending - self._running, 0),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "failed": self._failed,
+            "queue_wait_p50_ms": ms(self._queue_wait, 50),
+            "queue_wait_p99_ms": ms(self._queue_wait, 99),
+            "hash_time_p50_ms": ms(self._hash_time, 50),
+            "hash_time_p99_ms": ms(self._hash_time, 99),
+        }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+################################################################################
+# Process-wide hasher
+_shared_hasher: Optional[PasswordHasher] = None
+
+def configure_password_hasher(**kwargs) -> PasswordHasher:
+    """
+    Replace the shared hasher, call before the first login.
+
+    Args:
+        **kwargs: Keyword arguments of PasswordHasher
+    """
+    global _shared_hasher
+    if _shared_hasher is not None:
+        _shared_hasher.close()
+    _shared_hasher = PasswordHasher(**kwargs)
+    return _shared_hasher
+
+def get_password_hasher() -> PasswordHasher:
+    """Return the hasher shared by every AuthService of the process"""
+    global _shared_hasher
+    if _shared_hasher is None:
+        _shared_hasher = PasswordHasher()
+    return _shared_hasher
@@ -15,64 +15,90 @@ os.chdir(root_dir)
 sys.path.append(root_dir)
 
 # built-in modules
-from datetime import datetime, timedelta, timezone
+import asyncio
+from datetime import datetime, timedelta
 from typing import Union, Optional, Dict
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from pydantic import BaseModel
 
 # developed modules
 from app.core.config import Config
 from app.core.logging_setting import logger
+from password_hasher import PasswordHasher, get_password_hasher
+from token_cache import VerifiedTokenCache
+from user_store import UserStore, get_user_store
+
+################################################################################
+# User model
+class User(BaseModel):
+    id: int
+    username: str
+    email: str
+    password_hash: str
+    is_active: bool = True
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+# verified against when the username is unknown, so every login attempt costs exactly one
+# bcrypt verification and response times do not reveal which usernames exist
+_DUMMY_PASSWORD_HASH = "$2b$12$rrgKIg7ikwa0ZOrHiIi.qeXWUetMSEyGkL/99YC7obw79y49Nxvt."
 
 ################################################################################
 # Authentication service
 class AuthService:
     '''
-    Authentication service for the application
+    Authentication service for the application, use the shared instance of get_auth_service().
+    Construction does no hashing and no I/O: users are read from the database on first login.
     '''
-    def __init__(self, secret_key: str = Config['user_management_security']['SECRET_KEY'], 
-                 algorithm: str = Config['user_management_security']['ALGORITHM'], 
-                 access_token_expire_minutes: int = Config['user_management_security']['ACCESS_TOKEN_EXPIRE_MINUTES']):
-        self.secret_key = secret_key
-        self.algorithm = algorithm
-        self.access_token_expire_minutes = access_token_expire_minutes
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    
-        # TODO: replace with database connection 
-        self.fake_users_db = {
-            "johndoe": {
-                "id": 89134519234,
-                "username": "johndoe",
-                "email": "johndoe@example.com",
-                "password_hash": self.get_password_hash("1123123"),
-                "is_active": True,
-                "created_at": datetime.now(timezone.utc),
-                "updated_at": datetime.now(timezone.utc),
-            }
-        }
+    def __init__(self, secret_key: Optional[str] = None, algorithm: Optional[str] = None,
+                 access_token_expire_minutes: Optional[int] = None, password_hasher: Optional[PasswordHasher] = None,
+                 token_cache: Optional[VerifiedTokenCache] = None, user_store: Optional[UserStore] = None):
+        # settings are read here rather than in the signature, so importing the module reads no Config
+        settings = Config['user_management_security']
+        self.secret_key = secret_key or settings['SECRET_KEY']
+        self.algorithm = algorithm or settings['ALGORITHM']
+        self.access_token_expire_minutes = access_token_expire_minutes or settings['ACCESS_TOKEN_EXPIRE_MINUTES']
+        # bcrypt runs on the shared bounded pool, never on the event loop
+        self.password_hasher = password_hasher or get_password_hasher()
+        self.pwd_context = self.password_hasher.pwd_context
+        # verified payloads of the tokens presented, keyed by token digest
+        self.token_cache = token_cache or VerifiedTokenCache()
+        # user rows with read-through and negative caching
+        self.user_store = user_store or get_user_store()
 
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        if not self.pwd_context.verify(plain_password, hashed_password):
-            return False
-        elif self.pwd_context.verify(plain_password, hashed_password):
-            return True
+        return self.pwd_context.verify(plain_password, hashed_password)
 
     def get_password_hash(self, password: str) -> str:
         return self.pwd_context.hash(password)
 
-    def get_user(self, username: str) -> Optional[User]:
-        # TODO: replace with database connection 
-        user_dict = self.fake_users_db.get(username)
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """Single bcrypt verification on the hashing pool, raises HashingPoolSaturated under overload"""
+        return await self.password_hasher.verify(plain_password, hashed_password)
+
+    async def get_password_hash_async(self, password: str) -> str:
+        return await self.password_hasher.hash(password)
+
+    async def get_user(self, username: str) -> Optional[User]:
+        user_dict = await self.user_store.get_user(username)
         if user_dict:
             return User(**user_dict)
         return None
 
-    def authenticate_user(self, username: str, password: str) -> Optional[User]:
-        user = self.get_user(username)
-        if not user or not self.verify_password(password, user.password_hash):
+    async def authenticate_user(self, username: str, password: str) -> Optional[User]:
+        """
+        Exactly one bcrypt verification per attempt, off the event loop.
+        Raises HashingPoolSaturated when the hashing pool is saturated, answer it with 429/503.
+        """
+        user = await self.get_user(username)
+        verified = await self.verify_password_async(password, user.password_hash if user else _DUMMY_PASSWORD_HASH)
+        if not user or not verified:
             return None
         return user
 
+    # the coroutine's name before authenticate_user itself became one, kept for existing callers
+    authenticate_user_async = authenticate_user
+
     def create_access_token(self, data: Dict[str, str], expires_delta: Optional[timedelta] = None) -> str:
         to_encode = data.copy()
         expire = datetime.utcnow() + (expires_delta or timedelta(minutes=self.access_token_expire_minutes))
@@ -80,40 +106,80 @@ class AuthService:
         return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
 
     def decode_access_token(self, token: str) -> Optional[dict]:
+        key = self.token_cache.key(token)
+        payload = self.token_cache.get(key)
+        if payload is not None:
+            return payload
+        if self.token_cache.is_revoked(key):
+            return None
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
         except JWTError:
             return None
+        self.token_cache.put(key, payload)
+        return payload
+
+    def revoke_access_token(self, token: str) -> None:
+        """Logout: the token is rejected by decode_access_token from now on, cached or not"""
+        try:
+            expires_at = jwt.get_unverified_claims(token).get("exp")
+        except JWTError:
+            expires_at = None
+        self.token_cache.revoke(self.token_cache.key(token), expires_at if isinstance(expires_at, (int, float)) else None)
+
+################################################################################
+# Process-wide service
+_shared_auth_service: Optional[AuthService] = None
+
+def get_auth_service() -> AuthService:
+    """Return the AuthService shared by every request, created on first use"""
+    global _shared_auth_service
+    if _shared_auth_service is None:
+        _shared_auth_service = AuthService()
+    return _shared_auth_service
 
 ################################################################################
 # main
 if __name__ == "__main__":
-    auth_service = AuthService()
-
-    # TRUE CASE
-    # Authenticate user
-    user = auth_service.authenticate_user("johndoe", "1123123")
-    if user:
-        print(f"User {user.username} authenticated successfully.")
-        # Create access token
-        access_token = auth_service.create_access_token(data={"uid": user.id,
-                                                              "email": user.email,
-                                                              "is_active": user.is_active,
-                                                              })
-        print(f"Access token: {access_token}")
-    else:
-        print("Invalid username or password.")
-        
-    # Decode access token
-    decoded_token = auth_service.decode_access_token(access_token)
-    print(f"Decoded token: {decoded_token}")
-
-    # FALSE CASE
-    # Authenticate user
-    user = auth_service.authenticate_user("johndoe", "asdf")
-    if user:
-        print(f"User {user.username} authenticated successfully.")
-    else:
-        print("Invalid username or password.")
-    
\ No newline at end of file
+    async def main():
+        auth_service = get_auth_service()
+
+        # TRUE CASE
+        # Authenticate user
+        user = await auth_service.authenticate_user("johndoe", "1123123")
+        access_token = None
+        if user:
+            print(f"User {user.username} authenticated successfully.")
+            # Create access token
+            access_token = auth_service.create_access_token(data={"uid": user.id,
+                                                                  "email": user.email,
+                                                                  "is_active": user.is_active,
+                                                                  })
+            print(f"Access token: {access_token}")
+        else:
+            print("Invalid username or password.")
+
+        if access_token:
+            # Decode access token
+            decoded_token = auth_service.decode_access_token(access_token)
+            print(f"Decoded token: {decoded_token}")
+
+            # Revoke access token (logout)
+            auth_service.revoke_access_token(access_token)
+            print(f"Decoded token after logout: {auth_service.decode_access_token(access_token)}")
+
+        # FALSE CASE
+        # Authenticate user
+        user = await auth_service.authenticate_user("johndoe", "asdf")
+        if user:
+            print(f"User {user.username} authenticated successfully.")
+        else:
+            print("Invalid username or password.")
+
+        # Burst of logins verified on the hashing pool while the event loop stays free
+        users = await asyncio.gather(*[auth_service.authenticate_user("johndoe", "1123123") for _ in range(8)])
+        print(f"{sum(user is not None for user in users)}/{len(users)} concurrent logins succeeded.")
+        print(f"Hashing pool: {auth_service.password_hasher.stats()}")
+        print(f"User store: {auth_service.user_store.stats()}")
+
+    asyncio.run(main())
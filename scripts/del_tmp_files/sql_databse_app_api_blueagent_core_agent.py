@@ -15,8 +15,12 @@ os.chdir(root_dir)
 sys.path.append(root_dir)
 
 # built-in modules
-from typing import Dict, Any
-from sqlalchemy import select, and_
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from sqlalchemy import select, update, and_, bindparam, case, or_
 import json
 # developed modules
 from app.core.logging_setting import logger
@@ -41,18 +45,251 @@ Log Format:
 Level Here: DAO
 '''
 ################################################################################
+# columns left out of the protocol handed to agent dispatch
+PROTOCOL_EXCLUDED_FIELDS = {"created_time", "updated_time", "is_active", "last_interaction_time", "total_interactions"}
+
+class AgentProtocolCache:
+    '''
+    Protocols of active agents by agent id, shared by every DAO instance of the process.
+    Entries live ttl seconds at most (bounds staleness when another process edits the
+    registry) and are dropped as soon as this process updates or deactivates the agent.
+
+    A reader takes version(agent_id) before its query and passes it to put(); the protocol
+    is only cached if no invalidation happened in between, so a read racing an update
+    cannot put the old row back.
+    '''
+    def __init__(self, ttl: float = 300.0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._generation = 0
+        self._versions: Dict[int, int] = {}
+
+    def get(self, agent_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(agent_id)
+        if entry is None:
+            return None
+        expires_at, protocol = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[agent_id]
+            return None
+        self._entries.move_to_end(agent_id)
+        return dict(protocol)
+
+    def version(self, agent_id: int) -> Tuple[int, int]:
+        return self._generation, self._versions.get(agent_id, 0)
+
+    def put(self, agent_id: int, protocol: Dict[str, Any], version: Tuple[int, int]) -> None:
+        if version != self.version(agent_id):
+            return
+        self._entries[agent_id] = (time.monotonic() + self.ttl, dict(protocol))
+        self._entries.move_to_end(agent_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, agent_id: Optional[int] = None) -> None:
+        if agent_id is None:
+            self._entries.clear()
+            self._versions.clear()
+            self._generation += 1
+        else:
+            self._entries.pop(agent_id, None)
+            self._versions[agent_id] = self._versions.get(agent_id, 0) + 1
+
+agent_protocol_cache = AgentProtocolCache()
+
+class AgentInteractionBuffer:
+    '''
+    Write-behind aggregation of the interaction counters of ServiceAgentRegistry.
+
+    record() only adds to an in-memory (count, latest time) pair per agent; a background
+    task writes the pending pairs every flush_interval seconds (sooner once max_pending
+    agents are pending) as ONE executemany UPDATE:
+        total_interactions += count, last_interaction_time = max(current, latest)
+    so N interactions of K agents cost one statement per flush instead of N row updates.
+
+    Accuracy:
+    - every recorded interaction is written exactly once while the process keeps running:
+      a flush that fails, or is cancelled, before its transaction commits rolls back and its
+      counts are merged back for the next flush; close() lets an in-flight flush finish
+    - a crash loses at most the interactions recorded since the last flush
+    - when max_pending agents are pending and the database is unreachable, interactions of
+      further agents are counted in stats()["dropped"] instead of growing the buffer
+    - the counters are not part of the agent protocol, so flushes leave the protocol cache alone
+    '''
+    def __init__(self, db=None, flush_interval: float = 5.0, max_pending: int = 10000):
+        """
+        Args:
+            db: Database handle with session_scope(), defaults to the registry CRUD database
+            flush_interval (float): Seconds between flushes
+            max_pending (int): Agents with unwritten interactions before a flush is forced
+        """
+        self._db = db
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[int, List[Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+        self._statement = None
+
+        # statistics
+        self._recorded = 0
+        self._written = 0
+        self._dropped = 0
+        self._flushes = 0
+        self._failed_flushes = 0
+        self._last_flush_ms = 0.0
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = GeneralCRUD(model=ServiceAgentRegistry, db_name="blueprint_service").db
+        return self._db
+
+    def _start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def record(self, agent_id: int, at: Optional[datetime] = None) -> None:
+        """Count one interaction of an agent, call from the event loop"""
+        self._start()
+        at = at or datetime.now(timezone.utc)
+        self._recorded += 1
+        entry = self._pending.get(agent_id)
+        if entry is not None:
+            entry[0] += 1
+            if at > entry[1]:
+                entry[1] = at
+            return
+        if len(self._pending) >= self.max_pending:
+            # the forced flush is not keeping up (database down), keep memory bounded
+            self._dropped += 1
+            self._wake.set()
+            return
+        self._pending[agent_id] = [1, at]
+        if len(self._pending) >= self.max_pending:
+            self._wake.set()
+
+    def _update_statement(self):
+        if self._statement is None:
+            registry = ServiceAgentRegistry.__table__
+            latest = bindparam("latest")
+            self._statement = update(registry).where(registry.c.id == bindparam("agent_id")).values(
+                total_interactions=registry.c.total_interactions + bindparam("count"),
+                last_interaction_time=case(
+                    (or_(registry.c.last_interaction_time.is_(None), registry.c.last_interaction_time < latest), latest),
+                    else_=registry.c.last_interaction_time,
+                ),
+            )
+        return self._statement
+
+    async def flush(self) -> int:
+        """Write every pending counter now, returns the number of agents written"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            parameters = [{"agent_id": agent_id, "count": count, "latest": latest}
+                          for agent_id, (count, latest) in batch.items()]
+            start = time.perf_counter()
+            try:
+                async with self.db.session_scope() as session:
+                    await session.execute(self._update_statement(), parameters)
+            except BaseException as e:
+                # rolled back: merge the batch into what was recorded meanwhile
+                self._merge_back(batch)
+                self._failed_flushes += 1
+                if not isinstance(e, Exception):
+                    raise
+                logger.error(f"2️⃣ DAO[ ❌ ] agent interactions <<agents: {len(batch)}>> flushed failed with error: {str(e)}")
+                return 0
+            self._flushes += 1
+            self._written += sum(count for count, _ in batch.values())
+            self._last_flush_ms = (time.perf_counter() - start) * 1000
+            logger.debug(f"2️⃣ DAO[ ✅ ] agent interactions <<agents: {len(batch)}>> flushed successfully")
+            return len(batch)
+
+    def _merge_back(self, batch: Dict[int, List[Any]]) -> None:
+        for agent_id, (count, latest) in batch.items():
+            entry = self._pending.setdefault(agent_id, [0, latest])
+            entry[0] += count
+            if latest > entry[1]:
+                entry[1] = latest
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        """Stop the background task and write what is pending, call on application shutdown"""
+        if self._task is not None:
+            # wake the task and let it finish its flush instead of cancelling it mid-write
+            self._closing = True
+            self._wake.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._closing = False
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending_agents": len(self._pending),
+            "pending_interactions": sum(count for count, _ in self._pending.values()),
+            "recorded": self._recorded,
+            "written": self._written,
+            "dropped": self._dropped,
+            "flushes": self._flushes,
+            "failed_flushes": self._failed_flushes,
+            "last_flush_ms": self._last_flush_ms,
+        }
+
+agent_interaction_buffer = AgentInteractionBuffer()
+
+async def close_agent_interaction_buffer() -> None:
+    """Flush the pending interaction counters, call on application shutdown"""
+    await agent_interaction_buffer.close()
+
 class BlueAgentCoreAgentDAO:
-    def __init__(self):
+    '''
+    Registry reads and writes of the BlueAgent core agents.
+
+    Dispatch fetches the protocol of the agent it hands a request to with
+    get_agent_protocol(agent_id, interaction=True), which also counts the interaction in the
+    write-behind AgentInteractionBuffer; other code paths call record_interaction() directly.
+    '''
+    def __init__(self, protocol_cache: AgentProtocolCache = agent_protocol_cache,
+                 interaction_buffer: AgentInteractionBuffer = agent_interaction_buffer):
         self.crud = GeneralCRUD(model=ServiceAgentRegistry, db_name="blueprint_service")
-        
-    async def get_agent_protocol(self, agent_id: int) -> Dict[str, Any]:
-        # get the agent protocol from the database
+        self.protocol_cache = protocol_cache
+        self.interaction_buffer = interaction_buffer
+
+    @staticmethod
+    def _protocol(agent: ServiceAgentRegistry) -> Dict[str, Any]:
+        return agent.model_dump(exclude=PROTOCOL_EXCLUDED_FIELDS)
+
+    async def get_agent_protocol(self, agent_id: int, interaction: bool = False) -> Dict[str, Any]:
+        # get the agent protocol from the cache, or from the database in one query;
+        # interaction=True counts a dispatch to the agent once its protocol is found
+        protocol = self.protocol_cache.get(agent_id)
+        if protocol is not None:
+            if interaction:
+                self.record_interaction(agent_id)
+            return protocol
+        version = self.protocol_cache.version(agent_id)
         try:
-            # check existence of the agent
-            if not await self.crud._exists(agent_id, is_active_check=True):
-                logger.critical(f"2️⃣ DAO[ ❌ ] agent protocol <<agent id: {agent_id}>> fetched failed with error: not found in database")
-                return None
-            
             async with self.crud.db.session_scope() as session:
                 statement = select(ServiceAgentRegistry).where(
                     and_(
@@ -62,22 +299,94 @@ class BlueAgentCoreAgentDAO:
                 )
                 result = await session.execute(statement)
                 agent = result.scalar()
-            
+
+            # check existence of the agent
+            if agent is None:
+                logger.critical(f"2️⃣ DAO[ ❌ ] agent protocol <<agent id: {agent_id}>> fetched failed with error: not found in database")
+                return None
+
             # output json
-            result = agent.model_dump(exclude={"created_time", 
-                                                "updated_time", 
-                                                "is_active",
-                                                'last_interaction_time',
-                                                'total_interactions'})
+            result = self._protocol(agent)
+            self.protocol_cache.put(agent_id, result, version)
+            if interaction:
+                self.record_interaction(agent_id)
             logger.debug(f"2️⃣ DAO[ ✅ ] agent protocol <<agent id: {agent_id}>> fetched successfully")
             return result
         except Exception as e:
             logger.error(f"2️⃣ DAO[ ❌ ] agent protocol <<agent id: {agent_id}>> fetched failed with error: {str(e)}")
             return None
 
+    async def get_agent_protocols(self, agent_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        # get the protocols of several agents, the ones not cached with a single IN query
+        agent_ids = list(dict.fromkeys(agent_ids))
+        protocols = {}
+        missing = []
+        for agent_id in agent_ids:
+            protocol = self.protocol_cache.get(agent_id)
+            if protocol is None:
+                missing.append(agent_id)
+            else:
+                protocols[agent_id] = protocol
+        if not missing:
+            return protocols
+        versions = {agent_id: self.protocol_cache.version(agent_id) for agent_id in missing}
+        try:
+            async with self.crud.db.session_scope() as session:
+                statement = select(ServiceAgentRegistry).where(
+                    and_(
+                        ServiceAgentRegistry.id.in_(missing),
+                        ServiceAgentRegistry.is_active == True
+                    )
+                )
+                result = await session.execute(statement)
+                agents = result.scalars().all()
+
+            for agent in agents:
+                protocols[agent.id] = self._protocol(agent)
+                self.protocol_cache.put(agent.id, protocols[agent.id], versions[agent.id])
+            not_found = [agent_id for agent_id in missing if agent_id not in protocols]
+            if not_found:
+                logger.critical(f"2️⃣ DAO[ ❌ ] agent protocols <<agent ids: {not_found}>> fetched failed with error: not found in database")
+            logger.debug(f"2️⃣ DAO[ ✅ ] agent protocols <<agent ids: {missing}>> fetched successfully")
+            return protocols
+        except Exception as e:
+            logger.error(f"2️⃣ DAO[ ❌ ] agent protocols <<agent ids: {missing}>> fetched failed with error: {str(e)}")
+            return protocols
+
+    def record_interaction(self, agent_id: int, at: Optional[datetime] = None) -> None:
+        # count an interaction, written to last_interaction_time / total_interactions in the next batched flush
+        self.interaction_buffer.record(agent_id, at)
+
+    async def update_agent(self, agent_id: int, values: Dict[str, Any]) -> bool:
+        # update registry columns of an agent, its cached protocol is dropped
+        try:
+            async with self.crud.db.session_scope() as session:
+                statement = update(ServiceAgentRegistry).where(ServiceAgentRegistry.id == agent_id).values(**values)
+                result = await session.execute(statement)
+            self.protocol_cache.invalidate(agent_id)
+            if not result.rowcount:
+                logger.critical(f"2️⃣ DAO[ ❌ ] agent <<agent id: {agent_id}>> updated failed with error: not found in database")
+                return False
+            logger.debug(f"2️⃣ DAO[ ✅ ] agent <<agent id: {agent_id}>> <<fields: {list(values)}>> updated successfully")
+            return True
+        except Exception as e:
+            # the row may have changed before the failure surfaced
+            self.protocol_cache.invalidate(agent_id)
+            logger.error(f"2️⃣ DAO[ ❌ ] agent <<agent id: {agent_id}>> updated failed with error: {str(e)}")
+            return False
+
+    async def deactivate_agent(self, agent_id: int) -> bool:
+        # deactivate an agent, dispatch stops seeing it immediately
+        return await self.update_agent(agent_id, {"is_active": False})
+
 ################################################################################
 # main
 if __name__ == "__main__":
-    import asyncio
-    agent_dao = BlueAgentCoreAgentDAO()
-    print(asyncio.run(agent_dao.get_agent_protocol(1)))
\ No newline at end of file
+    async def test_main():
+        agent_dao = BlueAgentCoreAgentDAO()
+        print(await agent_dao.get_agent_protocol(1, interaction=True))
+        print(await agent_dao.get_agent_protocols([1, 2, 3]))
+        await close_agent_interaction_buffer()
+        print(agent_interaction_buffer.stats())
+
+    asyncio.run(test_main())
\ No newline at end of file
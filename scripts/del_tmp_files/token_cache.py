@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: token_cache.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Bounded cache of verified JWT payloads with expiry-aware eviction and a revocation set
+"""
+################################################################################
+# built-in modules
+import hashlib
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+################################################################################
+class VerifiedTokenCache:
+    '''
+    Payloads of bearer tokens whose signature and claims were already verified, keyed by a
+    digest of the token so raw tokens are never kept in memory.
+
+    - an entry is served only before the token's exp (entries of tokens without exp live at
+      most max_ttl seconds) and is dropped at its first access after that; an exp heap
+      evicts expired entries on every insert, and LRU order evicts beyond max_entries
+    - revoke() puts the digest in a revocation set until the token expires; the set is
+      checked on every hit and before every re-verification, so a logout is immediate
+    - the revocation set is per process, run one shared AuthService per worker
+    '''
+    def __init__(self, max_entries: int = 10000, max_ttl: float = 3600.0):
+        """
+        Args:
+            max_entries (int): Verified tokens kept, least recently used beyond it are evicted
+            max_ttl (float): Seconds a token without an exp claim stays cached
+        """
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, Tuple[Dict[str, Any], float]]" = OrderedDict()
+        self._expiry: List[Tuple[float, bytes]] = []
+        self._revoked: Dict[bytes, float] = {}
+        self._revoked_expiry: List[Tuple[float, bytes]] = []
+
+        # statistics
+        self._hits = 0
+        self._misses = 0
+        self._evicted_expired = 0
+        self._evicted_lru = 0
+        self._revoked_hits = 0
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=20).digest()
+
+    def _expires_at(self, payload: Dict[str, Any], now: float) -> float:
+        exp = payload.get("exp")
+        return float(exp) if isinstance(exp, (int, float)) else now + self.max_ttl
+
+    def _purge(self, now: float) -> None:
+        """Drop expired entries and revocations, caller holds the lock"""
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self._entries[key]
+                self._evicted_expired += 1
+        while self._revoked_expiry and self._revoked_expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._revoked_expiry)
+            if self._revoked.get(key) == expires_at:
+                del self._revoked[key]
+
+    def get(self, key: bytes) -> Optional[Dict[str, Any]]:
+        """Cached payload (a copy) of a verified, unexpired and unrevoked token, None otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if key in self._revoked:
+                del self._entries[key]
+                self._revoked_hits += 1
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self._evicted_expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return dict(payload)
+
+    def put(self, key: bytes, payload: Dict[str, Any]) -> None:
+        now = time.time()
+        expires_at = self._expires_at(payload, now)
+        if expires_at <= now:
+            return
+        with self._lock:
+            if key in self._revoked:
+                return
+            self._purge(now)
+            self._entries[key] = (dict(payload), expires_at)
+            self._entries.move_to_end(key)
+            heapq.heappush(self._expiry, (expires_at, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evicted_lru += 1
+            # stale heap items of LRU-evicted entries would otherwise pile up
+            if len(self._expiry) > 2 * self.max_entries:
+                self._expiry = [(entry[1], entry_key) for entry_key, entry in self._entries.items()]
+                heapq.heapify(self._expiry)
+
+    def is_revoked(self, key: bytes) -> bool:
+        with self._lock:
+            return key in self._revoked
+
+    def revoke(self, key: bytes, expires_at: Optional[float] = None) -> None:
+        """
+        Reject the token from now on. expires_at is the token's exp, after which the token is
+        invalid anyway and the revocation is forgotten; defaults to now + max_ttl.
+        """
+        now = time.time()
+        expires_at = float(expires_at) if expires_at is not None else now + self.max_ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._revoked[key] = expires_at
+            heapq.heappush(self._revoked_expiry, (expires_at, key))
+            self._purge(now)
+
+    def clear_entries(self) -> None:
+        """
+        Drop every cached payload, the next use of each token is verified again. Revocations
+        are kept: forgetting them would let logged-out tokens back in
+        """
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "revoked": len(self._revoked),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evicted_expired": self._evicted_expired,
+                "evicted_lru": self._evicted_lru,
+                "revoked_hits": self._revoked_hits,
+            }
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: user_store.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Database-backed user lookups with a read-through TTL cache and negative caching
+"""
+################################################################################
+# built-in modules
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# third-party modules
+from sqlalchemy import column, select, table
+
+# developed modules
+from app.core.logging_setting import logger
+from app.core.database import db_connection_pool
+
+################################################################################
+USER_COLUMNS = ('id', 'username', 'email', 'password_hash', 'is_active', 'created_at', 'updated_at')
+
+class UserStore:
+    '''
+    Reads user rows by username from the user table on the project's async database pool.
+
+    - hits are served from a read-through cache for ttl seconds, unknown usernames are cached
+      as missing for negative_ttl seconds, so repeated logins and probing for non-existent
+      users do not reach the database
+    - concurrent misses for one username share a single query
+    - database errors are logged and answered with None without being cached
+    - call invalidate(username) after changing a user's password, email or is_active
+
+    Nothing is queried, and no connection is taken, before the first lookup.
+    '''
+    def __init__(self, db=None, db_name: str = 'blueprint_service', table_name: str = 'users',
+                 ttl: float = 60.0, negative_ttl: float = 10.0, max_entries: int = 10000):
+        """
+        Args:
+            db: Database handle with session_scope(), defaults to db_connection_pool.get_db(db_name) on first use
+            db_name (str): Database of the user table
+            table_name (str): User table
+            ttl (float): Seconds a found user is cached
+            negative_ttl (float): Seconds an unknown username is cached as missing
+            max_entries (int): Usernames cached, least recently used beyond it are evicted
+        """
+        self._db = db
+        self.db_name = db_name
+        self.table = table(table_name, *[column(name) for name in USER_COLUMNS])
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        # statistics
+        self._hits = 0
+        self._negative_hits = 0
+        self._queries = 0
+        self._errors = 0
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = db_connection_pool.get_db(self.db_name)
+        return self._db
+
+    async def _fetch(self, username: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """(ok, row) from the database, ok is False when the query failed"""
+        self._queries += 1
+        try:
+            statement = select(*self.table.c).where(self.table.c.username == username).limit(1)
+            async with self.db.session_scope() as session:
+                row = (await session.execute(statement)).mappings().first()
+            logger.debug(f"2️⃣ DAO[ ✅ ] user <<username: {username}>> fetched successfully")
+            return True, dict(row) if row is not None else None
+        except Exception as e:
+            self._errors += 1
+            logger.error(f"2️⃣ DAO[ ❌ ] user <<username: {username}>> fetched failed with error: {str(e)}")
+            return False, None
+
+    def _store(self, username: str, row: Optional[Dict[str, Any]]) -> None:
+        ttl = self.ttl if row is not None else self.negative_ttl
+        self._cache[username] = (time.monotonic() + ttl, row)
+        self._cache.move_to_end(username)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """User row as a dict (a copy), None for an unknown username or a failed query"""
+        entry = self._cache.get(username)
+        if entry is not None:
+            expires_at, row = entry
+            if time.monotonic() < expires_at:
+                self._cache.move_to_end(username)
+                if row is None:
+                    self._negative_hits += 1
+                    return None
+                self._hits += 1
+                return dict(row)
+            del self._cache[username]
+
+        inflight = self._inflight.get(username)
+        if inflight is not None:
+            try:
+                row = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # the task running the query was cancelled, not this one
+                return await self.get_user(username)
+            return dict(row) if row is not None else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[username] = future
+        try:
+            ok, row = await self._fetch(username)
+            if ok:
+                self._store(username, row)
+            future.set_result(row)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(username, None)
+        return dict(row) if row is not None else None
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        """Forget one username, or every cached user"""
+        if username is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(username, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._cache),
+            "hits": self._hits,
+            "negative_hits": self._negative_hits,
+            "queries": self._queries,
+            "errors": self._errors,
+        }
+
+################################################################################
+# Process-wide store
+_shared_user_store: Optional[UserStore] = None
+
+def configure_user_store(**kwargs) -> UserStore:
+    """
+    Replace the shared store, call before the first login.
+
+    Args:
+        **kwargs: Keyword arguments of UserStore
+    """
+    global _shared_user_store
+    _shared_user_store = UserStore(**kwargs)
+    return _shared_user_store
+
+def get_user_store() -> UserStore:
+    global _shared_user_store
+    if _shared_user_store is None:
+        _shared_user_store = UserStore()
+    return _shared_user_store
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_analytics.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Cached typed-binary tables of exported vault CSVs with vectorized group-by, percentile and top-N queries
+"""
+################################################################################
+# built-in modules
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+# third-party modules
+import numpy as np
+
+# developed modules
+from vault_store import DictColumn
+
+################################################################################
+# Cache layout
+#   <csv dir>/.analytics_cache/<csv name>/meta.json     source mtime_ns, size, blake2b hash, column types
+#   <csv dir>/.analytics_cache/<csv name>/<column>.npy  float64 values (NaN for empty cells) of numeric
+#                                                       columns, int32 codes of string columns
+# A cache is reused while the CSV's mtime and size are unchanged; when only the mtime moved
+# the file is hashed and the cache is kept if the content is the same.
+CACHE_DIR_NAME = ".analytics_cache"
+CACHE_VERSION = 1
+
+def _file_hash(file_path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_meta(meta_path: str, meta: Dict[str, Any]) -> None:
+    """Replace meta.json atomically, a reader or a crash never sees a half-written file"""
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _parse_numeric(values: List[str]) -> Optional[np.ndarray]:
+    """float64 array of the column, empty cells as NaN; None if any cell is not a number"""
+    try:
+        return np.array([value if value else "nan" for value in values], dtype=np.float64)
+    except ValueError:
+        return None
+
+Filter = Union[str, float, Sequence[Any]]
+
+class VaultTable:
+    '''
+    Typed columns of an exported vault table: numeric columns as float64 arrays, string
+    columns (name, address, network, protocol, ...) as DictColumn codes.
+
+    Queries take optional where filters {column: value or list of values} applied as one
+    boolean mask, and return dicts of result columns (lists for string keys, arrays otherwise).
+    '''
+    def __init__(self, numeric: Dict[str, np.ndarray], strings: Dict[str, DictColumn], columns: List[str]):
+        self.numeric = numeric
+        self.strings = strings
+        self.columns = columns
+
+    def __len__(self) -> int:
+        if self.numeric:
+            return len(next(iter(self.numeric.values())))
+        return len(next(iter(self.strings.values()))) if self.strings else 0
+
+    ############################################################################
+    # load / cache
+    @classmethod
+    def from_csv(cls, csv_path: str) -> "VaultTable":
+        with open(csv_path, "r", newline="") as f:
+            reader = csv.reader(f)
+            columns = next(reader, [])
+            values = list(zip(*reader)) if columns else []
+        values = values or [()] * len(columns)
+        numeric, strings = {}, {}
+        for name, cells in zip(columns, values):
+            parsed = _parse_numeric(list(cells))
+            if parsed is None:
+                strings[name] = DictColumn.from_strings(cells)
+            else:
+                numeric[name] = parsed
+        return cls(numeric, strings, columns)
+
+    def save(self, cache_dir: str, source: Dict[str, Any]) -> None:
+        """Write the table to cache_dir, replacing an older cache only once the new one is complete"""
+        tmp_dir = f"{cache_dir}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, array in self.numeric.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        for name, column in self.strings.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), column.codes)
+        meta = {
+            "version": CACHE_VERSION, "source": source, "columns": self.columns,
+            "numeric": list(self.numeric), "categories": {name: column.categories for name, column in self.strings.items()},
+        }
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(tmp_dir, cache_dir)
+
+    @classmethod
+    def load(cls, cache_dir: str, meta: Dict[str, Any]) -> "VaultTable":
+        numeric = {name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r") for name in meta["numeric"]}
+        strings = {name: DictColumn(np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r"), categories)
+                   for name, categories in meta["categories"].items()}
+        return cls(numeric, strings, meta["columns"])
+
+    ############################################################################
+    # kernels
+    def mask(self, where: Optional[Dict[str, Filter]] = None) -> Optional[np.ndarray]:
+        """Boolean row mask of where, None when there is nothing to filter"""
+        if not where:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        for name, value in where.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            if name in self.strings:
+                column = self.strings[name]
+                codes = [column.code_of(item) for item in values]
+                mask &= np.isin(column.codes, [code for code in codes if code >= 0])
+            else:
+                mask &= np.isin(self.numeric[name], np.asarray(values, dtype=np.float64))
+        return mask
+
+    def _groups(self, by: Sequence[str], mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(selected row indices, group id per selected row, first selected row of each group)"""
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        if not by:
+            return rows, np.zeros(len(rows), dtype=np.int64), rows[:1]
+        # one int64 key per row from the codes of the group columns
+        key = np.zeros(len(rows), dtype=np.int64)
+        for name in by:
+            column = self.strings[name]
+            key = key * max(len(column.categories), 1) + column.codes[rows]
+        _, first, group = np.unique(key, return_index=True, return_inverse=True)
+        return rows, group.reshape(-1), rows[first]
+
+    @staticmethod
+    def _group_percentiles(values: np.ndarray, group: np.ndarray, groups: int, qs: Sequence[float]) -> np.ndarray:
+        """Linear-interpolated percentiles (0-100) of values per group, NaN values ignored; shape (groups, len(qs))"""
+        valid = ~np.isnan(values)
+        values, group = values[valid], group[valid]
+        order = np.lexsort((values, group))
+        values, group = values[order], group[order]
+        counts = np.bincount(group, minlength=groups)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        result = np.full((groups, len(qs)), np.nan)
+        has = counts > 0
+        for j, q in enumerate(qs):
+            position = starts[has] + (counts[has] - 1) * (q / 100.0)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, starts[has] + counts[has] - 1)
+            fraction = position - low
+            result[has, j] = values[low] * (1 - fraction) + values[high] * fraction
+        return result
+
+    def group_by(self, by: Sequence[str], aggregations: Dict[str, Tuple[str, ...]],
+                 where: Optional[Dict[str, Filter]] = None, sort: Optional[str] = None,
+                 descending: bool = True, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Aggregate numeric columns per combination of the string columns in by.
+
+        Args:
+            by: Group columns, [] for one group over all selected rows
+            aggregations: {output: (function, column[, weight column])} with function one of
+                count, sum, mean, min, max, median, p<N> (e.g. p90) and wmean (weighted by the
+                third element); NaN cells are left out of each aggregate
+            where: Row filters
+            sort: Output column to order the groups by, limit: keep the first limit groups
+
+        Example:
+            table.group_by(["protocol", "network"], {"tvl": ("sum", "tvl_usd"),
+                           "apy_7day": ("wmean", "apy_7day", "tvl_usd"), "vaults": ("count", "name")})
+        """
+        rows, group, first = self._groups(by, self.mask(where))
+        groups = len(first)
+        result: Dict[str, Any] = {name: [self.strings[name][i] for i in first] for name in by}
+        for output, (function, name, *weight) in aggregations.items():
+            if function == "count" and name not in self.numeric:
+                result[output] = np.bincount(group, minlength=groups)
+                continue
+            values = np.asarray(self.numeric[name])[rows]
+            valid = ~np.isnan(values)
+            counts = np.bincount(group, weights=valid, minlength=groups)
+            if function == "count":
+                result[output] = counts.astype(np.int64)
+            elif function in ("sum", "mean"):
+                sums = np.bincount(group[valid], weights=values[valid], minlength=groups)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result[output] = sums if function == "sum" else sums / counts
+            elif function == "wmean":
+                weights = np.asarray(self.numeric[weight[0]])[rows]
+                valid &= ~np.isnan(weights)
+                weighted = np.bincount(group[valid], weights=values[valid] * weights[valid], minlength=groups)
+                total = np.bincount(group[valid], weights=weights[valid], minlength=groups)
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result[output] = weighted / total
+            elif function in ("min", "max"):
+                fill = np.inf if function == "min" else -np.inf
+                reduced = np.full(groups, fill)
+                (np.minimum if function == "min" else np.maximum).at(reduced, group[valid], values[valid])
+                reduced[counts == 0] = np.nan
+                result[output] = reduced
+            elif function == "median" or (function.startswith("p") and function[1:].replace(".", "", 1).isdigit()):
+                q = 50.0 if function == "median" else float(function[1:])
+                result[output] = self._group_percentiles(values, group, groups, [q])[:, 0]
+            else:
+                raise ValueError(f"Unknown aggregation '{function}'")
+        if sort is not None:
+            key = np.asarray(result[sort], dtype=np.float64)
+            # NaN groups last in either direction
+            order = np.lexsort((-key if descending else key, np.isnan(key)))
+            if limit is not None:
+                order = order[:limit]
+            result = {name: [column[i] for i in order] if isinstance(column, list) else column[order]
+                      for name, column in result.items()}
+        elif limit is not None:
+            result = {name: column[:limit] for name, column in result.items()}
+        return result
+
+    def percentiles(self, column: str, qs: Sequence[float] = (5, 25, 50, 75, 95), by: Sequence[str] = (),
+                    where: Optional[Dict[str, Filter]] = None) -> Dict[str, Any]:
+        """Distribution of a numeric column (e.g. a score) as percentiles, overall or per group"""
+        rows, group, first = self._groups(by, self.mask(where))
+        values = np.asarray(self.numeric[column])[rows]
+        table = self._group_percentiles(values, group, len(first), qs)
+        result: Dict[str, Any] = {name: [self.strings[name][i] for i in first] for name in by}
+        result["count"] = np.bincount(group[~np.isnan(values)], minlength=len(first))
+        for j, q in enumerate(qs):
+            result[f"p{q:g}"] = table[:, j]
+        return result
+
+    def histogram(self, column: str, bins: Union[int, Sequence[float]] = 10,
+                  where: Optional[Dict[str, Filter]] = None) -> Dict[str, np.ndarray]:
+        """Counts of a numeric column per bin, {"edges", "counts"}"""
+        mask = self.mask(where)
+        values = np.asarray(self.numeric[column])
+        values = values if mask is None else values[mask]
+        counts, edges = np.histogram(values[~np.isnan(values)], bins=bins)
+        return {"edges": edges, "counts": counts}
+
+    def top_n(self, column: str, n: int = 10, by: Sequence[str] = (), where: Optional[Dict[str, Filter]] = None,
+              ascending: bool = False, columns: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """
+        Rows with the n highest (lowest with ascending) values of column, overall or per group;
+        rows with an empty cell are skipped. columns selects the output columns, default all.
+        """
+        rows, group, _ = self._groups(by, self.mask(where))
+        values = np.asarray(self.numeric[column])[rows]
+        valid = ~np.isnan(values)
+        rows, group, values = rows[valid], group[valid], values[valid]
+        key = values if ascending else -values
+        if not by:
+            if n < len(rows):
+                part = np.argpartition(key, n - 1)[:n]
+                selected = part[np.argsort(key[part], kind="stable")]
+            else:
+                selected = np.argsort(key, kind="stable")
+        else:
+            order = np.lexsort((key, group))
+            sorted_group = group[order]
+            starts = np.searchsorted(sorted_group, sorted_group, side="left")
+            selected = order[np.arange(len(order)) - starts < n]
+        picked = rows[selected]
+        result: Dict[str, Any] = {}
+        for name in columns or self.columns:
+            if name in self.strings:
+                result[name] = [self.strings[name][i] for i in picked]
+            else:
+                result[name] = np.asarray(self.numeric[name])[picked]
+        return result
+
+################################################################################
+# Table cache
+_tables: Dict[str, Tuple[Tuple[int, int], VaultTable]] = {}
+_tables_lock = threading.Lock()
+
+def open_table(csv_path: str, cache_root: Optional[str] = None) -> VaultTable:
+    """
+    Typed table of an exported vault CSV.
+
+    Reuses, in order: the table already opened by this process, the on-disk cache, and
+    otherwise parses the CSV once and writes the cache. Any cache whose source changed
+    (mtime/size, then content hash) is rebuilt.
+    """
+    csv_path = os.path.abspath(csv_path)
+    stat = os.stat(csv_path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _tables_lock:
+        cached = _tables.get(csv_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        cache_root = cache_root or os.path.join(os.path.dirname(csv_path), CACHE_DIR_NAME)
+        cache_dir = os.path.join(cache_root, os.path.basename(csv_path))
+        meta_path = os.path.join(cache_dir, "meta.json")
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("version") != CACHE_VERSION:
+                meta = None
+
+        table = None
+        if meta is not None:
+            source = meta["source"]
+            if (source["mtime_ns"], source["size"]) == signature:
+                table = VaultTable.load(cache_dir, meta)
+            elif source["size"] == stat.st_size and source["hash"] == _file_hash(csv_path):
+                # touched but not changed: keep the cache, remember the new mtime
+                source["mtime_ns"] = stat.st_mtime_ns
+                _write_meta(meta_path, meta)
+                table = VaultTable.load(cache_dir, meta)
+        if table is None:
+            table = VaultTable.from_csv(csv_path)
+            table.save(cache_dir, {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": _file_hash(csv_path)})
+            table = VaultTable.load(cache_dir, {"columns": table.columns, "numeric": list(table.numeric),
+                                                "categories": {name: column.categories
+                                                               for name, column in table.strings.items()}})
+        _tables[csv_path] = (signature, table)
+        return table
+
+################################################################################
+def _print_result(title: str, result: Dict[str, Any]) -> None:
+    print(f"\n{title}")
+    names = list(result)
+    print("\t".join(names))
+    for i in range(len(result[names[0]]) if names else 0):
+        cells = []
+        for name in names:
+            value = result[name][i]
+            cells.append(f"{value:.4g}" if isinstance(value, (float, np.floating)) else str(value))
+        print("\t".join(cells))
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Analytics over an exported vault CSV")
+    parser.add_argument("csv", nargs="?", default=os.path.join(os.path.dirname(__file__), "vaults_data.csv"))
+    parser.add_argument("--network", action="append", help="only these networks")
+    parser.add_argument("--protocol", action="append", help="only these protocols")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+    where = {name: values for name, values in (("network", args.network), ("protocol", args.protocol)) if values}
+
+    start = time.perf_counter()
+    table = open_table(args.csv)
+    opened = time.perf_counter()
+    by_protocol = table.group_by(
+        ["protocol", "network"],
+        {"vaults": ("count", "name"), "tvl_usd": ("sum", "tvl_usd"), "apy_1day": ("wmean", "apy_1day", "tvl_usd"),
+         "apy_7day": ("wmean", "apy_7day", "tvl_usd"), "apy_30day": ("wmean", "apy_30day", "tvl_usd")},
+        where=where, sort="tvl_usd", limit=args.top)
+    scores = table.percentiles("vault_score", by=["network"], where=where)
+    top = table.top_n("apy_7day", args.top, where=where,
+                      columns=["name", "network", "protocol", "tvl_usd", "apy_7day", "vault_score"])
+    queried = time.perf_counter()
+
+    _print_result("TVL-weighted APY by protocol and network", by_protocol)
+    _print_result("vault_score distribution by network", scores)
+    _print_result("top vaults by 7-day APY", top)
+    print(f"\n{len(table)} vaults, open {1000 * (opened - start):.1f} ms, queries {1000 * (queried - opened):.1f} ms")
+
+if __name__ == "__main__":
+    main()
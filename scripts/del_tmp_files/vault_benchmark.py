@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_benchmark.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Load benchmark of the vault sourcing path against a local get-vaults replay server
+
+Usage:
+    python vault_benchmark.py --vaults 10000 100000 --concurrency 1 8 32 --requests 200 \
+        --targets fetch_vaults get_vaults get_vaults_json calculate_score --output bench_results.json
+
+Every (target, vault count, concurrency) scenario reports throughput, p50/p95/p99 latency,
+peak RSS and the traced allocation peak / retained bytes per request. Latency and throughput
+only count requests whose networks all answered "ok", requests that timed out, failed or were
+served a stale snapshot are counted separately. Results are written as JSON so runs of two
+versions can be diffed.
+
+Every scenario starts from fresh resilience policies, ranking engines, indexes and delta
+syncs. Without --use-cache the snapshot cache TTL is 0, but its single-flight still coalesces
+concurrent requests for the same network into one upstream fetch, so at concurrency c the
+server sees fewer than c requests and throughput above c=1 includes that sharing.
+"""
+################################################################################
+# built-in modules
+import argparse
+import asyncio
+import copy
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+# third-party modules
+import numpy as np
+from aiohttp import web
+
+# developed modules
+import experiment
+from vault_http_pool import close_shared_pool
+from vault_resilience import configure_resilience
+from vault_snapshot_cache import configure_shared_snapshot_cache
+
+################################################################################
+# Replay server
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EVM_PAYLOAD = os.path.join(BASE_DIR, "tmp2.json")
+SUI_PAYLOAD = os.path.join(BASE_DIR, "tmp_sui_data.json")
+
+def scale_rows(rows: List[Dict[str, Any]], count: int, address_key: str, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Grow captured rows to count rows: row i is a copy of rows[i % len(rows)] with a unique
+    address and its APY / TVL jittered by +-20%, so sorting and scoring see realistic spreads.
+    """
+    rng = random.Random(seed)
+    scaled = []
+    for i in range(count):
+        row = copy.deepcopy(rows[i % len(rows)])
+        row[address_key] = f"0x{i:064x}"
+        factor = 0.8 + 0.4 * rng.random()
+        if "apy" in row:
+            for period in ("base", "total"):
+                for day in ("1day", "7day", "30day"):
+                    if row["apy"].get(period, {}).get(day) is not None:
+                        row["apy"][period][day] *= factor
+        if row.get("tvlUsd") is not None:
+            row["tvlUsd"] = str(float(row["tvlUsd"]) * factor)
+        if row.get("apr") is not None:
+            row["apr"] *= factor
+        scaled.append(row)
+    return scaled
+
+def _serve(port: int, vault_count: int, latency_ms: float, ready) -> None:
+    """Replay server process: POST /evm returns every row, /sui and /svm are paginated"""
+    with open(EVM_PAYLOAD, "r") as f:
+        evm_rows = scale_rows(json.load(f)["data"], vault_count, "address")
+    with open(SUI_PAYLOAD, "r") as f:
+        sui_rows = scale_rows(json.load(f)["data"], vault_count, "poolId")
+    svm_rows = [dict(row, chainId=None, network="") for row in evm_rows]
+    evm_body = json.dumps({"data": evm_rows}).encode()
+    delay = latency_ms / 1000
+
+    async def evm(request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+        return web.Response(body=evm_body, content_type="application/json")
+
+    def paged(rows: List[Dict[str, Any]]):
+        async def handler(request: web.Request) -> web.Response:
+            body = await request.json()
+            page, size = int(body.get("page", 1)), int(body.get("perPage", 100))
+            await asyncio.sleep(delay)
+            return web.json_response({"data": rows[(page - 1) * size:page * size], "total": len(rows)})
+        return handler
+
+    app = web.Application()
+    app.router.add_post("/evm", evm)
+    app.router.add_post("/sui", paged(sui_rows))
+    app.router.add_post("/svm", paged(svm_rows))
+    ready.set()
+    web.run_app(app, host="127.0.0.1", port=port, print=None, handle_signals=False)
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class ReplayServer:
+    '''
+    Local stand-in for the get-vaults endpoints, run in its own process so the server does
+    not compete with the system under test for the event loop.
+    '''
+    def __init__(self, vault_count: int, latency_ms: float = 0):
+        self.vault_count = vault_count
+        self.latency_ms = latency_ms
+        self.port = _free_port()
+        self._process: Optional[multiprocessing.Process] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def __enter__(self) -> "ReplayServer":
+        ready = multiprocessing.Event()
+        self._process = multiprocessing.Process(target=_serve, daemon=True,
+                                                args=(self.port, self.vault_count, self.latency_ms, ready))
+        self._process.start()
+        ready.wait()
+        # the socket is bound after ready, wait until it accepts connections
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        experiment.EVM_VAULTS_URL = f"{self.base_url}/evm"
+        experiment.SUI_VAULTS_URL = f"{self.base_url}/sui"
+        experiment.SOLANA_VAULTS_URL = f"{self.base_url}/svm"
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._process.terminate()
+        self._process.join()
+
+################################################################################
+# Measurements
+def _current_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # no procfs: fall back to the lifetime peak (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+class RssSampler:
+    '''Samples the process RSS every interval seconds in a thread, keeps the peak'''
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.peak = max(self.peak, _current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "RssSampler":
+        self.peak = _current_rss_bytes()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+
+def _latency_summary(latencies: List[float]) -> Dict[str, Optional[float]]:
+    if not latencies:
+        return dict.fromkeys(("p50_ms", "p95_ms", "p99_ms", "mean_ms", "max_ms"))
+    values = np.asarray(latencies, dtype=np.float64) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "max_ms": float(values.max()),
+    }
+
+################################################################################
+# Targets, each returns an async callable issuing one request and returning the
+# per-network statuses the request ended with
+def _new_system() -> experiment.VaultSourcingSystem:
+    # one system per request, so concurrent requests do not overwrite each other's last_network_status
+    return experiment.VaultSourcingSystem(conversation_id="benchmark", user_id="benchmark")
+
+def _make_target(name: str, networks: List[str]):
+    if name == "fetch_vaults":
+        async def fetch():
+            system = _new_system()
+            await system.fetch_vaults(networks)
+            return system.last_network_status
+        return fetch
+    if name in ("get_vaults", "get_vaults_json"):
+        get = getattr(experiment, name)
+
+        async def legacy():
+            system = _new_system()
+            await get(conversation_id="benchmark", user_id="benchmark", system=system)
+            return system.last_network_status
+        return legacy
+    if name == "calculate_score":
+        system = _new_system()
+        vaults: List = []
+
+        async def score_all():
+            # scoring is CPU bound, the snapshot is materialized once outside the timed path
+            statuses = {}
+            if not vaults:
+                vaults.extend(await system.fetch_vaults(networks))
+                statuses = system.last_network_status
+            for vault in vaults:
+                system._calculate_score(vault)
+            return statuses
+        return score_all
+    raise ValueError(f"Unknown benchmark target: {name}")
+
+def _outcome(statuses: Dict[str, Any]) -> str:
+    """ok, or the worst network status of a request: timeout, error, then stale"""
+    states = {status.status for status in statuses.values()}
+    if "timeout" in states:
+        return "timeout"
+    if states - {"ok", "stale"}:
+        return "error"
+    return "stale" if "stale" in states else "ok"
+
+async def _drive(request, total: int, concurrency: int) -> Tuple[List[float], Dict[str, int]]:
+    """Latencies of the ok requests and the number of requests per outcome"""
+    latencies: List[float] = []
+    outcomes = dict.fromkeys(("ok", "stale", "error", "timeout"), 0)
+    remaining = iter(range(total))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                outcome = _outcome(await request())
+            except Exception:
+                outcome = "error"
+            outcomes[outcome] += 1
+            if outcome == "ok":
+                latencies.append(time.perf_counter() - start)
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, outcomes
+
+async def _allocations(request, samples: int) -> Dict[str, float]:
+    """Traced allocation peak and retained bytes per request, measured one request at a time"""
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(samples):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await request()
+            after, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(after - before)
+    finally:
+        tracemalloc.stop()
+    return {"alloc_peak_bytes_per_request": float(np.mean(peaks)),
+            "alloc_retained_bytes_per_request": float(np.mean(retained))}
+
+async def run_scenario(target: str, vault_count: int, concurrency: int, requests: int, warmup: int,
+                       alloc_samples: int, networks: List[str], use_cache: bool) -> Dict[str, Any]:
+    # ttl 0 turns the shared cache into pure single-flight: nothing is served from an earlier
+    # fetch, but concurrent requests still share one in flight
+    configure_shared_snapshot_cache(**({} if use_cache else {"ttl": 0, "stale_ttl": 0}))
+    # no adaptive timeouts, open breakers or last good snapshots carried over from earlier scenarios
+    for network in experiment.DEFAULT_NETWORK_TIMEOUTS:
+        configure_resilience(network)
+    experiment.reset_snapshot_state()
+    request = _make_target(target, networks)
+    if target == "calculate_score":
+        concurrency = 1
+    try:
+        await _drive(request, warmup, concurrency)
+        with RssSampler() as rss:
+            start = time.perf_counter()
+            latencies, outcomes = await _drive(request, requests, concurrency)
+            wall = time.perf_counter() - start
+        allocations = await _allocations(request, alloc_samples) if alloc_samples else {}
+    finally:
+        await close_shared_pool()
+    return {
+        "target": target,
+        "vaults": vault_count,
+        "concurrency": concurrency,
+        "requests": requests,
+        "networks": networks,
+        "use_cache": use_cache,
+        "wall_s": wall,
+        **{f"{outcome}_requests": count for outcome, count in outcomes.items()},
+        "throughput_rps": outcomes["ok"] / wall if wall else 0.0,
+        **_latency_summary(latencies),
+        "peak_rss_bytes": rss.peak,
+        **allocations,
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BASE_DIR, text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _ms(value: Optional[float]) -> str:
+    return "     n/a   " if value is None else f"{value:8.1f} ms"
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Any]:
+    results = []
+    for vault_count in args.vaults:
+        with ReplayServer(vault_count, latency_ms=args.server_latency_ms):
+            for target in args.targets:
+                for concurrency in args.concurrency:
+                    result = asyncio.run(run_scenario(target, vault_count, concurrency, args.requests, args.warmup,
+                                                      args.alloc_samples, args.networks, args.use_cache))
+                    results.append(result)
+                    print(f"{target:>16} vaults={vault_count:<7} c={result['concurrency']:<4} "
+                          f"{result['throughput_rps']:8.1f} req/s  p50={_ms(result['p50_ms'])}  "
+                          f"p95={_ms(result['p95_ms'])}  p99={_ms(result['p99_ms'])}  "
+                          f"rss={result['peak_rss_bytes'] / 2**20:7.1f} MiB  "
+                          f"stale={result['stale_requests']} errors={result['error_requests']} "
+                          f"timeouts={result['timeout_requests']}")
+                    if target == "calculate_score":
+                        break
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "results": results,
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the vault sourcing path against a local replay server")
+    parser.add_argument("--vaults", type=int, nargs="+", default=[10_000, 100_000], help="Vault counts to replay")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Concurrent requests")
+    parser.add_argument("--requests", type=int, default=100, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed requests per scenario")
+    parser.add_argument("--alloc-samples", type=int, default=3, help="Requests traced with tracemalloc, 0 to skip")
+    parser.add_argument("--targets", nargs="+", default=["fetch_vaults", "get_vaults", "calculate_score"],
+                        choices=["fetch_vaults", "get_vaults", "get_vaults_json", "calculate_score"])
+    parser.add_argument("--networks", nargs="+", default=["EVM"], help="Networks fetched by fetch_vaults")
+    parser.add_argument("--use-cache", action="store_true", help="Keep the snapshot cache TTL instead of disabling it")
+    parser.add_argument("--server-latency-ms", type=float, default=0, help="Latency added by the replay server")
+    parser.add_argument("--output", default="vault_benchmark_results.json", help="JSON result file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = run_benchmarks(arguments)
+    with open(arguments.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {arguments.output}")
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_csv_converter.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Streaming JSON-array to CSV converter with declarative column mappings and multi-process sharding
+"""
+################################################################################
+# built-in modules
+import argparse
+import codecs
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+################################################################################
+# Column mapping
+# A mapping is {column: spec}, columns are written in mapping order. spec is either a dotted
+# path into the record ("apy.total.7day", list elements by index: "assetTypes.0") or a dict
+#   {"path": ..., "join": "|", "default": ...}
+# join concatenates list values, default replaces a missing or null value. Without a default
+# missing fields and nulls are written as null_value; other lists / objects as JSON.
+ColumnSpec = Union[str, Dict[str, Any]]
+
+_Column = Tuple[str, Tuple[str, ...], Optional[str], Any]
+
+def compile_mapping(mapping: Dict[str, ColumnSpec]) -> List[_Column]:
+    """(column, path keys, join separator, default) per column"""
+    columns = []
+    for column, spec in mapping.items():
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        if "path" not in spec:
+            raise ValueError(f"Column '{column}' has no path")
+        columns.append((column, tuple(spec["path"].split(".")), spec.get("join"), spec.get("default")))
+    return columns
+
+def _lookup(record: Any, keys: Tuple[str, ...]) -> Any:
+    value = record
+    for key in keys:
+        if isinstance(value, dict):
+            value = value.get(key)
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            return None
+        if value is None:
+            return None
+    return value
+
+def record_to_row(record: Dict[str, Any], columns: List[_Column], null_value: str = "") -> List[Any]:
+    """CSV row of one record"""
+    row = []
+    for _, keys, join, default in columns:
+        # plain nested dict access first, _lookup for list indexes and nulls along the path
+        try:
+            value = record
+            for key in keys:
+                value = value[key]
+        except KeyError:
+            value = None
+        except (TypeError, IndexError):
+            value = _lookup(record, keys)
+        if value is None:
+            value = null_value if default is None else default
+        elif value.__class__ is list or value.__class__ is dict:
+            if join is not None and value.__class__ is list:
+                value = join.join("" if item is None else str(item) for item in value)
+            else:
+                value = json.dumps(value)
+        row.append(value)
+    return row
+
+################################################################################
+# Incremental array reader
+_WHITESPACE = " \t\n\r"
+_SEPARATORS = _WHITESPACE + ","
+
+def element_start_pattern(first_key: Optional[str] = None) -> "re.Pattern[bytes]":
+    """
+    Candidate element starts when resyncing a shard: an object after "[" or ",", and when
+    first_key is given, one whose first member is first_key (the first key of the first record),
+    which rules out most nested objects
+    """
+    pattern = rb"[\[,][ \t\n\r]*\{"
+    if first_key is not None:
+        pattern += rb"(?=[ \t\n\r]*" + re.escape(json.dumps(first_key).encode()) + rb"[ \t\n\r]*:)"
+    return re.compile(pattern)
+
+class JsonArrayReader:
+    '''
+    Yields the elements of a JSON array from a file, starting at the byte offset of an element
+    (or of the whitespace/commas before it), reading block_size bytes at a time. Only the
+    unfinished element is buffered, so memory is bounded by the largest element.
+
+    Elements starting at or after the byte offset stop are left to the next shard; stop_offset
+    is then the offset of the first of them, or None once the closing "]" was read.
+    '''
+    def __init__(self, file_path: str, start: int, stop: Optional[int] = None, block_size: int = 1 << 20):
+        self.file_path = file_path
+        self.start = start
+        self.stop = stop
+        self.block_size = block_size
+        self.stop_offset: Optional[int] = None
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        with open(self.file_path, "rb") as f:
+            f.seek(self.start)
+            buffer, pos, eof = "", 0, False
+            # base: byte offset of buffer[0]; buffer[:mark] is mark_bytes long in utf-8
+            base, mark, mark_bytes, is_ascii = self.start, 0, 0, True
+            while True:
+                while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+                    pos += 1
+                if pos < len(buffer):
+                    if buffer[pos] == "]":
+                        self.stop_offset = None
+                        return
+                    if self.stop is not None:
+                        if is_ascii:
+                            offset = base + pos
+                        else:
+                            mark_bytes += len(buffer[mark:pos].encode())
+                            mark = pos
+                            offset = base + mark_bytes
+                        if offset >= self.stop:
+                            self.stop_offset = offset
+                            return
+                    try:
+                        value, end = decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                        end = -1
+                    if end != -1:
+                        # an element is followed by "," or "]", anything else means the start was not an element
+                        after = end
+                        while after < len(buffer) and buffer[after] in _WHITESPACE:
+                            after += 1
+                        if after < len(buffer):
+                            if buffer[after] not in ",]":
+                                raise ValueError(f"{self.file_path}: unexpected data after an array element")
+                            pos = end
+                            yield value
+                            continue
+                if eof:
+                    raise ValueError(f"{self.file_path} ended inside the JSON array")
+                # the element is unfinished: drop the consumed prefix and read the next block
+                base += pos if is_ascii else mark_bytes + len(buffer[mark:pos].encode())
+                chunk = f.read(self.block_size)
+                eof = not chunk
+                buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+                pos, mark, mark_bytes, is_ascii = 0, 0, 0, buffer.isascii()
+
+def locate_array(file_path: str, array_key: Optional[str] = None, block_size: int = 1 << 16) -> int:
+    """
+    Byte offset just after the "[" of the records array: the top-level array, or the array
+    under array_key of a top-level object ({"data": [...], ...}).
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, eof = "", 0, False
+    state, key = "start", None
+    with open(file_path, "rb") as f:
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f"{file_path} has no '{array_key or '['}' records array")
+                chunk = f.read(block_size)
+                eof = not chunk
+                buffer += utf8.decode(chunk, final=eof)
+                continue
+            char = buffer[pos]
+            if state == "start":
+                if char == "[" and array_key is None:
+                    return len(buffer[:pos + 1].encode())
+                if char != "{" or array_key is None:
+                    raise ValueError(f"{file_path} does not start with a records array")
+                pos, state = pos + 1, "key"
+            elif state in ("key", "value"):
+                if char == "," and state == "key":
+                    pos += 1
+                    continue
+                if char == "}":
+                    raise ValueError(f"{file_path} has no '{array_key}' array")
+                if state == "value" and key == array_key:
+                    if char != "[":
+                        raise ValueError(f"'{array_key}' in {file_path} is not an array")
+                    return len(buffer[:pos + 1].encode())
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    chunk = f.read(block_size)
+                    eof = not chunk
+                    buffer += utf8.decode(chunk, final=eof)
+                    continue
+                if state == "key":
+                    key, state = value, "colon"
+                else:
+                    state = "key"
+                pos = end
+            elif state == "colon":
+                if char != ":":
+                    raise ValueError(f"{file_path}: expected ':' after key '{key}'")
+                pos, state = pos + 1, "value"
+
+################################################################################
+# Conversion
+def _write_rows(records, writer, columns: List[_Column], null_value: str) -> int:
+    rows = 0
+    for record in records:
+        writer.writerow(record_to_row(record, columns, null_value))
+        rows += 1
+    return rows
+
+def _first_element(file_path: str, start: int, pattern: "re.Pattern[bytes]", block_size: int = 1 << 20) -> Optional[int]:
+    """Byte offset of the first candidate element start at or after start, None if there is none"""
+    with open(file_path, "rb") as f:
+        f.seek(max(start - 1, 0))
+        offset = f.tell()
+        tail = b""
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                return None
+            data = tail + chunk
+            match = pattern.search(data)
+            if match:
+                return offset - len(tail) + match.end() - 1
+            # keep enough to match a candidate start across the block border
+            tail = data[-256:]
+            offset += len(chunk)
+
+def _convert_shard(file_path: str, part_path: str, start: int, stop: Optional[int], columns: List[_Column],
+                   null_value: str, first_key: Optional[str] = None, resync: bool = False) -> Dict[str, Any]:
+    """
+    Convert the elements starting in [start, stop) to a headerless CSV part. With resync, start
+    is an arbitrary offset and the shard begins at the first candidate element after it.
+    """
+    if resync:
+        start = _first_element(file_path, start, element_start_pattern(first_key))
+        if start is None:
+            return {"start": None, "stop_offset": None, "rows": 0, "ok": True}
+    reader = JsonArrayReader(file_path, start, stop)
+    try:
+        with open(part_path, "w", newline="") as f:
+            rows = _write_rows(reader, csv.writer(f), columns, null_value)
+    except ValueError as e:
+        # a false candidate start, the parent converts this shard again from the right offset
+        return {"start": start, "stop_offset": None, "rows": 0, "ok": False, "error": str(e)}
+    return {"start": start, "stop_offset": reader.stop_offset, "rows": rows, "ok": True}
+
+def convert_json_to_csv(input_path: str, output_path: str, mapping: Dict[str, ColumnSpec],
+                        array_key: Optional[str] = None, null_value: str = "", workers: Optional[int] = None,
+                        min_shard_bytes: int = 64 << 20) -> Dict[str, Any]:
+    """
+    Stream the records array of input_path into output_path with one CSV column per mapping entry.
+
+    Files larger than min_shard_bytes are split into up to workers byte ranges converted in
+    parallel; each worker starts at the first element of its range and stops before the first
+    element of the next one. A shard whose start does not match where the previous shard
+    stopped (a "{" inside a nested array or a string looked like an element) is converted
+    again from the right offset, so sharding never drops or duplicates a record. The parts
+    are concatenated into output_path behind the header, and the output replaces
+    output_path only once it is complete.
+
+    Returns:
+        {"rows", "shards", "reconverted", "elapsed_s"}
+    """
+    start_time = time.perf_counter()
+    columns = compile_mapping(mapping)
+    first = locate_array(input_path, array_key)
+    size = os.path.getsize(input_path)
+    workers = workers or os.cpu_count() or 1
+    shards = max(1, min(workers, (size - first) // max(min_shard_bytes, 1)))
+    if shards > 1:
+        first_record = next(iter(JsonArrayReader(input_path, first)), None)
+        first_key = next(iter(first_record), None) if isinstance(first_record, dict) else None
+        if first_record is None:
+            shards = 1
+    tmp_path = f"{output_path}.tmp"
+    reconverted = 0
+    rows = 0
+    with open(tmp_path, "w", newline="") as out:
+        csv.writer(out).writerow([column for column, _, _, _ in columns])
+        if shards == 1:
+            rows = _write_rows(JsonArrayReader(input_path, first), csv.writer(out), columns, null_value)
+        else:
+            bounds = [first + (size - first) * i // shards for i in range(shards)] + [None]
+            with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_path))) as part_dir:
+                parts = [os.path.join(part_dir, f"part-{i}.csv") for i in range(shards)]
+                with ProcessPoolExecutor(max_workers=shards) as executor:
+                    futures = [executor.submit(_convert_shard, input_path, parts[i], bounds[i], bounds[i + 1],
+                                               columns, null_value, first_key, i > 0)
+                               for i in range(shards)]
+                    results = [future.result() for future in futures]
+                expected = first
+                for i, result in enumerate(results):
+                    if expected is None:
+                        # the array closed in an earlier shard
+                        break
+                    if not result["ok"] or result["start"] != expected:
+                        result = _convert_shard(input_path, parts[i], expected, bounds[i + 1], columns, null_value)
+                        reconverted += 1
+                        if not result["ok"]:
+                            raise ValueError(f"{input_path}: {result['error']}")
+                    rows += result["rows"]
+                    expected = result["stop_offset"]
+                    with open(parts[i], "r", newline="") as part:
+                        shutil.copyfileobj(part, out)
+    os.replace(tmp_path, output_path)
+    return {"rows": rows, "shards": shards, "reconverted": reconverted,
+            "elapsed_s": time.perf_counter() - start_time}
+
+################################################################################
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Convert a JSON records array to CSV")
+    parser.add_argument("input")
+    parser.add_argument("output")
+    parser.add_argument("--mapping", required=True, help="JSON file of {column: path or {path, join, default}}")
+    parser.add_argument("--array-key", default=None, help="key of the records array in a top-level object")
+    parser.add_argument("--null", default="", help="value written for missing fields and nulls")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--min-shard-mb", type=int, default=64)
+    args = parser.parse_args(argv)
+    with open(args.mapping, "r") as f:
+        mapping = json.load(f)
+    stats = convert_json_to_csv(args.input, args.output, mapping, array_key=args.array_key, null_value=args.null,
+                                workers=args.workers, min_shard_bytes=args.min_shard_mb << 20)
+    print(f"{stats['rows']} rows written to {args.output} in {stats['elapsed_s']:.2f}s "
+          f"({stats['shards']} shards, {stats['reconverted']} reconverted)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_delta_sync.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Incremental delta sync of vault snapshots keyed by (chainId, address)
+"""
+################################################################################
+# built-in modules
+import asyncio
+import time
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+
+# third-party modules
+import numpy as np
+from pydantic import BaseModel
+
+# developed modules
+from vault_index import VaultIndex
+from vault_store import DictColumn, StringColumn, VaultColumnStore
+
+################################################################################
+class VaultDelta(BaseModel):
+    network: str
+    added: List[Tuple[int, str]] = []
+    removed: List[Tuple[int, str]] = []
+    changed: List[Tuple[int, str]] = []
+    changed_columns: List[str] = []
+    rebuilt: bool = False  # True when rows were added/removed and the indexes were rebuilt
+    elapsed_ms: float = 0
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+def _store_keys(store: VaultColumnStore) -> List[Tuple[int, str]]:
+    addresses = store.columns["address"]
+    return [(chain_id, addresses[i]) for i, chain_id in enumerate(store.columns["chain_id"].tolist())]
+
+def _gather_segments(values: np.ndarray, offsets: np.ndarray, rows: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenate values[offsets[r]:offsets[r + 1]] for every r in rows, without a Python loop"""
+    total = int(lengths.sum())
+    if not total:
+        return values[:0]
+    ends = np.cumsum(lengths)
+    positions = np.arange(total, dtype=np.int64) + np.repeat(offsets[rows] - (ends - lengths), lengths)
+    return values[positions]
+
+def _segments_differ(old_values: np.ndarray, old_offsets: np.ndarray, old_rows: np.ndarray,
+                     new_values: np.ndarray, new_offsets: np.ndarray, new_rows: np.ndarray) -> np.ndarray:
+    """Per matched row, whether the variable-length segments (string bytes, tag codes) differ"""
+    if (len(old_rows) == len(old_offsets) - 1 == len(new_offsets) - 1 and np.array_equal(old_rows, new_rows)
+            and np.array_equal(old_rows, np.arange(len(old_rows))) and np.array_equal(old_offsets, new_offsets)):
+        # same rows in the same order with the same lengths: compare the buffers in one pass
+        differ = np.zeros(len(old_rows), dtype=np.bool_)
+        positions = np.flatnonzero(old_values != new_values)
+        differ[np.searchsorted(old_offsets, positions, side="right") - 1] = True
+        return differ
+    old_lengths = np.diff(old_offsets)[old_rows]
+    new_lengths = np.diff(new_offsets)[new_rows]
+    differ = old_lengths != new_lengths
+    same = np.flatnonzero(~differ & (old_lengths > 0))
+    if len(same):
+        lengths = old_lengths[same]
+        unequal = (_gather_segments(old_values, old_offsets, old_rows[same], lengths)
+                   != _gather_segments(new_values, new_offsets, new_rows[same], lengths))
+        starts = np.cumsum(lengths) - lengths
+        differ[same] = np.logical_or.reduceat(unequal, starts)
+    return differ
+
+def _changed_mask(old_column, new_column, old_rows: np.ndarray, new_rows: np.ndarray) -> np.ndarray:
+    """Per matched row, whether the column value differs between the two snapshots"""
+    if isinstance(old_column, np.ndarray):
+        return old_column[old_rows] != new_column[new_rows]
+    if isinstance(old_column, DictColumn):
+        old_values = np.asarray(old_column.categories, dtype=object)[old_column.codes[old_rows]]
+        new_values = np.asarray(new_column.categories, dtype=object)[new_column.codes[new_rows]]
+        return old_values != new_values
+    if isinstance(old_column, StringColumn):
+        return _segments_differ(np.frombuffer(old_column.buffer, dtype=np.uint8), old_column.offsets, old_rows,
+                                np.frombuffer(new_column.buffer, dtype=np.uint8), new_column.offsets, new_rows)
+    # ListDictColumn: map both code spaces onto one before comparing
+    lookup = {value: code for code, value in enumerate(old_column.categories)}
+    remap = np.array([lookup.setdefault(value, len(lookup)) for value in new_column.categories], dtype=np.int32)
+    new_codes = remap[new_column.codes] if len(remap) else new_column.codes
+    return _segments_differ(old_column.codes, old_column.offsets, old_rows, new_codes, new_column.offsets, new_rows)
+
+################################################################################
+# Delta sync
+class VaultDeltaSync:
+    '''
+    Keeps a live copy of one network's vault universe with a stable row order.
+
+    Every new snapshot is diffed against it by (chainId, address). When only values of
+    existing vaults changed, the changed cells are patched into the live columns and the
+    sorted indexes are patched for those rows only, so the ranking engine (which reads the
+    live columns) and the query indexes follow the churn instead of the universe size.
+    Added or removed vaults rebuild the live store and its indexes.
+    '''
+    def __init__(self, network: str, queue_size: int = 100):
+        self.network = network
+        self.queue_size = queue_size
+        self.store: Optional[VaultColumnStore] = None
+        self.index: Optional[VaultIndex] = None
+        self._keys: List[Tuple[int, str]] = []
+        self._row_of: Dict[Tuple[int, str], int] = {}
+        self._last_snapshot = None
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def apply(self, snapshot: VaultColumnStore) -> VaultDelta:
+        """Diff snapshot against the live store, update it and notify subscribers"""
+        if snapshot is self._last_snapshot:
+            return VaultDelta(network=self.network)
+        start = time.perf_counter()
+        self._last_snapshot = snapshot
+        new_keys = _store_keys(snapshot)
+
+        if self.store is None:
+            self._replace(snapshot, new_keys)
+            delta = VaultDelta(network=self.network, added=new_keys, rebuilt=True)
+            return self._publish(delta, start)
+
+        new_row_of = {key: row for row, key in enumerate(new_keys)}
+        removed = [key for key in self._keys if key not in new_row_of]
+        added = [key for key in new_keys if key not in self._row_of]
+        common = [key for key in self._keys if key in new_row_of]
+        old_rows = np.fromiter((self._row_of[key] for key in common), dtype=np.int64, count=len(common))
+        new_rows = np.fromiter((new_row_of[key] for key in common), dtype=np.int64, count=len(common))
+
+        changed_any = np.zeros(len(common), dtype=np.bool_)
+        changed_columns = {}
+        for name, column in self.store.columns.items():
+            mask = _changed_mask(column, snapshot.columns[name], old_rows, new_rows)
+            if mask.any():
+                changed_columns[name] = mask
+                changed_any |= mask
+        changed = [common[i] for i in np.flatnonzero(changed_any)]
+
+        if added or removed:
+            # keep the surviving rows in their live order, append the new vaults
+            order = np.concatenate([new_rows, np.array([new_row_of[key] for key in added], dtype=np.int64)])
+            self._replace(snapshot.take(order), [new_keys[row] for row in order.tolist()])
+            delta = VaultDelta(network=self.network, added=added, removed=removed, changed=changed,
+                               changed_columns=sorted(changed_columns), rebuilt=True)
+            return self._publish(delta, start)
+
+        if changed:
+            columns = dict(self.store.columns)
+            for name, mask in changed_columns.items():
+                live_rows, snapshot_rows = old_rows[mask], new_rows[mask]
+                if isinstance(columns[name], np.ndarray):
+                    patched = columns[name].copy()
+                    patched[live_rows] = snapshot.columns[name][snapshot_rows]
+                    columns[name] = patched
+                else:
+                    # rare: text/category edits, re-take the column in live order
+                    columns[name] = snapshot.columns[name].take(new_rows)
+            store = VaultColumnStore(columns)
+            changed_rows = old_rows[changed_any]
+            self.index = self.index.with_changes(store, changed_rows, changed_columns)
+            self.store = store
+        delta = VaultDelta(network=self.network, changed=changed, changed_columns=sorted(changed_columns))
+        return self._publish(delta, start)
+
+    def _replace(self, store: VaultColumnStore, keys: List[Tuple[int, str]]) -> None:
+        self.store = store
+        self.index = VaultIndex(store)
+        self._keys = keys
+        self._row_of = {key: row for row, key in enumerate(keys)}
+
+    def _publish(self, delta: VaultDelta, start: float) -> VaultDelta:
+        delta.elapsed_ms = (time.perf_counter() - start) * 1000
+        if delta.is_empty:
+            return delta
+        for queue in self._subscribers:
+            if queue.full():
+                # slow subscriber: drop its oldest event rather than block the refresh
+                queue.get_nowait()
+            queue.put_nowait(delta)
+        return delta
+
+    async def subscribe(self) -> AsyncIterator[VaultDelta]:
+        """
+        Async stream of change events.
+
+        Usage:
+            async for delta in sync.subscribe():
+                ...
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.discard(queue)
+
+################################################################################
+# Process-wide delta syncs, one per network
+_delta_syncs: Dict[str, VaultDeltaSync] = {}
+
+def get_delta_sync(network: str) -> VaultDeltaSync:
+    sync = _delta_syncs.get(network)
+    if sync is None:
+        sync = _delta_syncs[network] = VaultDeltaSync(network)
+    return sync
+
+def reset_delta_syncs() -> None:
+    """Forget every network's live copy, subscribers of the old syncs stop receiving deltas"""
+    _delta_syncs.clear()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_history_store.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Append-only memory-mapped APY/TVL/score history of vault snapshots for ranking backtests
+"""
+################################################################################
+# built-in modules
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# third-party modules
+import numpy as np
+
+# developed modules
+from vault_store import VaultColumnStore
+
+################################################################################
+# Layout
+#   <root>/snapshots.i64            one int64 timestamp per snapshot, the snapshot seq is its position
+#   <root>/vault_keys.tsv           "chainId<TAB>address" per line, the vault id is the line number
+#   <root>/segments/<YYYYMM>/key.u64    (seq << 32) | vault_id, sorted, one per row
+#   <root>/segments/<YYYYMM>/<field>.f64
+# Rows of a snapshot are written sorted by vault id, so key.u64 is sorted over the whole segment
+# and any (vault, snapshot) cell is found with a binary search on the memory-mapped keys.
+HISTORY_FIELDS = (
+    "apy_1day",
+    "apy_7day",
+    "apy_30day",
+    "tvl_usd",
+    "vault_score",
+    "vault_tvl_score",
+    "protocol_tvl_score",
+    "holder_score",
+    "network_score",
+    "asset_score",
+)
+
+_VAULT_BITS = 32
+
+def _segment_name(ts: int) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y%m")
+
+class VaultHistoryStore:
+    '''
+    Local time-series store of the numeric vault columns.
+
+    Snapshots are appended to fixed-width column files, one directory per month, and read
+    back through np.memmap, so range reads per vault and scans over a time window only
+    touch the pages they need.
+    '''
+    def __init__(self, root: str, fields: Sequence[str] = HISTORY_FIELDS):
+        self.root = root
+        self.fields = tuple(fields)
+        self._lock = threading.RLock()
+        self._memmaps: Dict[Tuple[str, str], np.ndarray] = {}
+        self._last_appended: Dict[str, object] = {}
+        os.makedirs(os.path.join(root, "segments"), exist_ok=True)
+
+        self._vault_ids: Dict[Tuple[int, str], int] = {}
+        self._vault_keys: List[Tuple[int, str]] = []
+        keys_path = os.path.join(root, "vault_keys.tsv")
+        if os.path.exists(keys_path):
+            with open(keys_path, "r") as f:
+                for line in f:
+                    chain_id, address = line.rstrip("\n").split("\t")
+                    self._register((int(chain_id), address))
+
+        snapshots_path = os.path.join(root, "snapshots.i64")
+        self._timestamps = np.fromfile(snapshots_path, dtype=np.int64) if os.path.exists(snapshots_path) \
+            else np.empty(0, dtype=np.int64)
+        self._truncate_uncommitted()
+
+    ############################################################################
+    # write path
+    def _register(self, key: Tuple[int, str]) -> int:
+        vault_id = self._vault_ids.get(key)
+        if vault_id is None:
+            vault_id = self._vault_ids[key] = len(self._vault_keys)
+            self._vault_keys.append(key)
+        return vault_id
+
+    def _segment_dir(self, segment: str) -> str:
+        return os.path.join(self.root, "segments", segment)
+
+    def _truncate_uncommitted(self) -> None:
+        """
+        Bring every file of the last segment to its committed rows: rows of a snapshot whose
+        timestamp was never written (crash during append) are dropped, a file the crash left
+        missing is created, and a field file shorter than the committed keys is padded with NaN
+        """
+        segments = self.segments()
+        if not segments:
+            return
+        last = self._segment_dir(segments[-1])
+        keys_path = os.path.join(last, "key.u64")
+        keys = np.fromfile(keys_path, dtype=np.uint64) if os.path.exists(keys_path) else np.empty(0, dtype=np.uint64)
+        committed = int(np.searchsorted(keys, np.uint64(len(self._timestamps) << _VAULT_BITS)))
+        for name in ("key.u64",) + tuple(f"{field}.f64" for field in self.fields):
+            path = os.path.join(last, name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            if os.path.exists(path) and size == committed * 8:
+                continue
+            with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+                f.truncate(min(size - size % 8, committed * 8))
+                missing = committed - min(size // 8, committed)
+                if missing:
+                    f.seek(0, os.SEEK_END)
+                    f.write(np.full(missing, np.nan, dtype=np.float64).tobytes())
+
+    def append_snapshot(self, store: VaultColumnStore, ts: Optional[int] = None) -> int:
+        """
+        Append the numeric columns of a snapshot.
+
+        Args:
+            store: Vault snapshot
+            ts: Unix timestamp in seconds, defaults to now. Must not go back in time
+
+        Returns:
+            Sequence number of the snapshot
+        """
+        ts = int(time.time()) if ts is None else int(ts)
+        with self._lock:
+            if len(self._timestamps) and ts < self._timestamps[-1]:
+                raise ValueError(f"History is append-only, {ts} is older than the last snapshot {self._timestamps[-1]}")
+            seq = len(self._timestamps)
+
+            new_keys = []
+            vault_ids = np.empty(len(store), dtype=np.uint64)
+            for row in range(len(store)):
+                key = store.key(row)
+                if key not in self._vault_ids:
+                    new_keys.append(key)
+                vault_ids[row] = self._register(key)
+            if new_keys:
+                with open(os.path.join(self.root, "vault_keys.tsv"), "a") as f:
+                    f.writelines(f"{chain_id}\t{address}\n" for chain_id, address in new_keys)
+
+            order = np.argsort(vault_ids, kind="stable")
+            segment_dir = self._segment_dir(_segment_name(ts))
+            os.makedirs(segment_dir, exist_ok=True)
+            keys = (np.uint64(seq) << np.uint64(_VAULT_BITS)) | vault_ids[order]
+            with open(os.path.join(segment_dir, "key.u64"), "ab") as f:
+                f.write(keys.tobytes())
+            for field in self.fields:
+                values = np.asarray(store.columns[field], dtype=np.float64)[order]
+                with open(os.path.join(segment_dir, f"{field}.f64"), "ab") as f:
+                    f.write(values.tobytes())
+
+            # the timestamp commits the snapshot
+            with open(os.path.join(self.root, "snapshots.i64"), "ab") as f:
+                f.write(np.int64(ts).tobytes())
+            self._timestamps = np.append(self._timestamps, np.int64(ts))
+            self._memmaps.clear()
+            return seq
+
+    def append_if_new(self, network: str, store: VaultColumnStore, ts: Optional[int] = None) -> Optional[int]:
+        """Append store unless it is the same snapshot object last appended for network (a cache hit)"""
+        with self._lock:
+            if self._last_appended.get(network) is store:
+                return None
+            seq = self.append_snapshot(store, ts)
+            self._last_appended[network] = store
+            return seq
+
+    ############################################################################
+    # read path
+    def segments(self) -> List[str]:
+        return sorted(os.listdir(os.path.join(self.root, "segments")))
+
+    def _column(self, segment: str, name: str) -> np.ndarray:
+        cached = self._memmaps.get((segment, name))
+        if cached is None:
+            path = os.path.join(self._segment_dir(segment), name)
+            dtype = np.uint64 if name == "key.u64" else np.float64
+            cached = np.memmap(path, dtype=dtype, mode="r") if os.path.getsize(path) else np.empty(0, dtype=dtype)
+            self._memmaps[(segment, name)] = cached
+        return cached
+
+    def _seq_range(self, start_ts: Optional[int], end_ts: Optional[int]) -> Tuple[int, int]:
+        """Snapshot seqs [first, last) with start_ts <= ts <= end_ts"""
+        first = 0 if start_ts is None else int(np.searchsorted(self._timestamps, start_ts, side="left"))
+        last = len(self._timestamps) if end_ts is None else int(np.searchsorted(self._timestamps, end_ts, side="right"))
+        return first, max(first, last)
+
+    def _segments_between(self, first: int, last: int) -> List[str]:
+        if first >= last:
+            return []
+        low, high = _segment_name(int(self._timestamps[first])), _segment_name(int(self._timestamps[last - 1]))
+        return [segment for segment in self.segments() if low <= segment <= high]
+
+    def vault_id(self, chain_id: int, address: str) -> Optional[int]:
+        return self._vault_ids.get((chain_id, address))
+
+    def vault_key(self, vault_id: int) -> Tuple[int, str]:
+        return self._vault_keys[vault_id]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._timestamps
+
+    def read_vault(self, chain_id: int, address: str, start_ts: Optional[int] = None,
+                   end_ts: Optional[int] = None, fields: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        History of one vault between start_ts and end_ts (inclusive).
+
+        Returns:
+            {"ts": int64 array, <field>: float64 array, ...}, empty arrays for an unknown vault
+        """
+        fields = tuple(fields or self.fields)
+        result = {"ts": [], **{field: [] for field in fields}}
+        vault_id = self.vault_id(chain_id, address)
+        first, last = self._seq_range(start_ts, end_ts)
+        if vault_id is not None:
+            seqs = np.arange(first, last, dtype=np.uint64)
+            targets = (seqs << np.uint64(_VAULT_BITS)) | np.uint64(vault_id)
+            for segment in self._segments_between(first, last):
+                keys = self._column(segment, "key.u64")
+                rows = np.searchsorted(keys, targets)
+                inside = rows < len(keys)
+                found = rows[inside][keys[rows[inside]] == targets[inside]]
+                if not len(found):
+                    continue
+                result["ts"].append(self._timestamps[(keys[found] >> np.uint64(_VAULT_BITS)).astype(np.int64)])
+                for field in fields:
+                    result[field].append(self._column(segment, f"{field}.f64")[found])
+        return {name: np.concatenate(parts) if parts else np.empty(0, dtype=np.int64 if name == "ts" else np.float64)
+                for name, parts in result.items()}
+
+    def scan(self, start_ts: Optional[int] = None, end_ts: Optional[int] = None,
+             fields: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Every vault of every snapshot between start_ts and end_ts (inclusive), for vectorized
+        backtests. Each segment contributes a contiguous slice of its memory-mapped columns.
+
+        Returns:
+            {"seq": int64, "vault_id": int64, <field>: float64, ...}, one entry per (snapshot, vault)
+        """
+        fields = tuple(fields or self.fields)
+        first, last = self._seq_range(start_ts, end_ts)
+        low, high = np.uint64(first) << np.uint64(_VAULT_BITS), np.uint64(last) << np.uint64(_VAULT_BITS)
+        parts: Dict[str, list] = {"seq": [], "vault_id": [], **{field: [] for field in fields}}
+        for segment in self._segments_between(first, last):
+            keys = self._column(segment, "key.u64")
+            begin, end = np.searchsorted(keys, low), np.searchsorted(keys, high)
+            window = keys[begin:end]
+            parts["seq"].append((window >> np.uint64(_VAULT_BITS)).astype(np.int64))
+            parts["vault_id"].append((window & np.uint64((1 << _VAULT_BITS) - 1)).astype(np.int64))
+            for field in fields:
+                parts[field].append(self._column(segment, f"{field}.f64")[begin:end])
+        if len(parts["seq"]) == 1:
+            return {name: values[0] for name, values in parts.items()}
+        return {name: np.concatenate(values) if values else np.empty(0, dtype=np.int64 if name in ("seq", "vault_id")
+                                                                        else np.float64)
+                for name, values in parts.items()}
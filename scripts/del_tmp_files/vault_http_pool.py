@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_http_pool.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Shared, long-lived HTTP connection pool for the vault fetchers
+"""
+################################################################################
+# built-in modules
+import asyncio
+import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
+
+# third-party modules
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+################################################################################
+# Connection pool
+class _TrackingConnector(aiohttp.TCPConnector):
+    """TCPConnector that records the connections it hands out, so the pool can count the idle ones"""
+    def __init__(self, connections: "weakref.WeakSet", **kwargs):
+        super().__init__(**kwargs)
+        self._handed_out = connections
+
+    async def connect(self, req, traces, timeout):
+        connection = await super().connect(req, traces, timeout)
+        if connection.protocol is not None:
+            self._handed_out.add(connection.protocol)
+        return connection
+
+class VaultHttpPool:
+    '''
+    One aiohttp session + TCPConnector shared by every network fetcher, so keep-alive
+    connections and DNS answers are reused across conversations instead of paying a
+    new TCP+TLS handshake per request.
+    '''
+    def __init__(self, limit: int = 100, limit_per_host: int = 20, keepalive_timeout: float = 30.0,
+                 ttl_dns_cache: int = 300, request_timeout: float = 30.0):
+        """
+        Args:
+            limit (int): Maximum number of connections in the pool
+            limit_per_host (int): Maximum number of connections to a single host
+            keepalive_timeout (float): Seconds an idle connection is kept open
+            ttl_dns_cache (int): Seconds a DNS answer is cached
+            request_timeout (float): Total timeout for one request in seconds
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.request_timeout = request_timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # statistics
+        self._in_use = 0
+        self._requests_total = 0
+        self._connections_created = 0
+        self._connections_reused = 0
+        self._waits_total = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        # every connection the connector handed out, aiohttp has no release or close trace, so
+        # the idle count is derived from those still connected and the requests in flight
+        self._connections: "weakref.WeakSet" = weakref.WeakSet()
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_queued_start(session, ctx, params):
+            ctx.queued_at = time.perf_counter()
+
+        async def on_queued_end(session, ctx, params):
+            waited = time.perf_counter() - getattr(ctx, "queued_at", time.perf_counter())
+            self._waits_total += 1
+            self._wait_time_total += waited
+            self._wait_time_max = max(self._wait_time_max, waited)
+
+        async def on_create_end(session, ctx, params):
+            self._connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            self._connections_reused += 1
+
+        trace_config.on_connection_queued_start.append(on_queued_start)
+        trace_config.on_connection_queued_end.append(on_queued_end)
+        trace_config.on_connection_create_end.append(on_create_end)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        return trace_config
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it on first use or after the event loop changed"""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed:
+            if self._session_loop is loop:
+                return self._session
+            self._abandon_session(self._session, self._session_loop)
+
+        # no await between the check and the assignment, so concurrent callers share one session
+        self._connections = weakref.WeakSet()
+        connector = _TrackingConnector(
+            self._connections,
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            trace_configs=[self._build_trace_config()],
+        )
+        self._session_loop = loop
+        return self._session
+
+    def _abandon_session(self, session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """Close the session of a previous event loop, which can only be done on that loop"""
+        if loop is not None and loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        logger.warning("Vault HTTP pool: the event loop of the previous session is no longer running, "
+                       "its pooled connections are left unclosed (call close_shared_pool before the loop ends)")
+
+    @asynccontextmanager
+    async def request(self, method: str, url: str, **kwargs):
+        """
+        Send a request through the shared pool.
+
+        Usage:
+            async with pool.request("POST", url, json=payload) as response:
+                data = await response.json()
+        """
+        session = await self.get_session()
+        self._in_use += 1
+        self._requests_total += 1
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                yield response
+        finally:
+            self._in_use -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Pool statistics used to size the pool under production concurrency, all of them
+        counted by this pool's own request wrapper and connection traces
+        """
+        return {
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "in_use": self._in_use,
+            "idle": max(0, sum(1 for protocol in list(self._connections) if protocol.is_connected()) - self._in_use),
+            "requests_total": self._requests_total,
+            "connections_created": self._connections_created,
+            "connections_reused": self._connections_reused,
+            "waits_total": self._waits_total,
+            "wait_time_avg_ms": (self._wait_time_total / self._waits_total * 1000) if self._waits_total else 0.0,
+            "wait_time_max_ms": self._wait_time_max * 1000,
+        }
+
+    async def close(self) -> None:
+        """Close the session and every pooled connection"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._session_loop = None
+
+################################################################################
+# Pagination
+async def fetch_all_pages(pool: VaultHttpPool, url: str, payload: Dict[str, Any], page_size: int = 100,
+                          max_parallel: int = 4, page_key: str = "page", size_key: str = "perPage") -> List[Any]:
+    """
+    POST a paginated list endpoint and return the "data" rows of every page in page order.
+
+    The first page is fetched alone. If it reports totalPages/total/totalItems, the remaining
+    pages are fetched concurrently, at most max_parallel at a time; otherwise pages are fetched
+    in windows of max_parallel until a page comes back short.
+
+    Args:
+        pool: Connection pool to send the requests through
+        url: Endpoint URL
+        payload: Request body, the page number and size are added to it
+        page_size: Rows requested per page
+        max_parallel: Maximum number of pages in flight
+        page_key: Body field of the 1-based page number
+        size_key: Body field of the page size
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def fetch_page(page: int) -> Dict[str, Any]:
+        async with semaphore:
+            async with pool.request("POST", url, json={**payload, page_key: page, size_key: page_size}) as response:
+                response.raise_for_status()
+                return await response.json()
+
+    first = await fetch_page(1)
+    rows = list(first.get("data") or [])
+    total_pages = first.get("totalPages")
+    if total_pages is None:
+        total_items = first.get("total", first.get("totalItems"))
+        if total_items is not None:
+            total_pages = -(-int(total_items) // page_size)
+
+    if total_pages is not None:
+        pages = await asyncio.gather(*(fetch_page(page) for page in range(2, int(total_pages) + 1)))
+        for body in pages:
+            rows.extend(body.get("data") or [])
+        return rows
+
+    next_page = 2
+    last_size = len(rows)
+    while last_size >= page_size:
+        window = range(next_page, next_page + max_parallel)
+        pages = await asyncio.gather(*(fetch_page(page) for page in window))
+        for body in pages:
+            data = body.get("data") or []
+            rows.extend(data)
+            last_size = len(data)
+            if last_size < page_size:
+                break
+        next_page += max_parallel
+    return rows
+
+################################################################################
+# Process-wide pool
+_shared_pool: Optional[VaultHttpPool] = None
+
+def configure_shared_pool(**kwargs) -> VaultHttpPool:
+    """
+    Set the limits of the shared pool, must be called before the first request.
+
+    Args:
+        **kwargs: Keyword arguments of VaultHttpPool
+    """
+    global _shared_pool
+    if _shared_pool is not None and _shared_pool._session is not None:
+        raise RuntimeError("Shared vault HTTP pool is already in use, close it before reconfiguring")
+    _shared_pool = VaultHttpPool(**kwargs)
+    return _shared_pool
+
+def get_shared_pool() -> VaultHttpPool:
+    """Return the process-wide pool used by all VaultSourcingSystem instances"""
+    global _shared_pool
+    if _shared_pool is None:
+        _shared_pool = VaultHttpPool()
+    return _shared_pool
+
+async def close_shared_pool() -> None:
+    """Close the process-wide pool, call this on application shutdown"""
+    if _shared_pool is not None:
+        await _shared_pool.close()
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_index.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Secondary indexes and filter/query API over a vault snapshot
+"""
+################################################################################
+# built-in modules
+import copy
+from typing import Dict, Iterable, List, Optional
+
+# third-party modules
+import numpy as np
+from pydantic import BaseModel
+
+# developed modules
+from vault_store import VaultColumnStore
+
+################################################################################
+# EVM get-vaults rows carry an empty "network", so network names are also matched by chain id
+NETWORK_CHAIN_IDS = {
+    "mainnet": 1,
+    "ethereum": 1,
+    "optimism": 10,
+    "polygon": 137,
+    "base": 8453,
+    "arbitrum": 42161,
+}
+
+# columns with a sorted index, usable in range filters and order_by
+SORTED_COLUMNS = ("tvl_usd", "apy_1day", "apy_7day", "apy_30day", "vault_score")
+
+# columns behind the hash indexes, a change to any of them needs a full rebuild
+HASHED_COLUMNS = ("network", "chain_id", "protocol", "token_symbol", "token_address", "tags", "has_withdraw_delay")
+
+class VaultQuery(BaseModel):
+    '''
+    Filter + ordering over a vault snapshot, every filter that is set must match.
+
+    Example - USDC vaults on base with TVL > $1M, no withdraw delay, top 10 by 7-day APY:
+        VaultQuery(network="base", token_symbol="USDC", min_tvl_usd=1_000_000,
+                   has_withdraw_delay=False, order_by="apy_7day", limit=10)
+    '''
+    network: Optional[str] = None
+    chain_id: Optional[int] = None
+    protocol: Optional[str] = None
+    token_symbol: Optional[str] = None
+    token_address: Optional[str] = None
+    tags: Optional[List[str]] = None  # vault must carry all of them
+    has_withdraw_delay: Optional[bool] = None
+    min_tvl_usd: Optional[float] = None
+    max_tvl_usd: Optional[float] = None
+    min_apy_7day: Optional[float] = None
+    max_apy_7day: Optional[float] = None
+    min_apy_30day: Optional[float] = None
+    max_apy_30day: Optional[float] = None
+    order_by: str = "vault_score"
+    descending: bool = True
+    limit: Optional[int] = None
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+def _postings(codes: np.ndarray, categories: List) -> Dict:
+    """Row ids per category, each posting list sorted ascending"""
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=len(categories))
+    splits = np.split(order.astype(np.int64), np.cumsum(counts)[:-1])
+    return {category: rows for category, rows in zip(categories, splits) if len(rows)}
+
+################################################################################
+# Index
+class VaultIndex:
+    '''
+    Hash indexes over network, chainId, protocol, token symbol/address, tags and
+    hasWithdrawDelay, and sorted indexes over TVL, APY and vault score of one snapshot.
+    A query intersects posting lists and sorted-index ranges instead of scanning every vault.
+    '''
+    def __init__(self, store: VaultColumnStore):
+        self.store = store
+        columns = store.columns
+
+        self.by_network = _postings(columns["network"].codes, columns["network"].categories)
+        self.by_protocol = _postings(columns["protocol"].codes, columns["protocol"].categories)
+        self.by_token_symbol = _postings(columns["token_symbol"].codes, columns["token_symbol"].categories)
+        self.by_token_address = {}
+        for address, rows in _postings(columns["token_address"].codes, columns["token_address"].categories).items():
+            key = address.lower()
+            self.by_token_address[key] = np.union1d(self.by_token_address.get(key, _EMPTY), rows)
+
+        chain_ids, chain_codes = np.unique(columns["chain_id"], return_inverse=True)
+        self.by_chain_id = _postings(chain_codes.ravel(), [int(chain_id) for chain_id in chain_ids])
+
+        tags = columns["tags"]
+        tag_rows = np.repeat(np.arange(len(tags), dtype=np.int64), np.diff(tags.offsets))
+        self.by_tag = {}
+        for code, category in enumerate(tags.categories):
+            rows = np.unique(tag_rows[tags.codes == code])
+            if len(rows):
+                self.by_tag[category] = rows
+
+        delay = columns["has_withdraw_delay"]
+        self.by_withdraw_delay = {True: np.flatnonzero(delay).astype(np.int64),
+                                  False: np.flatnonzero(~delay).astype(np.int64)}
+
+        # sorted index: row ids ordered by value ascending, plus the sorted values
+        self.sorted_rows = {}
+        self.sorted_values = {}
+        for name in SORTED_COLUMNS:
+            order = np.argsort(columns[name], kind="stable").astype(np.int64)
+            self.sorted_rows[name] = order
+            self.sorted_values[name] = columns[name][order]
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def with_changes(self, store: VaultColumnStore, rows: np.ndarray, columns: Iterable[str]) -> "VaultIndex":
+        """
+        Index of store, where store has the same rows as self.store and only the given rows
+        changed in the given columns. Sorted indexes are patched: the changed rows are taken
+        out and merged back at their new position, the hash indexes are shared.
+        """
+        columns = set(columns)
+        if columns & set(HASHED_COLUMNS) or len(store) != len(self.store):
+            return VaultIndex(store)
+        index = copy.copy(self)
+        index.store = store
+        index.sorted_rows = dict(self.sorted_rows)
+        index.sorted_values = dict(self.sorted_values)
+        rows = np.asarray(rows, dtype=np.int64)
+        for name in SORTED_COLUMNS:
+            if name not in columns or not len(rows):
+                continue
+            order = self.sorted_rows[name]
+            keep = order[~np.isin(order, rows)]
+            kept_values = store.columns[name][keep]
+            changed_values = store.columns[name][rows]
+            changed_order = np.argsort(changed_values, kind="stable")
+            positions = np.searchsorted(kept_values, changed_values[changed_order], side="right")
+            index.sorted_rows[name] = np.insert(keep, positions, rows[changed_order])
+            index.sorted_values[name] = np.insert(kept_values, positions, changed_values[changed_order])
+        return index
+
+    def _network_rows(self, network: str) -> np.ndarray:
+        rows = self.by_network.get(network, _EMPTY)
+        chain_id = NETWORK_CHAIN_IDS.get(network.lower())
+        if chain_id is not None:
+            rows = np.union1d(rows, self.by_chain_id.get(chain_id, _EMPTY))
+        return rows
+
+    def _range_rows(self, name: str, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        values = self.sorted_values[name]
+        start = 0 if low is None else np.searchsorted(values, low, side="left")
+        end = len(values) if high is None else np.searchsorted(values, high, side="right")
+        return np.sort(self.sorted_rows[name][start:end])
+
+    def match(self, query: VaultQuery) -> Optional[np.ndarray]:
+        """Sorted row ids matching the filters of query, None if the query has no filter"""
+        candidates = []
+        if query.network is not None:
+            candidates.append(self._network_rows(query.network))
+        if query.chain_id is not None:
+            candidates.append(self.by_chain_id.get(query.chain_id, _EMPTY))
+        if query.protocol is not None:
+            candidates.append(self.by_protocol.get(query.protocol, _EMPTY))
+        if query.token_symbol is not None:
+            candidates.append(self.by_token_symbol.get(query.token_symbol, _EMPTY))
+        if query.token_address is not None:
+            candidates.append(self.by_token_address.get(query.token_address.lower(), _EMPTY))
+        for tag in query.tags or []:
+            candidates.append(self.by_tag.get(tag, _EMPTY))
+        if query.has_withdraw_delay is not None:
+            candidates.append(self.by_withdraw_delay[query.has_withdraw_delay])
+        for name, low, high in (("tvl_usd", query.min_tvl_usd, query.max_tvl_usd),
+                                ("apy_7day", query.min_apy_7day, query.max_apy_7day),
+                                ("apy_30day", query.min_apy_30day, query.max_apy_30day)):
+            if low is not None or high is not None:
+                candidates.append(self._range_rows(name, low, high))
+
+        if not candidates:
+            return None
+        # intersect from the most selective posting list up
+        candidates.sort(key=len)
+        rows = candidates[0]
+        for other in candidates[1:]:
+            if not len(rows):
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def query_rows(self, query: VaultQuery) -> np.ndarray:
+        """Row ids matching query, ordered by query.order_by and cut to query.limit"""
+        if query.order_by not in self.sorted_rows:
+            raise ValueError(f"Cannot order by {query.order_by}, choose one of {SORTED_COLUMNS}")
+        rows = self.match(query)
+        order = self.sorted_rows[query.order_by]
+        if rows is None:
+            # no filter: the answer is a slice of the sorted index
+            ordered = order[::-1] if query.descending else order
+            return ordered[:query.limit] if query.limit is not None else ordered
+
+        values = self.store.columns[query.order_by][rows]
+        keys = -values if query.descending else values
+        if query.limit is not None and query.limit < len(rows):
+            top = np.argpartition(keys, query.limit - 1)[:query.limit] if query.limit > 0 else _EMPTY
+            return rows[top[np.argsort(keys[top], kind="stable")]]
+        return rows[np.argsort(keys, kind="stable")]
+
+    def query(self, query: VaultQuery) -> VaultColumnStore:
+        """Matching vaults as a new columnar store, index it to get Vault_EVM objects"""
+        return self.store.take(self.query_rows(query))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_models.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Pydantic models of the vault data returned by the get-vaults APIs
+"""
+################################################################################
+# built-in modules
+from typing import List
+
+# third-party modules
+from pydantic import BaseModel, Field
+
+################################################################################
+class Token(BaseModel):
+    name: str
+    symbol: str
+    address: str
+    decimals: int
+
+class APYMetrics(BaseModel):
+    day1: float = Field(alias="1day", default=0)
+    day7: float = Field(alias="7day", default=0)
+    day30: float = Field(alias="30day", default=0)
+
+class APY(BaseModel):
+    base: APYMetrics
+    total: APYMetrics
+
+class Scores(BaseModel):
+    provider: str
+    assetScore: float
+    vaultScore: float
+    holderScore: float
+    networkScore: float
+    vaultTvlScore: float
+    protocolTvlScore: float
+
+class Vault_EVM(BaseModel):
+    address: str
+    chainId: int
+    name: str
+    description: str
+    protocol: str
+    numberOfHolders: str
+    tvlUsd: str
+    tvlNative: str
+    token: Token
+    apy: APY
+    scores: Scores
+    hasWithdrawDelay: bool
+    network: str
+    tags: List[str]
+
+class VaultResponse(BaseModel):
+    data: List[Vault_EVM]
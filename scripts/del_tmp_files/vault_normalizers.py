@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_normalizers.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Batch normalization of Sui and Solana vault rows into the shared columnar vault model
+"""
+################################################################################
+# built-in modules
+from typing import Any, Dict, List, Sequence
+
+# third-party modules
+import numpy as np
+
+# developed modules
+from vault_store import VaultColumnStore
+
+################################################################################
+# Non-EVM networks have no EIP-155 chain id, their SLIP-44 coin types are used instead
+SUI_CHAIN_ID = 784
+SOLANA_CHAIN_ID = 501
+
+# first segment of a Sui vault id naming the underlying protocol, e.g. "NAVI-DEEP"
+SUI_UNDERLYING_PROTOCOLS = {"NAVI": "navi", "BLUEFIN": "bluefin", "BUCKET": "bucket"}
+
+def _sui_symbol(asset_type: str) -> str:
+    # "0x...::deep::DEEP" -> "DEEP"
+    return asset_type.rsplit("::", 1)[-1]
+
+def sui_rows_to_store(rows: Sequence[Dict[str, Any]]) -> VaultColumnStore:
+    '''
+    Map Sui pool rows ({id, packageId, parentPoolId, poolId, investorId, assetTypes, apr})
+    onto the vault columns, one list/array per column for the whole batch.
+
+    - address is the poolId, name the pool id ("BLUEFIN-SUI-USDC")
+    - the token is the first asset type, multi-asset pools are tagged "Liquidity Pool"
+    - apr is a percentage, vault APYs are in basis points, so every period gets apr * 100
+    - TVL, token decimals and scores are not provided upstream: 0, -1 and 0, the holder count
+      is unknown (0 with number_of_holders_known False)
+    '''
+    n = len(rows)
+    ids = [row["id"] for row in rows]
+    asset_types = [row.get("assetTypes") or [""] for row in rows]
+    first_assets = [assets[0] for assets in asset_types]
+    symbols = [_sui_symbol(asset) for asset in first_assets]
+    apy = np.array([row.get("apr") or 0 for row in rows], dtype=np.float64) * 100
+    zeros = np.zeros(n, dtype=np.float64)
+    tags = []
+    for vault_id, assets in zip(ids, asset_types):
+        row_tags = ["Liquidity Pool"] if len(assets) > 1 else []
+        underlying = SUI_UNDERLYING_PROTOCOLS.get(vault_id.split("-", 1)[0])
+        if underlying:
+            row_tags.append(underlying)
+        tags.append(row_tags)
+
+    return VaultColumnStore.from_columns({
+        "address": [row["poolId"] for row in rows],
+        "chain_id": np.full(n, SUI_CHAIN_ID, dtype=np.int64),
+        "name": ids,
+        "description": [""] * n,
+        "protocol": ["alphafi"] * n,
+        "number_of_holders": np.zeros(n, dtype=np.int64),
+        "number_of_holders_known": np.zeros(n, dtype=np.bool_),
+        "tvl_usd": zeros,
+        "tvl_usd_text": ["0"] * n,
+        "tvl_native": ["0"] * n,
+        "token_name": symbols,
+        "token_symbol": symbols,
+        "token_address": first_assets,
+        "token_decimals": np.full(n, -1, dtype=np.int16),
+        "apy_base_1day": apy,
+        "apy_base_7day": apy,
+        "apy_base_30day": apy,
+        "apy_1day": apy,
+        "apy_7day": apy,
+        "apy_30day": apy,
+        "score_provider": [""] * n,
+        "vault_score": zeros,
+        "vault_tvl_score": zeros,
+        "protocol_tvl_score": zeros,
+        "holder_score": zeros,
+        "network_score": zeros,
+        "asset_score": zeros,
+        "has_withdraw_delay": np.zeros(n, dtype=np.bool_),
+        "network": ["sui"] * n,
+        "tags": tags,
+    })
+
+def solana_rows_to_store(rows: Sequence[Dict[str, Any]]) -> VaultColumnStore:
+    '''
+    The svm get-vaults API returns rows in the EVM get-vaults shape, only the chain id and
+    network have to be filled in before the rows are loaded column by column. The rows get
+    the same per-column type checks as the EVM stream, a malformed row raises VaultRecordError.
+    '''
+    rows: List[Dict[str, Any]] = [
+        row if row.get("chainId") is not None and row.get("network")
+        else {**row, "chainId": row.get("chainId") or SOLANA_CHAIN_ID, "network": row.get("network") or "solana"}
+        for row in rows
+    ]
+    return VaultColumnStore.from_records(rows)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_ranking.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Vectorized batch scoring and top-K selection for vault ranking
+"""
+################################################################################
+# built-in modules
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+# third-party modules
+import numpy as np
+
+################################################################################
+# score inputs extracted once per snapshot
+SCORE_FIELDS = (
+    "apy_1day",
+    "apy_7day",
+    "apy_30day",
+    "vault_score",
+    "vault_tvl_score",
+    "protocol_tvl_score",
+    "holder_score",
+    "network_score",
+    "asset_score",
+)
+
+def _vault_score_inputs(vault) -> tuple:
+    total = vault.apy.total
+    scores = vault.scores
+    return (total.day1, total.day7, total.day30,
+            scores.vaultScore, scores.vaultTvlScore, scores.protocolTvlScore,
+            scores.holderScore, scores.networkScore, scores.assetScore)
+
+def top_k_indices(scores: np.ndarray, k: Optional[int] = None) -> np.ndarray:
+    """
+    Indices of the k highest scores in descending order, along the last axis.
+
+    Uses argpartition so only the selected k elements are sorted, k=None sorts everything
+    (stable, equal scores keep their input order).
+    """
+    n = scores.shape[-1]
+    if k is None or k >= n:
+        return np.argsort(-scores, axis=-1, kind="stable")
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.intp)
+    candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=-1)
+
+class ChainedVaults:
+    '''
+    Read-only view over several vault sequences, so merging per-network snapshots does not
+    materialize every vault of a columnar store.
+    '''
+    def __init__(self, parts: Sequence[Sequence]):
+        self.parts = list(parts)
+        self._starts = np.cumsum([0] + [len(part) for part in self.parts])
+
+    def __len__(self) -> int:
+        return int(self._starts[-1])
+
+    def __getitem__(self, i: int):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("vault index out of range")
+        part = int(np.searchsorted(self._starts, i, side="right")) - 1
+        return self.parts[part][i - self._starts[part]]
+
+    def __iter__(self):
+        for part in self.parts:
+            yield from part
+
+    def to_vaults(self, indices: Sequence[int]) -> List:
+        """Vaults at the given positions, each part materializes its rows in one batch"""
+        return self._gather(indices, take_vaults)
+
+    def records(self, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        """Rows at the given positions in the get-vaults JSON shape"""
+        return self._gather(indices, take_records)
+
+    def _gather(self, indices: Sequence[int], take: Callable[[Sequence, np.ndarray], List]) -> List:
+        indices = np.asarray(indices, dtype=np.intp)
+        parts = np.searchsorted(self._starts, indices, side="right") - 1
+        rows: List = [None] * len(indices)
+        for part in np.unique(parts).tolist():
+            positions = np.flatnonzero(parts == part)
+            for position, row in zip(positions.tolist(), take(self.parts[part], indices[positions] - self._starts[part])):
+                rows[position] = row
+        return rows
+
+class RankedVaults:
+    '''
+    Read-only sequence of the vaults at the given positions of a snapshot, in that order.
+
+    Ranking only produces the positions: a Vault_EVM is built when its row is read (in batches
+    when iterating), and records() serializes rows straight from the columns.
+    '''
+    BATCH_SIZE = 1024
+
+    def __init__(self, vaults: Sequence, indices: np.ndarray):
+        self.vaults = vaults
+        self.indices = np.asarray(indices, dtype=np.intp)
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i: Union[int, slice]):
+        if isinstance(i, slice):
+            return self.to_vaults(range(*i.indices(len(self))))
+        return take_vaults(self.vaults, [self.indices[i]])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), self.BATCH_SIZE):
+            yield from self.to_vaults(range(start, min(start + self.BATCH_SIZE, len(self))))
+
+    def to_vaults(self, positions: Sequence[int]) -> List:
+        """Vaults at the given ranks"""
+        return take_vaults(self.vaults, self.indices[np.asarray(positions, dtype=np.intp)])
+
+    def records(self, positions: Sequence[int]) -> List[Dict[str, Any]]:
+        """Rows at the given ranks in the get-vaults JSON shape, without building Vault_EVM objects"""
+        return take_records(self.vaults, self.indices[np.asarray(positions, dtype=np.intp)])
+
+def take_vaults(vaults: Sequence, indices: Sequence[int]) -> List:
+    """vaults[i] for every i of indices, batched when the sequence is a columnar store or a view over one"""
+    if hasattr(vaults, "to_vaults"):
+        return vaults.to_vaults(indices)
+    return [vaults[int(i)] for i in indices]
+
+def take_records(vaults: Sequence, indices: Sequence[int]) -> List[Dict[str, Any]]:
+    """Rows of vaults in the get-vaults JSON shape, read from the columns when there are any"""
+    if hasattr(vaults, "records"):
+        return vaults.records(indices)
+    return [vaults[int(i)].model_dump(by_alias=True) for i in indices]
+
+################################################################################
+# Ranking engine
+class VaultRankingEngine:
+    '''
+    Column arrays of the score inputs of one vault snapshot.
+
+    The combined score of VaultSourcingSystem._calculate_score,
+        weight_yield * apy_7day - weight_risk * (100 - vault_score),
+    is evaluated for many users at once as a (users x 2) @ (2 x vaults) product.
+    '''
+    def __init__(self, vaults: Sequence, features: Dict[str, np.ndarray]):
+        self.vaults = vaults
+        self.features = features
+        # rows: yield term, risk term (negated so larger is better)
+        self._score_matrix = np.vstack([features["apy_7day"], features["vault_score"] - 100.0])
+
+    @classmethod
+    def from_vaults(cls, vaults: Sequence) -> "VaultRankingEngine":
+        """
+        Extract the score inputs of a list of Vault_EVM into float64 arrays, a
+        VaultColumnStore hands over its columns without copying.
+        """
+        if hasattr(vaults, "score_features"):
+            return cls(vaults, vaults.score_features())
+        table = np.array([_vault_score_inputs(vault) for vault in vaults], dtype=np.float64)
+        table = table.reshape(len(vaults), len(SCORE_FIELDS))
+        features = {name: np.ascontiguousarray(table[:, i]) for i, name in enumerate(SCORE_FIELDS)}
+        return cls(vaults, features)
+
+    @classmethod
+    def concat(cls, engines: Sequence["VaultRankingEngine"]) -> "VaultRankingEngine":
+        """Merge per-network engines without re-reading the vault objects"""
+        if len(engines) == 1:
+            return engines[0]
+        vaults = ChainedVaults([engine.vaults for engine in engines])
+        if not engines:
+            return cls(vaults, {name: np.empty(0) for name in SCORE_FIELDS})
+        features = {name: np.concatenate([engine.features[name] for engine in engines]) for name in SCORE_FIELDS}
+        return cls(vaults, features)
+
+    def __len__(self) -> int:
+        return len(self.vaults)
+
+    def score_batch(self, weight_yield: Union[float, Sequence[float]],
+                    weight_risk: Union[float, Sequence[float]]) -> np.ndarray:
+        """
+        Combined scores for a batch of users.
+
+        Args:
+            weight_yield: Yield weight per user
+            weight_risk: Risk weight per user
+
+        Returns:
+            Array of shape (users, vaults)
+        """
+        weight_yield, weight_risk = np.broadcast_arrays(np.atleast_1d(np.asarray(weight_yield, dtype=np.float64)),
+                                                        np.atleast_1d(np.asarray(weight_risk, dtype=np.float64)))
+        weights = np.column_stack([weight_yield, weight_risk])
+        return weights @ self._score_matrix
+
+    def rank_batch_indices(self, weight_yield: Union[float, Sequence[float]],
+                           weight_risk: Union[float, Sequence[float]], k: Optional[int] = None) -> np.ndarray:
+        """Top-k vault indices per user, shape (users, k)"""
+        return top_k_indices(self.score_batch(weight_yield, weight_risk), k)
+
+    def rank_batch(self, weight_yield: Union[float, Sequence[float]],
+                   weight_risk: Union[float, Sequence[float]], k: Optional[int] = None) -> List[List]:
+        """Top-k vaults per user"""
+        return [take_vaults(self.vaults, row) for row in self.rank_batch_indices(weight_yield, weight_risk, k)]
+
+    def rank_by(self, field: str, k: Optional[int] = None) -> RankedVaults:
+        """Top-k vaults by one score input, e.g. "vault_score", built when they are read"""
+        return RankedVaults(self.vaults, top_k_indices(self.features[field], k))
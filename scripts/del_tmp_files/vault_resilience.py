@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_resilience.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Tail-latency protection for vault fetchers: adaptive timeouts, hedged requests, retries and circuit breakers
+"""
+################################################################################
+# built-in modules
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# developed modules
+from latency_tracker import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+################################################################################
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    '''
+    closed -> open after failure_threshold consecutive failures,
+    open -> half_open after cooldown seconds, a half_open trial closes it on success
+    and re-opens it on failure.
+    '''
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial_running = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._trial_running = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release_trial(self) -> None:
+        """Free the half_open trial slot of a call that ended without an outcome, e.g. cancelled"""
+        self._trial_running = False
+
+################################################################################
+# Resilience policy
+class ResiliencePolicy:
+    '''
+    Wraps the calls to one upstream.
+
+    - timeout: p99 of recent latencies * timeout_multiplier, clamped to [min_timeout, max_timeout],
+      default_timeout until min_samples latencies were seen. max_timeout defaults to the share of
+      the caller's deadline (the network deadline of VaultSourcingSystem) that leaves room for
+      every retry and its backoff
+    - hedging: when an attempt has not answered after the p95 latency, a duplicate is sent and
+      the first successful answer wins, the loser is cancelled
+    - retries: failed attempts are retried with exponential backoff and jitter
+    - circuit breaker: while open, the last good result is served instead of calling upstream
+
+    call() answers (value, is_stale), is_stale is True when value is that last good result.
+    '''
+    def __init__(self, name: str, deadline: float = 10.0, default_timeout: float = 4.0, min_timeout: float = 0.5,
+                 max_timeout: Optional[float] = None, timeout_multiplier: float = 2.0, min_samples: int = 20,
+                 hedge: bool = True, max_retries: int = 1, backoff_base: float = 0.2,
+                 failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.deadline = deadline
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.min_samples = min_samples
+        self.hedge = hedge
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.latency = LatencyTracker()
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+
+        self.last_good: Any = None
+        self.calls = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.served_stale = 0
+
+    def attempt_budget(self, deadline: Optional[float] = None) -> float:
+        """Longest attempt that keeps every retry and its worst-case backoff inside deadline"""
+        deadline = self.deadline if deadline is None else deadline
+        backoff = sum(self.backoff_base * (2 ** attempt) * 1.5 for attempt in range(self.max_retries))
+        budget = max(self.min_timeout, (deadline - backoff) / (self.max_retries + 1))
+        return budget if self.max_timeout is None else min(self.max_timeout, budget)
+
+    def timeout(self, deadline: Optional[float] = None) -> float:
+        max_timeout = self.attempt_budget(deadline)
+        if len(self.latency) < self.min_samples:
+            return min(self.default_timeout, max_timeout)
+        p99 = self.latency.percentile(99)
+        return min(max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+
+    def hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latency) < self.min_samples:
+            return None
+        return self.latency.percentile(95)
+
+    async def call(self, fetch: Callable[[], Awaitable[Any]], deadline: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Call fetch under the policy, serves the last good result while the circuit is open.
+        Returns (value, is_stale).
+
+        Args:
+            fetch: Coroutine function calling upstream
+            deadline: Seconds the caller waits for the answer, defaults to self.deadline
+        """
+        self.calls += 1
+        if not self.breaker.allow():
+            return self._serve_stale(CircuitOpenError(f"{self.name} circuit is open"))
+
+        timeout = self.timeout(deadline)
+        last_error: Optional[BaseException] = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self.retries += 1
+                    await asyncio.sleep(self.backoff_base * (2 ** (attempt - 1)) * (0.5 + random.random()))
+                try:
+                    result = await self._hedged_attempt(fetch, timeout)
+                except Exception as e:
+                    last_error = e
+                    continue
+                self.breaker.record_success()
+                self.last_good = result
+                return result, False
+        finally:
+            # a cancelled half_open trial must not keep the breaker from ever trying again
+            self.breaker.release_trial()
+
+        self.breaker.record_failure()
+        return self._serve_stale(last_error)
+
+    def _serve_stale(self, error: BaseException) -> Tuple[Any, bool]:
+        if self.last_good is None:
+            raise error
+        self.served_stale += 1
+        logger.warning(f"{self.name} upstream unhealthy ({str(error) or type(error).__name__}), serving last good snapshot")
+        return self.last_good, True
+
+    async def _hedged_attempt(self, fetch: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        deadline = time.monotonic() + timeout
+        start = time.monotonic()
+        tasks = {asyncio.ensure_future(fetch())}
+        hedge_delay = self.hedge_delay()
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=min(hedge_delay, deadline - time.monotonic()))
+                if not done and time.monotonic() < deadline:
+                    self.hedges_sent += 1
+                    hedge = asyncio.ensure_future(fetch())
+                    hedge.is_hedge = True
+                    tasks.add(hedge)
+
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if getattr(task, "is_hedge", False):
+                            self.hedges_won += 1
+                        self.latency.record(time.monotonic() - start)
+                        return task.result()
+                    last_error = task.exception()
+            if pending or last_error is None:
+                self.timeouts += 1
+                raise asyncio.TimeoutError(f"{self.name} upstream did not answer within {timeout:.2f} s")
+            raise last_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.breaker.state,
+            "timeout_s": self.timeout(),
+            "p50_ms": (self.latency.percentile(50) or 0) * 1000,
+            "p95_ms": (self.latency.percentile(95) or 0) * 1000,
+            "p99_ms": (self.latency.percentile(99) or 0) * 1000,
+            "calls": self.calls,
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "served_stale": self.served_stale,
+        }
+
+################################################################################
+# Process-wide policies, one per upstream
+_policies: Dict[str, ResiliencePolicy] = {}
+
+def configure_resilience(name: str, **kwargs) -> ResiliencePolicy:
+    """
+    Replace the policy of an upstream.
+
+    Args:
+        name: Upstream name, e.g. the network
+        **kwargs: Keyword arguments of ResiliencePolicy
+    """
+    _policies[name] = ResiliencePolicy(name, **kwargs)
+    return _policies[name]
+
+def get_resilience(name: str) -> ResiliencePolicy:
+    policy = _policies.get(name)
+    if policy is None:
+        policy = _policies[name] = ResiliencePolicy(name)
+    return policy
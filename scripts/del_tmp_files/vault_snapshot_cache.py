@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_snapshot_cache.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Process-wide vault snapshot cache with TTL, stale-while-revalidate and single-flight loads
+"""
+################################################################################
+# built-in modules
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+################################################################################
+# Snapshot cache
+class SnapshotEntry:
+    __slots__ = ("value", "fetched_at", "size")
+
+    def __init__(self, value: Any, fetched_at: float, size: int):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.size = size
+
+class StaleSnapshot:
+    '''
+    Loader result standing for an old snapshot served because upstream is failing. It is handed
+    to the callers waiting on the load as is, but never stored, so it cannot earn a fresh TTL.
+    '''
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+class VaultSnapshotCache:
+    '''
+    Cache of vault snapshots keyed by network.
+
+    - age < ttl: served from cache
+    - ttl <= age < ttl + stale_ttl: served stale while one background task refreshes it
+    - older or missing: the caller waits for a load, concurrent callers share that single load
+    Entries are evicted least recently used first when max_entries or max_items is exceeded.
+    A loader returning a StaleSnapshot leaves the cached entry, if any, untouched.
+    '''
+    def __init__(self, ttl: float = 60.0, stale_ttl: float = 300.0, max_entries: int = 32,
+                 max_items: Optional[int] = None, sizeof: Callable[[Any], int] = len):
+        """
+        Args:
+            ttl (float): Seconds a snapshot is considered fresh
+            stale_ttl (float): Extra seconds a snapshot may be served stale while it is refreshed
+            max_entries (int): Maximum number of cached snapshots
+            max_items (int): Maximum number of vaults over all snapshots, None for no limit
+            sizeof (callable): Returns the size of a snapshot in items
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_items = max_items
+        self.sizeof = sizeof
+
+        self._entries: "OrderedDict[Hashable, SnapshotEntry]" = OrderedDict()
+        # keyed by (event loop, key) like the sessions of vault_http_pool: a task only runs on
+        # the loop that created it, so callers on another loop start their own load
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+        self._total_items = 0
+
+        # counters
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.evictions = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the snapshot for key, loading it with loader when needed.
+
+        Args:
+            key: Cache key, usually the network name
+            loader: Coroutine function fetching the snapshot from upstream
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._start_load(key, loader)
+                return entry.value
+
+        self.misses += 1
+        if (asyncio.get_running_loop(), key) in self._inflight:
+            self.coalesced += 1
+        task = self._start_load(key, loader)
+        # shield so a caller hitting its own deadline does not cancel the shared load
+        return await asyncio.shield(task)
+
+    def _start_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        inflight_key = (asyncio.get_running_loop(), key)
+        task = self._inflight.get(inflight_key)
+        if task is None or task.done():
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(self._consume_exception)
+        return task
+
+    @staticmethod
+    def _consume_exception(task: asyncio.Task) -> None:
+        # background refreshes may fail with nobody awaiting them
+        if not task.cancelled():
+            task.exception()
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            self.loads += 1
+            value = await loader()
+        except Exception:
+            self.load_errors += 1
+            raise
+        finally:
+            self._inflight.pop((asyncio.get_running_loop(), key), None)
+        if not isinstance(value, StaleSnapshot):
+            self.put(key, value)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a snapshot, evicting old ones if the cache is over its limits"""
+        self.invalidate(key)
+        entry = SnapshotEntry(value, time.monotonic(), self.sizeof(value))
+        self._entries[key] = entry
+        self._total_items += entry.size
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries
+            or (self.max_items is not None and self._total_items > self.max_items)
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._total_items -= evicted.size
+            self.evictions += 1
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Return the cached snapshot regardless of its age, without counting a hit"""
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def invalidate(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_items -= entry.size
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._total_items = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "items": self._total_items,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
+
+################################################################################
+# Process-wide cache
+_shared_cache: Optional[VaultSnapshotCache] = None
+
+def configure_shared_snapshot_cache(**kwargs) -> VaultSnapshotCache:
+    """
+    Replace the process-wide snapshot cache.
+
+    Args:
+        **kwargs: Keyword arguments of VaultSnapshotCache
+    """
+    global _shared_cache
+    _shared_cache = VaultSnapshotCache(**kwargs)
+    return _shared_cache
+
+def get_shared_snapshot_cache() -> VaultSnapshotCache:
+    """Return the process-wide snapshot cache used by all VaultSourcingSystem instances"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = VaultSnapshotCache()
+    return _shared_cache
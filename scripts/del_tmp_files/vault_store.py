@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_store.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Compact columnar in-memory store of a vault snapshot
+"""
+################################################################################
+# built-in modules
+import sys
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+# third-party modules
+import numpy as np
+from pydantic import TypeAdapter
+
+# developed modules
+from vault_models import Vault_EVM
+
+################################################################################
+# Column types
+class StringColumn:
+    '''
+    High-cardinality strings (addresses, names, descriptions) kept as one utf-8 buffer
+    plus an offsets array instead of one Python str object per row.
+    '''
+    __slots__ = ("buffer", "offsets")
+
+    def __init__(self, buffer: bytes, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: Sequence[str]) -> "StringColumn":
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def take(self, indices: np.ndarray) -> "StringColumn":
+        return StringColumn.from_strings([self[i] for i in indices])
+
+    @classmethod
+    def concat(cls, columns: Sequence["StringColumn"]) -> "StringColumn":
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for column in columns:
+            offsets.append(column.offsets[1:] + base)
+            base += len(column.buffer)
+        return cls(b"".join(column.buffer for column in columns), np.concatenate(offsets))
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer) + self.offsets.nbytes
+
+class DictColumn:
+    '''
+    Low-cardinality strings (network, protocol, token symbol) as int32 codes into a
+    list of interned categories.
+    '''
+    __slots__ = ("codes", "categories", "_lookup")
+
+    def __init__(self, codes: np.ndarray, categories: List[str]):
+        self.codes = codes
+        self.categories = categories
+        self._lookup = {value: code for code, value in enumerate(categories)}
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> "DictColumn":
+        lookup: Dict[str, int] = {}
+        codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32)
+        return cls(codes, [sys.intern(value) for value in lookup])
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i: int) -> str:
+        return self.categories[self.codes[i]]
+
+    def code_of(self, value: str) -> int:
+        """Code of a category, -1 if it does not occur in the column"""
+        return self._lookup.get(value, -1)
+
+    def take(self, indices: np.ndarray) -> "DictColumn":
+        return DictColumn(self.codes[indices], self.categories)
+
+    @classmethod
+    def concat(cls, columns: Sequence["DictColumn"]) -> "DictColumn":
+        lookup: Dict[str, int] = {}
+        codes = []
+        for column in columns:
+            remap = np.array([lookup.setdefault(value, len(lookup)) for value in column.categories], dtype=np.int32)
+            codes.append(remap[column.codes] if len(remap) else column.codes)
+        return cls(np.concatenate(codes) if codes else np.empty(0, dtype=np.int32), list(lookup))
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes
+
+class ListDictColumn:
+    '''
+    Per-row lists of low-cardinality strings (tags): flat int32 codes + row offsets.
+    '''
+    __slots__ = ("codes", "offsets", "categories")
+
+    def __init__(self, codes: np.ndarray, offsets: np.ndarray, categories: List[str]):
+        self.codes = codes
+        self.offsets = offsets
+        self.categories = categories
+
+    @classmethod
+    def from_lists(cls, values: Sequence[Sequence[str]]) -> "ListDictColumn":
+        lookup: Dict[str, int] = {}
+        codes = np.fromiter((lookup.setdefault(item, len(lookup)) for row in values for item in row), dtype=np.int32)
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in values], out=offsets[1:])
+        return cls(codes, offsets, [sys.intern(value) for value in lookup])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i: int) -> List[str]:
+        return [self.categories[code] for code in self.codes[self.offsets[i]:self.offsets[i + 1]]]
+
+    def take(self, indices: np.ndarray) -> "ListDictColumn":
+        return ListDictColumn.from_lists([self[i] for i in indices])
+
+    @classmethod
+    def concat(cls, columns: Sequence["ListDictColumn"]) -> "ListDictColumn":
+        return cls.from_lists([row for column in columns for row in (column[i] for i in range(len(column)))])
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.offsets.nbytes
+
+################################################################################
+# Column layout: name -> (kind, path in the get-vaults record)
+NUMERIC_COLUMNS = {
+    "chain_id": (np.int64, ("chainId",)),
+    "number_of_holders": (np.int64, ("numberOfHolders",)),  # 0 where unknown, see number_of_holders_known
+    "number_of_holders_known": (np.bool_, ("numberOfHolders",)),
+    "tvl_usd": (np.float64, ("tvlUsd",)),
+    "token_decimals": (np.int16, ("token", "decimals")),
+    "apy_base_1day": (np.float64, ("apy", "base", "1day")),
+    "apy_base_7day": (np.float64, ("apy", "base", "7day")),
+    "apy_base_30day": (np.float64, ("apy", "base", "30day")),
+    "apy_1day": (np.float64, ("apy", "total", "1day")),
+    "apy_7day": (np.float64, ("apy", "total", "7day")),
+    "apy_30day": (np.float64, ("apy", "total", "30day")),
+    "vault_score": (np.float64, ("scores", "vaultScore")),
+    "vault_tvl_score": (np.float64, ("scores", "vaultTvlScore")),
+    "protocol_tvl_score": (np.float64, ("scores", "protocolTvlScore")),
+    "holder_score": (np.float64, ("scores", "holderScore")),
+    "network_score": (np.float64, ("scores", "networkScore")),
+    "asset_score": (np.float64, ("scores", "assetScore")),
+    "has_withdraw_delay": (np.bool_, ("hasWithdrawDelay",)),
+}
+STRING_COLUMNS = {
+    "address": ("address",),
+    "name": ("name",),
+    "description": ("description",),
+    "tvl_native": ("tvlNative",),  # kept as exact digits, values exceed int64
+    "tvl_usd_text": ("tvlUsd",),  # upstream string as sent, tvl_usd is its float64 for ranking and filters
+}
+DICT_COLUMNS = {
+    "network": ("network",),
+    "protocol": ("protocol",),
+    "token_name": ("token", "name"),
+    "token_symbol": ("token", "symbol"),
+    "token_address": ("token", "address"),
+    "score_provider": ("scores", "provider"),
+}
+LIST_COLUMNS = {
+    "tags": ("tags",),
+}
+
+# missing APY periods default to 0 like APYMetrics
+_NUMERIC_DEFAULTS = {name: 0 for name in NUMERIC_COLUMNS if name.startswith("apy_")}
+
+# default of a required field, reported as missing by from_records
+_MISSING = object()
+
+def _get_path(record: Dict[str, Any], path: Tuple[str, ...], default: Any = None) -> Any:
+    value = record
+    for key in path:
+        if not isinstance(value, dict):
+            return default
+        value = value.get(key)
+    return default if value is None else value
+
+class VaultRecordError(ValueError):
+    """A record field that does not fit the store layout, index is the record's position in the batch"""
+    def __init__(self, index: int, field: str, reason: str):
+        super().__init__(f"vault {index}: {field} {reason}")
+        self.index = index
+        self.field = field
+        self.reason = reason
+
+def _as_str(value: Any) -> str:
+    if type(value) is not str:
+        raise TypeError(value)
+    return value
+
+def _as_bool(value: Any) -> bool:
+    if type(value) is not bool:
+        raise TypeError(value)
+    return value
+
+def _as_tags(value: Any) -> List[str]:
+    if type(value) is not list or not all(type(tag) is str for tag in value):
+        raise TypeError(value)
+    return value
+
+def _convert_column(values: List[Any], convert: Any, path: Tuple[str, ...]) -> list:
+    """Convert one column in a single pass, the records are only walked again to name a failure"""
+    try:
+        return [convert(value) for value in values]
+    except (TypeError, ValueError):
+        for index, value in enumerate(values):
+            try:
+                convert(value)
+            except (TypeError, ValueError):
+                reason = "is missing" if value is _MISSING else f"is invalid: {value!r:.60}"
+                raise VaultRecordError(index, ".".join(path), reason) from None
+        raise
+
+_VAULT_LIST = TypeAdapter(List[Vault_EVM])
+
+################################################################################
+# Columnar store
+class VaultColumnStore:
+    '''
+    One vault snapshot as typed numpy columns.
+
+    Acts as a read-only sequence of Vault_EVM: the Pydantic object of a row is only built
+    when that row is indexed, so ranking, filtering and caching work on the arrays.
+
+    Rows come back as they were received, except that a null numberOfHolders comes back
+    as "" (Vault_EVM.numberOfHolders is a str), the same as an empty one.
+    '''
+    def __init__(self, columns: Dict[str, Any]):
+        self.columns = columns
+        self._length = len(columns["chain_id"])
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]]) -> "VaultColumnStore":
+        """
+        Build the store straight from the get-vaults JSON records, without a Pydantic
+        object per vault. Each column is type checked as it is converted, raises
+        VaultRecordError on the first record with a missing or mistyped field.
+        """
+        values: Dict[str, Any] = {}
+        for name, (dtype, path) in NUMERIC_COLUMNS.items():
+            if name.startswith("number_of_holders"):
+                continue
+            convert = _as_bool if dtype is np.bool_ else int if np.issubdtype(dtype, np.integer) else float
+            column = [_get_path(record, path, _NUMERIC_DEFAULTS.get(name, _MISSING)) for record in records]
+            values[name] = np.array(_convert_column(column, convert, path), dtype=dtype)
+        # a null or empty holder count is unknown, kept apart from a count of 0
+        holders = [_get_path(record, ("numberOfHolders",), "") for record in records]
+        known = [value != "" for value in holders]
+        values["number_of_holders_known"] = np.array(known, dtype=np.bool_)
+        values["number_of_holders"] = np.array(_convert_column(
+            [value if is_known else 0 for value, is_known in zip(holders, known)], int, ("numberOfHolders",)),
+            dtype=np.int64)
+        for name, path in {**STRING_COLUMNS, **DICT_COLUMNS}.items():
+            values[name] = _convert_column([_get_path(record, path, _MISSING) for record in records], _as_str, path)
+        for name, path in LIST_COLUMNS.items():
+            values[name] = _convert_column([_get_path(record, path, _MISSING) for record in records], _as_tags, path)
+        return cls.from_columns(values)
+
+    @classmethod
+    def from_columns(cls, values: Dict[str, Sequence[Any]]) -> "VaultColumnStore":
+        """
+        Build the store from one sequence (or array) per column, used by the network
+        normalizers to map upstream rows in batches. Every column of the layout is required.
+        """
+        columns: Dict[str, Any] = {}
+        for name, (dtype, _) in NUMERIC_COLUMNS.items():
+            column = values[name]
+            if isinstance(column, np.ndarray) or dtype is np.bool_:
+                columns[name] = np.asarray(column, dtype=dtype)
+            elif np.issubdtype(dtype, np.integer):
+                columns[name] = np.array([int(value) for value in column], dtype=dtype)
+            else:
+                columns[name] = np.array([float(value) for value in column], dtype=dtype)
+        for name in STRING_COLUMNS:
+            columns[name] = StringColumn.from_strings(values[name])
+        for name in DICT_COLUMNS:
+            columns[name] = DictColumn.from_strings(values[name])
+        for name in LIST_COLUMNS:
+            columns[name] = ListDictColumn.from_lists(values[name])
+        return cls(columns)
+
+    @classmethod
+    def from_vaults(cls, vaults: Sequence[Vault_EVM]) -> "VaultColumnStore":
+        return cls.from_records([vault.model_dump(by_alias=True) for vault in vaults])
+
+    @classmethod
+    def concat(cls, stores: Sequence["VaultColumnStore"]) -> "VaultColumnStore":
+        if not stores:
+            return cls.from_records([])
+        columns = {}
+        for name, column in stores[0].columns.items():
+            parts = [store.columns[name] for store in stores]
+            columns[name] = np.concatenate(parts) if isinstance(column, np.ndarray) else type(column).concat(parts)
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Vault_EVM, List[Vault_EVM]]:
+        if isinstance(i, slice):
+            return self.to_vaults(range(*i.indices(self._length)))
+        if i < 0:
+            i += self._length
+        if not 0 <= i < self._length:
+            raise IndexError("vault index out of range")
+        return self.to_vault(i)
+
+    def __iter__(self) -> Iterator[Vault_EVM]:
+        for i in range(self._length):
+            yield self.to_vault(i)
+
+    def column(self, name: str) -> Any:
+        return self.columns[name]
+
+    def key(self, i: int) -> Tuple[int, str]:
+        """Natural key of a vault: (chainId, address)"""
+        return int(self.columns["chain_id"][i]), self.columns["address"][i]
+
+    def score_features(self) -> Dict[str, np.ndarray]:
+        """Score inputs for VaultRankingEngine, shared without copying"""
+        return {name: self.columns[name] for name in (
+            "apy_1day", "apy_7day", "apy_30day", "vault_score", "vault_tvl_score",
+            "protocol_tvl_score", "holder_score", "network_score", "asset_score")}
+
+    def take(self, indices: Sequence[int]) -> "VaultColumnStore":
+        """New store holding the given rows"""
+        indices = np.asarray(indices, dtype=np.intp)
+        return VaultColumnStore({name: column[indices] if isinstance(column, np.ndarray) else column.take(indices)
+                                 for name, column in self.columns.items()})
+
+    def record(self, i: int) -> Dict[str, Any]:
+        """Row i in the get-vaults JSON shape"""
+        return self.records([i])[0]
+
+    def records(self, indices: Sequence[int]) -> List[Dict[str, Any]]:
+        """Rows in the get-vaults JSON shape, each column is read once for all of them"""
+        indices = np.asarray(indices, dtype=np.intp)
+        c = self.columns
+        v = {name: c[name][indices].tolist() for name in NUMERIC_COLUMNS}
+        for name in STRING_COLUMNS:
+            buffer, offsets = c[name].buffer, c[name].offsets
+            v[name] = [buffer[start:end].decode("utf-8")
+                       for start, end in zip(offsets[indices].tolist(), offsets[indices + 1].tolist())]
+        for name in DICT_COLUMNS:
+            categories = c[name].categories
+            v[name] = [categories[code] for code in c[name].codes[indices].tolist()]
+        v["tags"] = [c["tags"][i] for i in indices.tolist()]
+        return [{
+            "address": v["address"][j],
+            "chainId": v["chain_id"][j],
+            "name": v["name"][j],
+            "description": v["description"][j],
+            "protocol": v["protocol"][j],
+            "numberOfHolders": str(v["number_of_holders"][j]) if v["number_of_holders_known"][j] else "",
+            "tvlUsd": v["tvl_usd_text"][j],
+            "tvlNative": v["tvl_native"][j],
+            "token": {
+                "name": v["token_name"][j],
+                "symbol": v["token_symbol"][j],
+                "address": v["token_address"][j],
+                "decimals": v["token_decimals"][j],
+            },
+            "apy": {
+                "base": {"1day": v["apy_base_1day"][j], "7day": v["apy_base_7day"][j],
+                         "30day": v["apy_base_30day"][j]},
+                "total": {"1day": v["apy_1day"][j], "7day": v["apy_7day"][j], "30day": v["apy_30day"][j]},
+            },
+            "scores": {
+                "provider": v["score_provider"][j],
+                "assetScore": v["asset_score"][j],
+                "vaultScore": v["vault_score"][j],
+                "holderScore": v["holder_score"][j],
+                "networkScore": v["network_score"][j],
+                "vaultTvlScore": v["vault_tvl_score"][j],
+                "protocolTvlScore": v["protocol_tvl_score"][j],
+            },
+            "hasWithdrawDelay": v["has_withdraw_delay"][j],
+            "network": v["network"][j],
+            "tags": v["tags"][j],
+        } for j in range(len(indices))]
+
+    def to_vault(self, i: int) -> Vault_EVM:
+        """Build the Pydantic model of a single row"""
+        return self.to_vaults([i])[0]
+
+    def to_vaults(self, indices: Sequence[int]) -> List[Vault_EVM]:
+        """Build the Pydantic models of the given rows, validated in one call"""
+        return _VAULT_LIST.validate_python(self.records(indices))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: vault_stream_parser.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Incremental parser for get-vaults responses, yields vaults while the body is downloading
+"""
+################################################################################
+# built-in modules
+import codecs
+import json
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List
+
+# developed modules
+from vault_models import Vault_EVM
+from vault_store import VaultColumnStore, VaultRecordError
+
+################################################################################
+# Incremental parser
+_WHITESPACE = " \t\n\r"
+
+class VaultStreamParseError(ValueError):
+    pass
+
+class VaultArrayStreamParser:
+    '''
+    Push parser for a JSON object of the shape {"...": ..., "data": [{...}, {...}]}.
+
+    Bytes are fed as they arrive, every element of the array is returned as soon as its
+    closing brace has been received. Only the unfinished element is kept in the buffer,
+    so memory is bounded by the largest vault rather than by the whole payload.
+    '''
+    def __init__(self, array_key: str = "data"):
+        self.array_key = array_key
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        # start -> key -> colon -> value (other keys) / array -> done
+        self._state = "start"
+        self._key = None
+
+    def feed(self, chunk: bytes) -> List[Dict[str, Any]]:
+        """Add received bytes and return the array elements completed by them"""
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(chunk)
+        self._pos = 0
+        return self._parse(final=False)
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Signal the end of the body, raises VaultStreamParseError if it was incomplete"""
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(b"", final=True)
+        self._pos = 0
+        items = self._parse(final=True)
+        if self._state != "done":
+            raise VaultStreamParseError(f"Response ended before the '{self.array_key}' array was complete")
+        return items
+
+    def _skip_whitespace(self) -> bool:
+        buffer, pos = self._buffer, self._pos
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        self._pos = pos
+        return pos < len(buffer)
+
+    def _decode(self, final: bool):
+        """Decode one complete JSON value at the current position, None if more bytes are needed"""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError as e:
+            if final:
+                raise VaultStreamParseError(f"Malformed get-vaults response: {e}") from e
+            return None
+        # a bare number at the end of the buffer may still be growing
+        if end == len(self._buffer) and not final and not isinstance(value, (dict, list, str)):
+            return None
+        self._pos = end
+        return (value,)
+
+    def _expect(self, char: str) -> None:
+        if self._buffer[self._pos] != char:
+            raise VaultStreamParseError(
+                f"Malformed get-vaults response: expected '{char}' at '{self._buffer[self._pos:self._pos + 20]}'")
+        self._pos += 1
+
+    def _parse(self, final: bool) -> List[Dict[str, Any]]:
+        items = []
+        while self._state != "done" and self._skip_whitespace():
+            char = self._buffer[self._pos]
+            if self._state == "start":
+                self._expect("{")
+                self._state = "key"
+            elif self._state == "key":
+                if char == "}":
+                    raise VaultStreamParseError(f"get-vaults response has no '{self.array_key}' array")
+                if char == ",":
+                    self._pos += 1
+                    continue
+                decoded = self._decode(final)
+                if decoded is None:
+                    break
+                self._key = decoded[0]
+                self._state = "colon"
+            elif self._state == "colon":
+                self._expect(":")
+                self._state = "array_start" if self._key == self.array_key else "value"
+            elif self._state == "value":
+                # other top-level keys (itemsOnPage, ...) are decoded and dropped
+                if self._decode(final) is None:
+                    break
+                self._state = "key"
+            elif self._state == "array_start":
+                self._expect("[")
+                self._state = "array"
+            elif self._state == "array":
+                if char == ",":
+                    self._pos += 1
+                    continue
+                if char == "]":
+                    self._pos += 1
+                    self._state = "done"
+                    continue
+                decoded = self._decode(final)
+                if decoded is None:
+                    break
+                items.append(decoded[0])
+        return items
+
+################################################################################
+# Async helpers
+async def iter_vault_records(chunks: AsyncIterable[bytes], array_key: str = "data") -> AsyncIterator[Dict[str, Any]]:
+    """Yield the raw vault dicts of a streamed get-vaults body"""
+    parser = VaultArrayStreamParser(array_key)
+    async for chunk in chunks:
+        for record in parser.feed(chunk):
+            yield record
+    for record in parser.close():
+        yield record
+
+async def iter_vaults(chunks: AsyncIterable[bytes], array_key: str = "data") -> AsyncIterator[Vault_EVM]:
+    """Yield each vault validated as Vault_EVM as soon as it is complete"""
+    async for record in iter_vault_records(chunks, array_key):
+        yield Vault_EVM.model_validate(record)
+
+def _records_to_store(records: List[Dict[str, Any]], first: int) -> VaultColumnStore:
+    """
+    Convert a batch, raises VaultStreamParseError naming the first invalid vault
+    (first is the position of records[0] in the array)
+    """
+    try:
+        return VaultColumnStore.from_records(records)
+    except VaultRecordError as e:
+        raise VaultStreamParseError(f"Invalid vault {first + e.index} in get-vaults response: "
+                                    f"{e.field} {e.reason}") from e
+
+async def build_store(chunks: AsyncIterable[bytes], batch_size: int = 256,
+                      array_key: str = "data") -> VaultColumnStore:
+    """
+    Build a VaultColumnStore from a streamed body, validating and converting batch_size
+    records at a time so the raw dicts of the whole payload are never held together.
+    Raises VaultStreamParseError on a malformed body or a vault with a missing or mistyped field.
+    """
+    batches, pending, converted = [], [], 0
+    async for record in iter_vault_records(chunks, array_key):
+        pending.append(record)
+        if len(pending) >= batch_size:
+            batches.append(_records_to_store(pending, converted))
+            converted += len(pending)
+            pending = []
+    if pending or not batches:
+        batches.append(_records_to_store(pending, converted))
+    return batches[0] if len(batches) == 1 else VaultColumnStore.concat(batches)
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Filename: rag_init.py
+Filename: json2csv_data_process.py
 Author: Zhou Nan
 Date: 2025-03-18
-Description: Initialize the RAG system for the initial check and setup if needed
+Description: Convert the chain token lists into knowledge base files and keep the token index, vector index and database in sync
 """
 ################################################################################
 # system settings
@@ -15,193 +15,510 @@ os.chdir(root_dir)
 sys.path.append(root_dir)
 
 # built-in modules
+import asyncio
+import csv
+import glob
+import hashlib
 import json
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
 from pydantic import BaseModel
-import pandas as pd
 
 # developed modules
+from kb_bulk_loader import KnowledgeBaseBulkLoader
+from kb_columnar import KB_COLUMNS, KbColumnarReader, KbColumnarWriter
+from kb_vector_index import HashingEmbedder, KbVectorIndex
+from token_index import TokenIndex
 from app.core.logging_setting import logger
-from app.core.config import Config
 from app.core.database import db_connection_pool
 ################################################################################
 store_dir = os.path.join(root_dir, 'app/rag_system/preliminary_system_data/kb_1/')
+raw_dir = os.path.join(root_dir, 'scripts/raw_data/rag/')
+# content hashes of the last build, and the row deltas of its generation (outside store_dir so
+# the knowledge base loader does not pick them up as documents)
+manifest_path = os.path.join(root_dir, 'app/rag_system/preliminary_system_data/kb_1_manifest.json')
+delta_dir = os.path.join(root_dir, 'app/rag_system/preliminary_system_data/kb_1_delta/')
+# prebuilt TokenIndex for exact/prefix/fuzzy token lookups outside the vector store
+token_index_path = os.path.join(root_dir, 'app/rag_system/preliminary_system_data/token_index.bin')
+# local vector index over the knowledge base rows, kept in sync by --vector-index
+vector_index_dir = os.path.join(root_dir, 'app/rag_system/preliminary_system_data/kb_1_vectors/')
+# knowledge base table loaded by --load-db
+kb_db_name = 'blueprint_service'
+kb_table_name = 'knowledge_base'
 ################################################################################
-# main function
-def base_token_data_process():
-    target_kb_id = 1
-    # scripts/raw_data/rag/base.tokens.json
-    file_path = os.path.join(root_dir, 'scripts/raw_data/rag/base.tokens.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    data = data['data']
-    # -----------------------------------------------------------------------# 
-    class Network(BaseModel):
-        name: str
-        chainId: int
-    class TokenData(BaseModel):
-        address: str
-        name: str
-        symbol: str
-        decimals: int
-        network: Network
-        
-    data = [TokenData(**item) for item in data]
-    # -----------------------------------------------------------------------# 
-    ## parse data 
-    columns = ['key', 'value', 'tags', 'kb_id', 'user_id', 'meta_data']
-    data = [
-        {
-            'key': f"{item.name} ({item.symbol})",
-            'value': f"Token Name: {item.name} - Token Asset Address: {item.address} - Token Symbol: {item.symbol} - Token Decimals: {item.decimals} - Network: {item.network.name} - Chain ID: {item.network.chainId}",
-            'tags': json.dumps(["token", "base"])   ,
-            'kb_id': target_kb_id,
-            'user_id': '0',
-            'meta_data': {}
-        } for item in data
-    ]
-    # create a data_pd dataframe
-    data_pd = pd.DataFrame(data)
-    # -----------------------------------------------------------------------# 
-    # store data to csv file
-    file_name = f'base_tokens_(kb_{target_kb_id}).csv'
-    file_path = os.path.join(store_dir, file_name)
-    with open(file_path, 'w') as f:
-        # store {} empty json object
-        f.write(data_pd.to_csv(index=False)) 
-    pass
-
-def arbitrum_token_data_process():
-    target_kb_id = 1
-    # scripts/raw_data/rag/arbitrum.tokens.json
-    file_path = os.path.join(root_dir, 'scripts/raw_data/rag/arbitrum.tokens.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    data = data['data']
-    # -----------------------------------------------------------------------# 
-    ## parse data 
-    columns = ['key', 'value', 'tags', 'kb_id', 'user_id', 'meta_data']
-    data = [
-        {
-            'key': f"{item['name']} ({item['symbol']})",
-            'value': f"Token Name: {item['name']} - Token Asset Address: {item['address']} - Token Symbol: {item['symbol']} - Token Decimals: {item['decimals']} - Network: {item['network']['name']} - Chain ID: {item['network']['chainId']}",
-            'tags': json.dumps(["token", "arbitrum"]),
-            'kb_id': target_kb_id,
-            'user_id': '0',
-            'meta_data': {}
-        } for item in data
-    ]
-    # create a data_pd dataframe
-    data_pd = pd.DataFrame(data)
-    # -----------------------------------------------------------------------# 
-    # store data to csv file
-    file_name = f'arbitrum_tokens_(kb_{target_kb_id}).csv'
-    file_path = os.path.join(store_dir, file_name)
-    with open(file_path, 'w') as f:
-        # store {} empty json object
-        f.write(data_pd.to_csv(index=False))
-    pass
-
-def mainnet_token_data_process():
-    target_kb_id = 1
-    # scripts/raw_data/rag/mainnet.tokens.json
-    file_path = os.path.join(root_dir, 'scripts/raw_data/rag/mainnet.tokens.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    data = data['data']
-    # -----------------------------------------------------------------------# 
-    ## parse data 
-    columns = ['key', 'value', 'tags', 'kb_id', 'user_id', 'meta_data']
-    data = [
-        {
-            'key': f"{item['name']} ({item['symbol']})",
-            'value': f"Token Name: {item['name']} - Token Asset Address: {item['address']} - Token Symbol: {item['symbol']} - Token Decimals: {item['decimals']} - Network: {item['network']['name']} - Chain ID: {item['network']['chainId']}",
-            'tags': json.dumps(["token", "mainnet"]),
-            'kb_id': target_kb_id,
-            'user_id': '0',
-            'meta_data': {}
-        } for item in data
-    ]
-    # create a data_pd dataframe
-    data_pd = pd.DataFrame(data)
-    # -----------------------------------------------------------------------# 
-    # store data to csv file
-    file_name = f'mainnet_tokens_(kb_{target_kb_id}).csv'
-    file_path = os.path.join(store_dir, file_name)
-    with open(file_path, 'w') as f:
-        # store {} empty json object
-        f.write(data_pd.to_csv(index=False))
-    pass
-
-def optimism_token_data_process():
-    target_kb_id = 1
-    # scripts/raw_data/rag/optimism.tokens.json
-    file_path = os.path.join(root_dir, 'scripts/raw_data/rag/optimism.tokens.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    data = data['data']
-    # -----------------------------------------------------------------------# 
-    columns = ['key', 'value', 'tags', 'kb_id', 'user_id', 'meta_data'] 
-    data = [
-        {
-            'key': f"{item['name']} ({item['symbol']})",
-            'value': f"Token Name: {item['name']} - Token Asset Address: {item['address']} - Token Symbol: {item['symbol']} - Token Decimals: {item['decimals']} - Network: {item['network']['name']} - Chain ID: {item['network']['chainId']}",
-            'tags': json.dumps(["token", "optimism"]),
-            'kb_id': target_kb_id,
-            'user_id': '0',
-            'meta_data': {}
-        } for item in data
-    ]
-    # create a data_pd dataframe
-    data_pd = pd.DataFrame(data)
-    # -----------------------------------------------------------------------# 
-    # store data to csv file
-    file_name = f'optimism_tokens_(kb_{target_kb_id}).csv'
-    file_path = os.path.join(store_dir, file_name)
-    with open(file_path, 'w') as f:
-        # store {} empty json object
-        f.write(data_pd.to_csv(index=False))
-    pass
-
-def polygon_token_data_process():
-    target_kb_id = 1
-    # scripts/raw_data/rag/polygon.tokens.json
-    file_path = os.path.join(root_dir, 'scripts/raw_data/rag/polygon.tokens.json')
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-    data = data['data']
-    # -----------------------------------------------------------------------# 
-    ## parse data 
-    columns = ['key', 'value', 'tags', 'kb_id', 'user_id', 'meta_data']
-    data = [
-        {
-            'key': f"{item['name']} ({item['symbol']})",
-            'value': f"Token Name: {item['name']} - Token Asset Address: {item['address']} - Token Symbol: {item['symbol']} - Token Decimals: {item['decimals']} - Network: {item['network']['name']} - Chain ID: {item['network']['chainId']}",
-            'tags': json.dumps(["token", "polygon"]),
-            'kb_id': target_kb_id,
-            'user_id': '0',
-            'meta_data': {}
-        } for item in data
-    ]
-    # create a data_pd dataframe
-    data_pd = pd.DataFrame(data)
-    # -----------------------------------------------------------------------# 
-    # store data to csv file
-    file_name = f'polygon_tokens_(kb_{target_kb_id}).csv'
-    file_path = os.path.join(store_dir, file_name)
-    with open(file_path, 'w') as f:
-        # store {} empty json object
-        f.write(data_pd.to_csv(index=False))
-    pass
-
-def main():
-    base_token_data_process()
-    arbitrum_token_data_process()
-    mainnet_token_data_process()
-    optimism_token_data_process()
-    polygon_token_data_process()
+# chain registry
+class ChainSource(BaseModel):
+    chain: str                          # network name, also the "<chain>.tokens.json" file prefix
+    tags: List[str] = []                # defaults to ["token", <chain>]
+    kb_id: int = 1
+    source_file: Optional[str] = None   # defaults to raw_dir/<chain>.tokens.json
+    output_file: Optional[str] = None   # defaults to store_dir/<chain>_tokens_(kb_<kb_id>).<csv|kbcol>
+    output_format: str = 'csv'          # 'csv' or 'columnar' (kb_columnar, memory-mappable)
+
+    def source_path(self) -> str:
+        return self.source_file or os.path.join(raw_dir, f'{self.chain}.tokens.json')
+
+    def output_path(self) -> str:
+        extension = 'kbcol' if self.output_format == 'columnar' else 'csv'
+        return self.output_file or os.path.join(store_dir, f'{self.chain}_tokens_(kb_{self.kb_id}).{extension}')
+
+    def row_tags(self) -> str:
+        return json.dumps(self.tags or ["token", self.chain])
+
+# adding a chain is one entry here; *.tokens.json files without an entry are ingested with the defaults
+CHAIN_REGISTRY: List[ChainSource] = [
+    ChainSource(chain='base'),
+    ChainSource(chain='arbitrum'),
+    ChainSource(chain='mainnet'),
+    ChainSource(chain='optimism'),
+    ChainSource(chain='polygon'),
+]
+
+CSV_COLUMNS = list(KB_COLUMNS)
+
+def discover_sources(registry: List[ChainSource] = CHAIN_REGISTRY) -> List[ChainSource]:
+    """Registry entries plus a default entry for every unregistered *.tokens.json in raw_dir"""
+    sources = list(registry)
+    registered = {os.path.abspath(source.source_path()) for source in sources}
+    for file_path in sorted(glob.glob(os.path.join(raw_dir, '*.tokens.json'))):
+        if os.path.abspath(file_path) not in registered:
+            chain = os.path.basename(file_path)[:-len('.tokens.json')]
+            logger.info(f"json2csv: {chain} is not in CHAIN_REGISTRY, ingesting with the default settings")
+            sources.append(ChainSource(chain=chain))
+    return sources
 
 ################################################################################
-if __name__ == "__main__":
-    main()
+# manifest
+MANIFEST_VERSION = 2
+DELTA_COLUMNS = ['op', 'chain_id', 'address'] + CSV_COLUMNS
+
+def file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def row_hash(row: list) -> str:
+    return hashlib.blake2b('\x1f'.join(str(value) for value in row).encode(), digest_size=16).hexdigest()
+
+def row_key(chain_id, address: str) -> str:
+    return f"{chain_id}:{address}"
+
+def load_manifest() -> Dict:
+    """
+    {"version": 2, "generation": int,
+     "sources": {chain: {"source_hash", "config_hash", "output_file", "kb_id", "tags",
+                         "rows": {"<chainId>:<address>": [row hash, knowledge base key]}}},
+     "database": {"target": "<db>.<table>", "generation": int}}
+
+    generation grows by one with every build that changed something; the deltas in delta_dir
+    turn generation - 1 into generation, so a consumer synced to generation - 1 applies them
+    and any other consumer rebuilds from the knowledge base files. The knowledge base key and
+    tags of every row are kept so a delta can delete it from the database by its natural key.
+    """
+    if not os.path.exists(manifest_path):
+        return {'version': MANIFEST_VERSION, 'generation': 0, 'sources': {}}
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('version') != MANIFEST_VERSION:
+        logger.info(f"json2csv: manifest version {manifest.get('version')} is outdated, rebuilding everything")
+        # skip a generation: the next deltas lack the removals, every consumer must rebuild
+        return {'version': MANIFEST_VERSION, 'generation': manifest.get('generation', 0) + 1, 'sources': {}}
+    manifest.setdefault('generation', 0)
+    return manifest
+
+def save_manifest(manifest: Dict) -> None:
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f'{manifest_path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def config_hash(source: ChainSource) -> str:
+    return hashlib.sha256(source.model_dump_json(exclude={'source_file'}).encode()).hexdigest()
+
+################################################################################
+# ingestion
+def iter_token_rows(source: ChainSource) -> Iterator[Tuple[str, list]]:
+    """
+    Yield (row key, CSV row in CSV_COLUMNS order) per token of source.
+
+    The knowledge base key is "Name (SYMBOL)". Different tokens of a chain can share it (native
+    and bridged USDC), those get their address appended so each keeps its own database row.
+    """
+    with open(source.source_path(), 'r') as f:
+        data = json.load(f)['data']
+    tags = source.row_tags()
+    names = Counter((item['name'], item['symbol']) for item in data)
+    for item in data:
+        network = item['network']
+        kb_key = f"{item['name']} ({item['symbol']})"
+        if names[item['name'], item['symbol']] > 1:
+            kb_key = f"{kb_key} [{item['address']}]"
+        yield row_key(network['chainId'], item['address']), [
+            kb_key,
+            f"Token Name: {item['name']} - Token Asset Address: {item['address']} - Token Symbol: {item['symbol']} - Token Decimals: {item['decimals']} - Network: {network['name']} - Chain ID: {network['chainId']}",
+            tags,
+            source.kb_id,
+            '0',
+            '{}',
+        ]
+
+def iter_kb_rows(source: ChainSource) -> Iterator[Tuple[str, list]]:
+    """
+    Yield (row key, row in CSV_COLUMNS order) of source's built knowledge base. A columnar build
+    is read through its memory-mapped file instead of parsing the token JSON again.
+    """
+    if source.output_format == 'columnar' and os.path.exists(source.output_path()):
+        for chain_id, address, row in KbColumnarReader(source.output_path()).iter_addressed_kb_rows():
+            yield row_key(chain_id, address), row
+    else:
+        yield from iter_token_rows(source)
+
+def delta_files(generation: int) -> List[str]:
+    """Delta files turning generation - 1 into generation"""
+    return sorted(glob.glob(os.path.join(delta_dir, f'*.g{generation}.delta.csv')))
+
+def iter_delta_records(generation: int, op: str) -> Iterator[Dict[str, str]]:
+    """Stream the records of one op ('upsert' or 'delete') of the deltas of generation"""
+    for delta_file in delta_files(generation):
+        with open(delta_file, 'r', newline='') as f:
+            for record in csv.DictReader(f):
+                if record['op'] == op:
+                    yield record
+
+class _DeltaWriter:
+    '''
+    Delta file of one chain and generation, written record by record to a temporary file that
+    is only kept when it received a record. A delete record carries the natural key columns
+    (key, tags, kb_id, user_id) of the row it deletes; consumers apply the deletes first.
+    '''
+    def __init__(self, chain: str, kb_id: int, generation: int):
+        self.file_path = os.path.join(delta_dir, f'{chain}_tokens_(kb_{kb_id}).g{generation}.delta.csv')
+        self._tmp_path = f'{self.file_path}.tmp'
+        self._file = None
+        self._writer = None
+        self.records = 0
+
+    def _write(self, record: list) -> None:
+        if self._writer is None:
+            os.makedirs(delta_dir, exist_ok=True)
+            self._file = open(self._tmp_path, 'w', newline='')
+            self._writer = csv.writer(self._file, lineterminator='\n')
+            self._writer.writerow(DELTA_COLUMNS)
+        self._writer.writerow(record)
+        self.records += 1
+
+    def upsert(self, key: str, row: list) -> None:
+        self._write(['upsert', *key.split(':', 1), *row])
+
+    def delete(self, key: str, kb_key: str, tags: str, kb_id: int) -> None:
+        self._write(['delete', *key.split(':', 1), kb_key, '', tags, kb_id, '0', ''])
+
+    def __enter__(self) -> "_DeltaWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self.file_path)
+        else:
+            os.remove(self._tmp_path)
 
+    def result(self) -> Optional[str]:
+        """Path of the delta file, None when there is nothing to apply"""
+        return self.file_path if self.records else None
 
+class _CsvRowWriter:
+    '''Knowledge base CSV writer, rows go to <path>.tmp which replaces path once complete'''
+    def __init__(self, file_path: str):
+        self._tmp_path = f'{file_path}.tmp'
+        self._file_path = file_path
+        self._file = open(self._tmp_path, 'w', newline='')
+        self._writer = csv.writer(self._file, lineterminator='\n')
+        self._writer.writerow(CSV_COLUMNS)
+
+    def write(self, row: list) -> None:
+        self._writer.writerow(row)
+
+    def __enter__(self) -> "_CsvRowWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        self._file.close()
+        if exc_type is None:
+            os.replace(self._tmp_path, self._file_path)
+        else:
+            os.remove(self._tmp_path)
+
+def token_data_process(source: ChainSource, generation: int, previous: Optional[Dict] = None) -> Dict:
+    """
+    Convert one chain's token list into its knowledge base file (CSV or columnar) and diff it
+    against the manifest entry of the previous build.
+
+    Rows, and their delta records, are written as they are produced, the knowledge base file
+    to a temporary file that replaces the previous file only once it is complete. A changed
+    row whose natural key (key, tags, kb_id) moved also deletes the row under its old key.
+    Runs in a worker process.
+
+    Returns:
+        {"chain", "rows", "file", "elapsed_s", "row_hashes", "added", "changed", "removed", "delta_file"}
+    """
+    start = time.perf_counter()
+    previous = previous or {}
+    previous_rows = previous.get('rows', {})
+    previous_tags, previous_kb_id = previous.get('tags'), previous.get('kb_id')
+    file_path = source.output_path()
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    rows = 0
+    row_hashes: Dict[str, list] = {}
+    added = changed = 0
+    columnar = source.output_format == 'columnar'
+    writer = KbColumnarWriter(file_path) if columnar else _CsvRowWriter(file_path)
+    with writer, _DeltaWriter(source.chain, source.kb_id, generation) as delta:
+        for key, row in iter_token_rows(source):
+            if columnar:
+                # the columnar format also stores the chain id, network and address columns
+                chain_id, address = key.split(':', 1)
+                writer.write(row, int(chain_id), source.chain, address)
+            else:
+                writer.write(row)
+            rows += 1
+            digest = row_hash(row)
+            row_hashes[key] = [digest, row[0]]
+            entry = previous_rows.get(key)
+            if entry is None:
+                delta.upsert(key, row)
+                added += 1
+            elif entry[0] != digest:
+                if (entry[1], previous_tags, previous_kb_id) != (row[0], row[2], row[3]):
+                    delta.delete(key, entry[1], previous_tags, previous_kb_id)
+                delta.upsert(key, row)
+                changed += 1
+        removed = 0
+        for key, entry in previous_rows.items():
+            if key not in row_hashes:
+                delta.delete(key, entry[1], previous_tags, previous_kb_id)
+                removed += 1
+    return {
+        'chain': source.chain, 'rows': rows, 'file': file_path, 'elapsed_s': time.perf_counter() - start,
+        'row_hashes': row_hashes, 'added': added, 'changed': changed, 'removed': removed,
+        'delta_file': delta.result(),
+    }
+
+def process_all(sources: Optional[List[ChainSource]] = None, max_workers: Optional[int] = None,
+                force: bool = False) -> List[Dict]:
+    """
+    Rebuild the knowledge base CSVs of the sources whose token file or registry entry changed
+    since the last build, in parallel. A build that changes anything starts a new manifest
+    generation: every rebuilt chain gets a delta file in delta_dir with the rows added, changed
+    or removed since the previous generation, chains dropped from the sources get a delta
+    deleting all their rows. Deltas are kept until the next generation replaces them, so
+    consumers that skip a run (update_vector_index, load_into_database) still see them.
+
+    Args:
+        sources: Chains to ingest, defaults to discover_sources()
+        max_workers: Worker processes, defaults to one per core
+        force: Rebuild every source even if unchanged, the deltas still hold the real changes
+    """
+    sources = discover_sources() if sources is None else sources
+    manifest = load_manifest()
+    previous = manifest['sources']
+    active = {source.chain for source in sources}
+    dropped = [chain for chain in previous if chain not in active]
+
+    pending = []
+    for source in sources:
+        entry = previous.get(source.chain)
+        try:
+            source_hash = file_hash(source.source_path())
+        except OSError as e:
+            # keep the previous build of the chain rather than deleting its rows
+            logger.error(f"json2csv: cannot read {source.chain} tokens: {str(e)}")
+            continue
+        if (not force and entry and entry['source_hash'] == source_hash and entry['config_hash'] == config_hash(source)
+                and entry['output_file'] == source.output_path() and os.path.exists(source.output_path())):
+            logger.info(f"json2csv: {source.chain} unchanged, skipped")
+            continue
+        pending.append((source, source_hash))
+
+    results = []
+    if not pending and not dropped:
+        return results
+
+    # a new generation replaces the deltas of the previous one
+    generation = manifest['generation'] = manifest['generation'] + 1
+    for stale in glob.glob(os.path.join(delta_dir, '*.delta.csv')):
+        os.remove(stale)
+
+    if pending:
+        max_workers = max_workers or min(len(pending), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(token_data_process, source, generation, previous.get(source.chain)): (source, source_hash)
+                for source, source_hash in pending
+            }
+            for future in as_completed(futures):
+                source, source_hash = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"json2csv: failed to ingest {source.chain} tokens: {str(e)}")
+                    continue
+                previous[source.chain] = {
+                    'source_hash': source_hash, 'config_hash': config_hash(source),
+                    'output_file': result['file'], 'kb_id': source.kb_id, 'tags': source.row_tags(),
+                    'rows': result.pop('row_hashes'),
+                }
+                logger.info(f"json2csv: {result['chain']} -> {result['rows']} rows in {result['elapsed_s']:.2f}s "
+                            f"(+{result['added']} ~{result['changed']} -{result['removed']})")
+                results.append(result)
+
+    for chain in dropped:
+        entry = previous.pop(chain)
+        with _DeltaWriter(chain, entry['kb_id'], generation) as delta:
+            for key, (_, kb_key) in entry['rows'].items():
+                delta.delete(key, kb_key, entry['tags'], entry['kb_id'])
+        delta_file = delta.result()
+        logger.info(f"json2csv: {chain} was removed from the sources, {len(entry['rows'])} rows to delete in {delta_file}")
+
+    save_manifest(manifest)
+    return results
+
+################################################################################
+# main function
+def build_token_index(sources: Optional[List[ChainSource]] = None) -> TokenIndex:
+    """Rebuild token_index_path from the token lists of sources"""
+    sources = discover_sources() if sources is None else sources
+    index = TokenIndex.from_catalogs([source.source_path() for source in sources if os.path.exists(source.source_path())])
+    os.makedirs(os.path.dirname(token_index_path), exist_ok=True)
+    index.save(token_index_path)
+    logger.info(f"json2csv: token index with {len(index)} tokens written to {token_index_path}")
+    return index
+
+async def load_into_database(sources: List[ChainSource], full: bool = False) -> Dict:
+    """
+    Bring the knowledge base table up to the manifest generation, streaming the rows in bulk and
+    upserting on the natural key. A table synced to the previous generation gets the delta files
+    (deletes included); a table never loaded from this manifest, one further behind (or full) has
+    every chain of sources deleted and reloaded. The synced generation is kept in the manifest.
+    """
+    manifest = load_manifest()
+    generation = manifest['generation']
+    target = f'{kb_db_name}.{kb_table_name}'
+    synced = manifest.get('database') or {}
+    synced_generation = synced.get('generation') if synced.get('target') == target else None
+    if not full and synced_generation == generation:
+        logger.info(f"json2csv: {kb_table_name} is at generation {generation}, nothing to load")
+        return {'rows': 0, 'deleted': 0}
+
+    if not full and synced_generation == generation - 1:
+        rows = ([record[name] if name != 'kb_id' else int(record[name]) for name in CSV_COLUMNS]
+                for record in iter_delta_records(generation, 'upsert'))
+        deletes = ({'kb_id': int(record['kb_id']), 'user_id': record['user_id'], 'key': record['key'], 'tags': record['tags']}
+                   for record in iter_delta_records(generation, 'delete'))
+        scopes = []
+    else:
+        available = [source for source in sources if os.path.exists(source.source_path())]
+        rows = (row for source in available for _, row in iter_kb_rows(source))
+        deletes = ()
+        scopes = [{'kb_id': source.kb_id, 'user_id': '0', 'tags': source.row_tags()} for source in available]
+
+    loader = KnowledgeBaseBulkLoader(db_connection_pool.get_db(kb_db_name), table_name=kb_table_name)
+    try:
+        stats = await loader.load(rows, deletes=deletes, scopes=scopes)
+    except Exception as e:
+        logger.error(f"json2csv: bulk load into {kb_table_name} failed with error: {str(e)}")
+        raise
+    manifest['database'] = {'target': target, 'generation': generation}
+    save_manifest(manifest)
+    logger.info(f"json2csv: {stats['rows']} rows loaded into and {stats['deleted']} deleted from {kb_table_name} "
+                f"with {stats['method']} in {stats['elapsed_s']:.2f}s ({stats['rows_per_s']:.0f} rows/s)")
+    return stats
+
+def rebuild_vector_index(sources: List[ChainSource], embedder: HashingEmbedder, generation: int) -> KbVectorIndex:
+    """
+    Build the vector index of every row of sources in a temporary directory that replaces
+    vector_index_dir only once it is saved, so a crash never leaves the old metadata over
+    half-written vectors
+    """
+    final_dir = vector_index_dir.rstrip(os.sep)
+    tmp_dir = f'{final_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    index = KbVectorIndex(tmp_dir, embedder)
+    for source in sources:
+        if not os.path.exists(source.source_path()):
+            continue
+        keys, texts, tags = [], [], []
+        for key, row in iter_kb_rows(source):
+            keys.append(key)
+            texts.append(row[1])
+            tags.append(json.loads(row[2]))
+        index.upsert(keys, texts, source.kb_id, tags)
+    index.sync_generation = generation
+    index.save()
+    del index
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    return KbVectorIndex.open(vector_index_dir, embedder)
+
+def update_vector_index(sources: List[ChainSource], full: bool = False) -> KbVectorIndex:
+    """
+    Bring the vector index in vector_index_dir up to the manifest generation: an index synced to
+    the previous generation applies the delta files, a missing index, an index further behind
+    (or full) is rebuilt from every row of sources
+    """
+    embedder = HashingEmbedder()
+    generation = load_manifest()['generation']
+    index = None if full or not os.path.exists(vector_index_dir) else KbVectorIndex.open(vector_index_dir, embedder)
+    if index is not None and index.sync_generation == generation:
+        logger.info(f"json2csv: vector index is at generation {generation}, nothing to apply")
+        return index
+    if index is None or index.sync_generation != generation - 1:
+        # release the old index's mapped files before its directory is replaced
+        index = None
+        index = rebuild_vector_index(sources, embedder, generation)
+        logger.info(f"json2csv: vector index rebuilt with {len(index)} rows in {vector_index_dir}")
+        return index
+    for delta_file in delta_files(generation):
+        with open(delta_file, 'r', newline='') as f:
+            records = list(csv.DictReader(f))
+        upserts = [record for record in records if record['op'] == 'upsert']
+        index.delete([f"{record['chain_id']}:{record['address']}" for record in records if record['op'] == 'delete'])
+        if upserts:
+            index.upsert([f"{record['chain_id']}:{record['address']}" for record in upserts],
+                         [record['value'] for record in upserts],
+                         [int(record['kb_id']) for record in upserts],
+                         [json.loads(record['tags']) for record in upserts])
+    index.sync_generation = generation
+    index.save()
+    logger.info(f"json2csv: vector index with {len(index)} rows written to {vector_index_dir}")
+    return index
+
+def main(force: bool = False, load_db: bool = False, output_format: Optional[str] = None,
+         vector_index: bool = False):
+    start = time.perf_counter()
+    sources = discover_sources()
+    if output_format:
+        sources = [source.model_copy(update={'output_format': output_format}) for source in sources]
+    results = process_all(sources, force=force)
+    if results or force or not os.path.exists(token_index_path):
+        build_token_index(sources)
+    if vector_index:
+        update_vector_index(sources, full=force)
+    if load_db:
+        asyncio.run(load_into_database(sources, full=force))
+    logger.info(f"json2csv: {sum(result['rows'] for result in results)} token rows from {len(results)} changed chains "
+                f"in {time.perf_counter() - start:.2f}s")
+
+################################################################################
+if __name__ == "__main__":
+    main(force='--full' in sys.argv[1:], load_db='--load-db' in sys.argv[1:],
+         output_format='columnar' if '--columnar' in sys.argv[1:] else None,
+         vector_index='--vector-index' in sys.argv[1:])
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: kb_bulk_loader.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Bulk loading of knowledge base rows into the database with COPY or batched multi-row upserts
+"""
+################################################################################
+# built-in modules
+import time
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+# third-party modules
+from sqlalchemy import and_, bindparam, column, delete, table, text
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+# developed modules
+from kb_columnar import KB_COLUMNS
+
+################################################################################
+
+# a knowledge base entry is identified by its knowledge base, owner, key and tags (the tags
+# carry the chain, so "USD Coin (USDC)" on base and on arbitrum are different entries; tokens
+# sharing a name on one chain carry their address in the key)
+NATURAL_KEY = ('kb_id', 'user_id', 'key', 'tags')
+
+class KnowledgeBaseBulkLoader:
+    '''
+    Streams knowledge base rows into the knowledge base table in large batches, inserting new
+    entries and updating existing ones on a conflict of the natural key.
+
+    - PostgreSQL on asyncpg: each batch is COPYed into a temporary staging table and merged
+      with one INSERT ... SELECT ... ON CONFLICT DO UPDATE
+    - other PostgreSQL drivers, SQLite, MySQL: batched multi-row INSERT ... ON CONFLICT DO UPDATE
+      (ON DUPLICATE KEY UPDATE)
+
+    Deletions (by natural key, or of whole scopes such as every row of a chain) run first, in
+    batched DELETE statements. The table needs a unique index over the natural key for the
+    conflict handling. Everything runs in one transaction on one pooled connection, so a failed
+    load changes nothing.
+
+    Usage:
+        loader = KnowledgeBaseBulkLoader(db)  # db: database handle with session_scope()
+        stats = await loader.load(rows)      # rows: iterable of KB_COLUMNS ordered lists
+        stats = await loader.load(rows, deletes=[{"kb_id": 1, "user_id": "0", "key": ..., "tags": ...}])
+    '''
+    def __init__(self, db, table_name: str = 'knowledge_base', natural_key: Sequence[str] = NATURAL_KEY,
+                 batch_size: int = 5000):
+        self.db = db
+        self.table_name = table_name
+        self.natural_key = tuple(natural_key)
+        self.batch_size = batch_size
+        self.table = table(table_name, *[column(name) for name in KB_COLUMNS])
+        self.update_columns = [name for name in KB_COLUMNS if name not in self.natural_key]
+
+    def _batches(self, rows: Iterable[Sequence[Any]]) -> Iterable[List[Dict[str, Any]]]:
+        """Batches of row dicts, deduplicated on the natural key (last row wins) so one statement never updates a row twice"""
+        batch: Dict[Tuple, Dict[str, Any]] = {}
+        for row in rows:
+            record = dict(zip(KB_COLUMNS, row))
+            batch[tuple(record[name] for name in self.natural_key)] = record
+            if len(batch) >= self.batch_size:
+                yield list(batch.values())
+                batch = {}
+        if batch:
+            yield list(batch.values())
+
+    def _delete_batches(self, deletes: Iterable[Dict[str, Any]]) -> Iterable[List[Dict[str, Any]]]:
+        batch: List[Dict[str, Any]] = []
+        for record in deletes:
+            batch.append({f'key_{name}': record[name] for name in self.natural_key})
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    async def _delete(self, connection, deletes: Iterable[Dict[str, Any]],
+                      scopes: Iterable[Dict[str, Any]]) -> int:
+        """Delete every row matching a scope, then the rows of deletes by natural key"""
+        deleted = 0
+        for scope in scopes:
+            statement = delete(self.table).where(and_(*[self.table.c[name] == value for name, value in scope.items()]))
+            deleted += max((await connection.execute(statement)).rowcount, 0)
+        statement = delete(self.table).where(
+            and_(*[self.table.c[name] == bindparam(f'key_{name}') for name in self.natural_key]))
+        for batch in self._delete_batches(deletes):
+            deleted += max((await connection.execute(statement, batch)).rowcount, 0)
+        return deleted
+
+    def _upsert_statement(self, dialect: str):
+        """
+        INSERT ... ON CONFLICT statement, compiled once and executed per batch through the
+        driver's executemany (multi-row VALUES where the dialect batches them)
+        """
+        if dialect == 'postgresql' or dialect == 'sqlite':
+            insert = (postgresql if dialect == 'postgresql' else sqlite).insert(self.table)
+            return insert.on_conflict_do_update(index_elements=list(self.natural_key),
+                                                set_={name: insert.excluded[name] for name in self.update_columns})
+        if dialect in ('mysql', 'mariadb'):
+            insert = mysql.insert(self.table)
+            return insert.on_duplicate_key_update({name: insert.inserted[name] for name in self.update_columns})
+        raise ValueError(f"Bulk loading is not supported on {dialect}")
+
+    async def _copy_batches(self, connection, batches: Iterable[List[Dict[str, Any]]]) -> Tuple[int, int]:
+        raw = (await connection.get_raw_connection()).driver_connection
+        staging = f'{self.table_name}_bulk_staging'
+        await connection.execute(text(f'CREATE TEMP TABLE IF NOT EXISTS {staging} '
+                                      f'(LIKE {self.table_name} INCLUDING DEFAULTS) ON COMMIT DROP'))
+        columns = ', '.join(KB_COLUMNS)
+        key = ', '.join(self.natural_key)
+        updates = ', '.join(f'{name} = EXCLUDED.{name}' for name in self.update_columns)
+        merge = text(f'INSERT INTO {self.table_name} ({columns}) '
+                     f'SELECT DISTINCT ON ({key}) {columns} FROM {staging} '
+                     f'ON CONFLICT ({key}) DO UPDATE SET {updates}')
+        loaded = count = 0
+        for batch in batches:
+            await raw.copy_records_to_table(staging, columns=list(KB_COLUMNS),
+                                            records=[tuple(record[name] for name in KB_COLUMNS) for record in batch])
+            await connection.execute(merge)
+            await connection.execute(text(f'TRUNCATE {staging}'))
+            loaded += len(batch)
+            count += 1
+        return loaded, count
+
+    async def load(self, rows: Iterable[Sequence[Any]], deletes: Iterable[Dict[str, Any]] = (),
+                   scopes: Iterable[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """
+        Delete, then insert or update rows.
+
+        Args:
+            rows: KB_COLUMNS ordered rows to insert or update
+            deletes: Natural keys (column -> value) of the rows to delete
+            scopes: Column -> value filters whose rows are all deleted, e.g. a chain about to be reloaded
+
+        Returns:
+            {"rows", "deleted", "batches", "method", "elapsed_s", "rows_per_s"}
+        """
+        start = time.perf_counter()
+        loaded = batches = 0
+        async with self.db.session_scope() as session:
+            connection = await session.connection()
+            dialect = connection.dialect.name
+            use_copy = dialect == 'postgresql' and connection.dialect.driver == 'asyncpg'
+            deleted = await self._delete(connection, deletes, scopes)
+            if use_copy:
+                loaded, batches = await self._copy_batches(connection, self._batches(rows))
+            else:
+                statement = self._upsert_statement(dialect)
+                for batch in self._batches(rows):
+                    await connection.execute(statement, batch)
+                    loaded += len(batch)
+                    batches += 1
+        elapsed = time.perf_counter() - start
+        return {'rows': loaded, 'deleted': deleted, 'batches': batches, 'method': 'copy' if use_copy else 'upsert',
+                'elapsed_s': elapsed, 'rows_per_s': loaded / elapsed if elapsed else 0.0}
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: kb_columnar.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Chunked, memory-mappable columnar file format for knowledge base rows
+"""
+################################################################################
+# built-in modules
+import json
+import os
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# third-party modules
+import numpy as np
+
+################################################################################
+# File layout (little endian, every array 8-byte aligned)
+#   chunk 0 arrays | chunk 1 arrays | ... | JSON footer | uint64 footer length | b"KBCOL1\0\0"
+# The footer holds the dictionaries and, per chunk, row count plus dtype/offset/length of each
+# array. A reader memory-maps the file and every column of a chunk is an np.frombuffer view,
+# nothing is parsed or copied until a value is used.
+#
+# Columns
+#   key, value, address          utf-8 string columns: <name>.data uint8 + <name>.offsets int64 (chunk-relative)
+#   tags, network, user_id,      dictionary-encoded: <name> int32 codes into footer["dictionaries"][name],
+#   meta_data                    tags entries are decoded lists, so no per-row JSON parsing
+#   kb_id int32, chain_id int64
+MAGIC = b"KBCOL1\0\0"
+STRING_COLUMNS = ("key", "value", "address")
+DICT_COLUMNS = ("tags", "network", "user_id", "meta_data")
+NUMERIC_COLUMNS = {"kb_id": np.int32, "chain_id": np.int64}
+KB_COLUMNS = ('key', 'value', 'tags', 'kb_id', 'user_id', 'meta_data')
+
+class KbColumnarWriter:
+    '''
+    Writes knowledge base rows in chunks of chunk_rows, only one chunk is held in memory.
+    The file is written to <path>.tmp and moved into place by close().
+
+    Usage:
+        with KbColumnarWriter(path) as writer:
+            writer.write(row, chain_id, network, address)  # row in KB_COLUMNS order
+    '''
+    def __init__(self, path: str, chunk_rows: int = 65536):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._offset = 0
+        self._chunks: List[Dict[str, Any]] = []
+        self._dictionaries: Dict[str, Dict[str, int]] = {name: {} for name in DICT_COLUMNS}
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pending: Dict[str, list] = {name: [] for name in (*STRING_COLUMNS, *DICT_COLUMNS, *NUMERIC_COLUMNS)}
+
+    def _code(self, name: str, value: str) -> int:
+        codes = self._dictionaries[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    def write(self, row: List[Any], chain_id: int, network: str, address: str) -> None:
+        key, value, tags, kb_id, user_id, meta_data = row
+        if not isinstance(meta_data, str):
+            meta_data = json.dumps(meta_data)
+        pending = self._pending
+        pending["key"].append(key)
+        pending["value"].append(value)
+        pending["address"].append(address)
+        pending["tags"].append(self._code("tags", tags))
+        pending["network"].append(self._code("network", network))
+        pending["user_id"].append(self._code("user_id", str(user_id)))
+        pending["meta_data"].append(self._code("meta_data", meta_data))
+        pending["kb_id"].append(kb_id)
+        pending["chain_id"].append(chain_id)
+        self.rows += 1
+        if len(pending["key"]) >= self.chunk_rows:
+            self._flush()
+
+    def _write_array(self, array: np.ndarray) -> Dict[str, Any]:
+        data = np.ascontiguousarray(array).tobytes()
+        entry = {"dtype": array.dtype.str, "offset": self._offset, "length": len(array)}
+        padding = -len(data) % 8
+        self._file.write(data + b"\0" * padding)
+        self._offset += len(data) + padding
+        return entry
+
+    def _flush(self) -> None:
+        pending = self._pending
+        count = len(pending["key"])
+        if not count:
+            return
+        arrays = {}
+        for name in STRING_COLUMNS:
+            encoded = [value.encode() for value in pending[name]]
+            offsets = np.zeros(count + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            arrays[f"{name}.data"] = self._write_array(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+            arrays[f"{name}.offsets"] = self._write_array(offsets)
+        for name in DICT_COLUMNS:
+            arrays[name] = self._write_array(np.array(pending[name], dtype=np.int32))
+        for name, dtype in NUMERIC_COLUMNS.items():
+            arrays[name] = self._write_array(np.array(pending[name], dtype=dtype))
+        self._chunks.append({"rows": count, "arrays": arrays})
+        self._reset()
+
+    def close(self) -> None:
+        self._flush()
+        dictionaries = {name: list(codes) for name, codes in self._dictionaries.items()}
+        dictionaries["tags"] = [json.loads(tags) for tags in dictionaries["tags"]]
+        footer = json.dumps({"rows": self.rows, "chunks": self._chunks, "dictionaries": dictionaries}).encode()
+        self._file.write(footer + struct.pack("<Q", len(footer)) + MAGIC)
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self) -> "KbColumnarWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+class KbColumnarChunk:
+    '''Zero-copy views over one chunk of a memory-mapped file'''
+    def __init__(self, reader: "KbColumnarReader", meta: Dict[str, Any]):
+        self.rows = meta["rows"]
+        self._reader = reader
+        self.arrays = {name: np.frombuffer(reader.buffer, dtype=np.dtype(entry["dtype"]), count=entry["length"],
+                                           offset=entry["offset"])
+                       for name, entry in meta["arrays"].items()}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def string(self, name: str, i: int) -> str:
+        offsets = self.arrays[f"{name}.offsets"]
+        return self.arrays[f"{name}.data"][offsets[i]:offsets[i + 1]].tobytes().decode()
+
+    def strings(self, name: str) -> List[str]:
+        data = self.arrays[f"{name}.data"].tobytes()
+        offsets = self.arrays[f"{name}.offsets"].tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(self.rows)]
+
+    def decoded(self, name: str) -> List[Any]:
+        """Dictionary column as values"""
+        dictionary = self._reader.dictionaries[name]
+        return [dictionary[code] for code in self.arrays[name].tolist()]
+
+class KbColumnarReader:
+    '''
+    Memory-mapped reader of a KbColumnarWriter file. Opening reads only the footer; numeric and
+    code columns are numpy views on the mapped pages, so filters such as
+    reader.chunks[0].arrays["network"] == reader.code("network", "base") never touch the strings.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        size = os.path.getsize(path)
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r") if size else np.empty(0, dtype=np.uint8)
+        if size < 16 or bytes(self.buffer[-8:]) != MAGIC:
+            raise ValueError(f"{path} is not a knowledge base columnar file")
+        footer_length = struct.unpack("<Q", bytes(self.buffer[-16:-8]))[0]
+        footer = json.loads(bytes(self.buffer[-16 - footer_length:-16]))
+        self.rows: int = footer["rows"]
+        self.dictionaries: Dict[str, List[Any]] = footer["dictionaries"]
+        self.chunks = [KbColumnarChunk(self, meta) for meta in footer["chunks"]]
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def code(self, name: str, value: Any) -> Optional[int]:
+        """Dictionary code of value in column name, None if it never occurs"""
+        try:
+            return self.dictionaries[name].index(value)
+        except ValueError:
+            return None
+
+    def iter_rows(self) -> Iterator[Tuple[str, str, List[str], int, str, str]]:
+        """(key, value, tags list, kb_id, user_id, meta_data) per row"""
+        for chunk in self.chunks:
+            columns = [chunk.strings("key"), chunk.strings("value"), chunk.decoded("tags"),
+                       chunk.arrays["kb_id"].tolist(), chunk.decoded("user_id"), chunk.decoded("meta_data")]
+            yield from zip(*columns)
+
+    def iter_kb_rows(self) -> Iterator[List[Any]]:
+        """Rows in KB_COLUMNS order with JSON-encoded tags, as written to the CSV files and bulk loader"""
+        for _, _, row in self.iter_addressed_kb_rows():
+            yield row
+
+    def iter_addressed_kb_rows(self) -> Iterator[Tuple[int, str, List[Any]]]:
+        """(chain_id, address, row in KB_COLUMNS order) per row"""
+        encoded_tags = [json.dumps(tags) for tags in self.dictionaries["tags"]]
+        for chunk in self.chunks:
+            tags = [encoded_tags[code] for code in chunk.arrays["tags"].tolist()]
+            for chain_id, address, key, value, tag, kb_id, user_id, meta_data in zip(
+                    chunk.arrays["chain_id"].tolist(), chunk.strings("address"), chunk.strings("key"),
+                    chunk.strings("value"), tags, chunk.arrays["kb_id"].tolist(),
+                    chunk.decoded("user_id"), chunk.decoded("meta_data")):
+                yield chain_id, address, [key, value, tag, kb_id, user_id, meta_data]
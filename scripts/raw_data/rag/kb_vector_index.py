@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: kb_vector_index.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: Embedded IVF vector index over knowledge base rows with incremental upserts/deletes and memory-mapped persistence
+"""
+################################################################################
+# built-in modules
+import hashlib
+import json
+import os
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+# third-party modules
+import numpy as np
+
+################################################################################
+# Embedders
+class Embedder(ABC):
+    '''
+    Interface of the embedders used by KbVectorIndex: embed() returns one L2-normalized
+    float32 row per text. name identifies the embedding space and is stored with the index,
+    an index cannot be reopened with a different embedder.
+    '''
+    name: str = ""
+    dim: int = 0
+
+    @abstractmethod
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        pass
+
+class HashingEmbedder(Embedder):
+    '''
+    Deterministic local embedder for offline use and tests: word unigrams and character
+    trigrams are hashed (blake2b, stable across processes) into dim signed buckets.
+    '''
+    _TOKEN = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = self._TOKEN.findall(text.lower())
+        features = list(words)
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+                vectors[row, digest % self.dim] += 1.0 if (digest >> 63) else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+################################################################################
+# Index
+_META_FILE = "index.json"
+_ARRAYS = {  # name -> (dtype, per-slot width or None for one value per slot)
+    "vectors": (np.float32, "dim"),
+    "kb_id": (np.int32, None),
+    "tags": (np.uint64, None),
+    "alive": (np.bool_, None),
+    "assign": (np.int32, None),
+}
+MAX_TAGS = np.dtype(_ARRAYS["tags"][0]).itemsize * 8  # tags are stored as a bit set per row
+
+class KbVectorIndex:
+    '''
+    Inverted-file (IVF) index with cosine similarity over knowledge base rows.
+
+    - rows are identified by a caller-chosen id (e.g. "<chainId>:<address>"); upsert()
+      replaces the vector of an existing id, delete() tombstones its slot for reuse
+    - until train_threshold rows exist every search is exact; after that the vectors are
+      clustered into nlist k-means centroids (default sqrt(rows)) and a search only scores the
+      rows in the inverted lists of the nprobe closest clusters, re-clustering happens once the
+      index doubled since training. Recall grows with nprobe, tune it for the embedder in use
+    - kb_id and tags filters are applied as vector masks; when they leave at most
+      exact_threshold rows those rows are scored exactly instead of probing clusters
+    - the arrays live in memory-mapped files under path, save() flushes them and writes the
+      id and tag dictionaries, open() maps them back without reading the vectors
+    - sync_generation is a caller-defined version of the source data the index reflects
+      (json2csv stores its manifest generation), saved with the index
+    '''
+    def __init__(self, path: str, embedder: Embedder, nlist: Optional[int] = None, nprobe: int = 16,
+                 train_threshold: int = 2048, exact_threshold: int = 4096, capacity: int = 1024):
+        self.path = path
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.exact_threshold = exact_threshold
+        self.ids: List[Optional[str]] = []
+        self.slot_of: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.tag_bits: Dict[str, int] = {}
+        self.centroids: Optional[np.ndarray] = None
+        self.trained_size = 0
+        self.sync_generation: Optional[int] = None
+        self._lists: List[List[int]] = []
+        self._list_cache: Dict[int, np.ndarray] = {}
+        os.makedirs(path, exist_ok=True)
+        self._arrays: Dict[str, np.memmap] = {}
+        self._views: Dict[str, np.ndarray] = {}
+        self._map_arrays(capacity, create=True)
+
+    ############################################################################
+    # storage
+    def _array_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _map_arrays(self, capacity: int, create: bool) -> None:
+        """Map every per-slot array with room for capacity slots, extending the files if needed"""
+        self.capacity = capacity
+        for name, (dtype, width) in _ARRAYS.items():
+            shape = (capacity, self.dim) if width else (capacity,)
+            nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            file_path = self._array_path(name)
+            mode = "wb" if create else "ab"
+            if create or os.path.getsize(file_path) < nbytes:
+                # a new or extended file reads as zeros past its old end
+                with open(file_path, mode) as f:
+                    f.truncate(nbytes)
+            self._arrays[name] = np.memmap(file_path, dtype=dtype, mode="r+", shape=shape)
+            # plain ndarray view of the same pages, indexing a memmap subclass is much slower
+            self._views[name] = self._arrays[name].view(np.ndarray)
+
+    def _grow(self, needed: int) -> None:
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        if capacity != self.capacity:
+            for array in self._arrays.values():
+                array.flush()
+            self._map_arrays(capacity, create=False)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._views["vectors"]
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+    def save(self) -> None:
+        for array in self._arrays.values():
+            array.flush()
+        if self.centroids is not None:
+            np.save(os.path.join(self.path, "centroids.npy"), self.centroids)
+        meta = {"embedder": self.embedder.name, "dim": self.dim, "capacity": self.capacity, "nlist": self.nlist,
+                "nprobe": self.nprobe, "train_threshold": self.train_threshold, "exact_threshold": self.exact_threshold,
+                "trained_size": self.trained_size, "sync_generation": self.sync_generation,
+                "ids": self.ids, "tag_bits": self.tag_bits, "has_centroids": self.centroids is not None}
+        tmp_path = os.path.join(self.path, f"{_META_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, _META_FILE))
+
+    @classmethod
+    def open(cls, path: str, embedder: Embedder) -> "KbVectorIndex":
+        """Open the index saved under path, or create an empty one"""
+        meta_path = os.path.join(path, _META_FILE)
+        if not os.path.exists(meta_path):
+            return cls(path, embedder)
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta["embedder"] != embedder.name:
+            raise ValueError(f"Index at {path} was built with {meta['embedder']}, not {embedder.name}")
+        index = cls.__new__(cls)
+        index.path, index.embedder, index.dim = path, embedder, meta["dim"]
+        index.nlist, index.nprobe = meta["nlist"], meta["nprobe"]
+        index.train_threshold, index.trained_size = meta["train_threshold"], meta["trained_size"]
+        index.exact_threshold = meta["exact_threshold"]
+        index.sync_generation = meta.get("sync_generation")
+        index.ids = meta["ids"]
+        index.slot_of = {row_id: slot for slot, row_id in enumerate(index.ids) if row_id is not None}
+        index.free = [slot for slot, row_id in enumerate(index.ids) if row_id is None]
+        index.tag_bits = meta["tag_bits"]
+        index.centroids = np.load(os.path.join(path, "centroids.npy")) if meta["has_centroids"] else None
+        index._arrays, index._views = {}, {}
+        index._map_arrays(meta["capacity"], create=False)
+        index._rebuild_lists()
+        return index
+
+    ############################################################################
+    # writes
+    def _tag_mask(self, tags: Iterable[str], create: bool) -> Optional[int]:
+        mask = 0
+        for tag in tags:
+            bit = self.tag_bits.get(tag)
+            if bit is None:
+                if not create:
+                    return None
+                if len(self.tag_bits) >= MAX_TAGS:
+                    raise ValueError(f"An index holds at most {MAX_TAGS} distinct tags")
+                bit = self.tag_bits[tag] = len(self.tag_bits)
+            mask |= 1 << bit
+        return mask
+
+    def upsert(self, ids: Sequence[str], texts: Sequence[str], kb_ids: Union[int, Sequence[int]] = 1,
+               tags: Optional[Sequence[Sequence[str]]] = None, vectors: Optional[np.ndarray] = None) -> None:
+        """Insert rows, or replace the vector and filters of rows whose id is already indexed"""
+        if not len(ids):
+            return
+        vectors = self.embedder.embed(texts) if vectors is None else np.asarray(vectors, dtype=np.float32)
+        kb_ids = [kb_ids] * len(ids) if isinstance(kb_ids, int) else kb_ids
+        tags = tags or [[] for _ in ids]
+        slots = []
+        for row_id in ids:
+            slot = self.slot_of.get(row_id)
+            if slot is None:
+                slot = self.free.pop() if self.free else len(self.ids)
+                if slot == len(self.ids):
+                    self.ids.append(row_id)
+                else:
+                    self.ids[slot] = row_id
+                self.slot_of[row_id] = slot
+            slots.append(slot)
+        self._grow(len(self.ids))
+        slots = np.asarray(slots, dtype=np.int64)
+        views = self._views
+        views["vectors"][slots] = vectors
+        views["kb_id"][slots] = np.asarray(kb_ids, dtype=np.int32)
+        views["tags"][slots] = np.array([self._tag_mask(row_tags, create=True) for row_tags in tags], dtype=np.uint64)
+        views["alive"][slots] = True
+        if self.centroids is not None:
+            assign = self._nearest_centroids(vectors)
+            views["assign"][slots] = assign
+            # a slot that moved stays in its old list too, search drops entries whose assign differs
+            for slot, cluster in zip(slots.tolist(), assign.tolist()):
+                self._lists[cluster].append(slot)
+                self._list_cache.pop(cluster, None)
+        self._maybe_train()
+
+    def delete(self, ids: Iterable[str]) -> int:
+        """Remove rows by id, returns how many were indexed"""
+        removed = 0
+        for row_id in ids:
+            slot = self.slot_of.pop(row_id, None)
+            if slot is None:
+                continue
+            self._views["alive"][slot] = False
+            self.ids[slot] = None
+            self.free.append(slot)
+            removed += 1
+        return removed
+
+    ############################################################################
+    # clustering
+    def _nearest_centroids(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _maybe_train(self) -> None:
+        size = len(self)
+        if size >= self.train_threshold and (self.centroids is None or size >= 2 * self.trained_size):
+            self.train()
+
+    def train(self, iterations: int = 10) -> None:
+        """Cluster the live vectors with spherical k-means (fixed seed) and reassign every row"""
+        live = np.flatnonzero(self._views["alive"][:len(self.ids)])
+        if not len(live):
+            return
+        vectors = np.asarray(self.vectors[live])
+        nlist = self.nlist or max(1, int(np.sqrt(len(live))))
+        nlist = min(nlist, len(live))
+        rng = np.random.RandomState(0)
+        centroids = vectors[rng.choice(len(live), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, vectors)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            empty = norms[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.maximum(norms, 1e-12))
+        self.centroids = centroids.astype(np.float32)
+        self._views["assign"][live] = self._nearest_centroids(vectors)
+        self.trained_size = len(live)
+        self._rebuild_lists()
+
+    def _rebuild_lists(self) -> None:
+        """Inverted lists (slots per cluster) from the assign column of the live slots"""
+        self._list_cache = {}
+        if self.centroids is None:
+            self._lists = []
+            return
+        live = np.flatnonzero(self._views["alive"][:len(self.ids)])
+        assign = self._views["assign"][live]
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(len(self.centroids) + 1))
+        self._lists = [live[order[bounds[c]:bounds[c + 1]]].tolist() for c in range(len(self.centroids))]
+
+    def _list(self, cluster: int) -> np.ndarray:
+        cached = self._list_cache.get(cluster)
+        if cached is None:
+            cached = self._list_cache[cluster] = np.unique(np.asarray(self._lists[cluster], dtype=np.int64))
+        return cached
+
+    def _candidates(self, vector: np.ndarray, nprobe: int) -> np.ndarray:
+        """Live slots of the nprobe clusters closest to vector"""
+        scores = self.centroids @ vector
+        nprobe = min(nprobe, len(scores))
+        probes = np.argpartition(-scores, nprobe - 1)[:nprobe] if nprobe < len(scores) else np.arange(len(scores))
+        lists = [self._list(cluster) for cluster in probes.tolist()]
+        slots = np.concatenate(lists)
+        clusters = np.repeat(probes, [len(rows) for rows in lists])
+        current = self._views["alive"][slots] & (self._views["assign"][slots] == clusters)
+        return slots[current]
+
+    ############################################################################
+    # search
+    def search(self, query: Union[str, np.ndarray], k: int = 10, kb_id: Optional[int] = None,
+               tags: Optional[Sequence[str]] = None, nprobe: Optional[int] = None) -> List[Tuple[str, float]]:
+        """
+        The k rows most similar to query (text or vector) as (id, cosine similarity), best first.
+
+        Args:
+            kb_id: Only rows of this knowledge base
+            tags: Only rows carrying all of these tags
+            nprobe: Clusters scored, defaults to self.nprobe; ignored before training
+        """
+        vector = self.embedder.embed([query])[0] if isinstance(query, str) else np.asarray(query, dtype=np.float32)
+        used = len(self.ids)
+        views = self._views
+        if kb_id is not None or tags:
+            # filters first: a selective filter is answered exactly over the rows it leaves
+            mask = views["alive"][:used].copy()
+            if kb_id is not None:
+                mask &= views["kb_id"][:used] == kb_id
+            if tags:
+                required = self._tag_mask(tags, create=False)
+                if required is None:
+                    return []
+                required = np.uint64(required)
+                mask &= (views["tags"][:used] & required) == required
+            slots = np.flatnonzero(mask)
+            if self.centroids is not None and len(slots) > self.exact_threshold:
+                slots = self._candidates(vector, nprobe or self.nprobe)
+                slots = slots[mask[slots]]
+        elif self.centroids is not None:
+            slots = self._candidates(vector, nprobe or self.nprobe)
+        else:
+            slots = np.flatnonzero(views["alive"][:used])
+        if not len(slots):
+            return []
+        scores = self.vectors[slots] @ vector
+        if k < len(slots):
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+        else:
+            top = np.argsort(-scores, kind="stable")
+        return [(self.ids[slots[i]], float(scores[i])) for i in top]
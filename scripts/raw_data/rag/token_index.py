@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Filename: token_index.py
+Author: Zhou Nan
+Date: 2026-10-18
+Description: In-memory multi-chain token resolution index (exact symbol/name/address, prefix and fuzzy) over the *.tokens.json catalogs
+"""
+################################################################################
+# built-in modules
+import glob
+import hashlib
+import json
+import os
+import struct
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+# third-party modules
+import numpy as np
+from pydantic import BaseModel
+
+################################################################################
+# File layout (little endian)
+#   b"TKIX" | uint32 version | uint32 header length | JSON header | 8-byte aligned arrays
+# The header lists name, dtype, offset and length of every array. Arrays are read with
+# np.frombuffer, so loading is one file read and no per-token Python work.
+MAGIC = b"TKIX"
+VERSION = 1
+FUZZY_INDEX_DISTANCE = 1  # deletions indexed per term, fuzzy() accepts max_distance up to this
+
+ChainRef = Union[int, str, None]
+
+class TokenRecord(BaseModel):
+    chain_id: int
+    network: str
+    address: str
+    symbol: str
+    name: str
+    decimals: int
+
+def _hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+def _deletions(term: str, distance: int) -> set:
+    """term and every string obtained by deleting up to distance characters (SymSpell)"""
+    variants = {term}
+    frontier = {term}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word)) if len(word) > 1}
+        variants |= frontier
+    return variants
+
+def _within_one(a: str, b: str) -> int:
+    """_edit_distance(a, b, 1) without the dynamic programming table"""
+    if a == b:
+        return 0
+    if len(a) == len(b):
+        diffs = [i for i in range(len(a)) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return 1
+        if len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]:
+            return 1
+        return 2
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) != 1:
+        return 2
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    return 1 if a[i + 1:] == b[i:] else 2
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (a transposition costs 1), limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if limit == 1:
+        return _within_one(a, b)
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+class _Strings:
+    '''utf-8 buffer + offsets, item i is buffer[offsets[i]:offsets[i + 1]]'''
+    def __init__(self, buffer: bytes, offsets: np.ndarray):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.bounds = offsets.tolist()  # Python ints slice bytes much faster than numpy scalars
+
+    @classmethod
+    def from_list(cls, values: List[str]) -> "_Strings":
+        encoded = [value.encode() for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(b"".join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.bounds) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.buffer[self.bounds[i]:self.bounds[i + 1]].decode()
+
+################################################################################
+# Index
+class TokenIndex:
+    '''
+    Token lookups across chains without going through the vector store.
+
+    - exact: (chainId, address), (chainId, symbol), (chainId, name) and chain-less
+      address/symbol/name keys are hashed into one sorted uint64 array, a lookup is one binary search
+    - prefix: names, symbols and name words sorted lexicographically (a flattened trie),
+      a prefix maps to one contiguous range found by binary search
+    - fuzzy: SymSpell deletion index over the same terms, candidates are verified with a
+      bounded edit distance that counts transpositions as one edit ("USCD" -> "USDC")
+
+    chain arguments accept a chainId or a network name ("arbitrum"). Matching is case-insensitive.
+    '''
+    def __init__(self, arrays: Dict[str, np.ndarray], strings: Dict[str, _Strings]):
+        self.chain_ids = arrays["chain_id"]
+        self.decimals = arrays["decimals"]
+        self._key_hashes = arrays["key_hash"]
+        self._key_tokens = arrays["key_token"]
+        self._term_offsets = arrays["term_offsets"]
+        self._term_tokens = arrays["term_tokens"]
+        self._delete_hashes = arrays["delete_hash"]
+        self._delete_terms = arrays["delete_term"]
+        self.addresses = strings["address"]
+        self.symbols = strings["symbol"]
+        self.names = strings["name"]
+        self.networks = strings["network"]
+        self._terms = strings["terms"]
+        self.network_chain_ids: Dict[str, int] = {}
+        for network, chain_id in {(self.networks[i], int(self.chain_ids[i])) for i in range(len(self))}:
+            self.network_chain_ids[network.lower()] = chain_id
+
+    def __len__(self) -> int:
+        return len(self.chain_ids)
+
+    ############################################################################
+    # build / persist
+    @classmethod
+    def from_tokens(cls, tokens: Iterable[Dict]) -> "TokenIndex":
+        """Build from token dicts in the *.tokens.json shape ({address, name, symbol, decimals, network})"""
+        rows = []
+        seen = set()
+        for token in tokens:
+            key = (int(token["network"]["chainId"]), token["address"].lower())
+            if key in seen:
+                continue
+            seen.add(key)
+            rows.append(token)
+
+        keys: List[Tuple[int, int]] = []
+        term_postings: Dict[str, List[int]] = {}
+        for i, token in enumerate(rows):
+            chain_id = int(token["network"]["chainId"])
+            symbol, name = token["symbol"].lower(), token["name"].lower()
+            address = token["address"].lower()
+            keys += [(_hash(f"a|{chain_id}|{address}"), i), (_hash(f"a||{address}"), i),
+                     (_hash(f"s|{chain_id}|{symbol}"), i), (_hash(f"s||{symbol}"), i),
+                     (_hash(f"n|{chain_id}|{name}"), i), (_hash(f"n||{name}"), i)]
+            for term in {symbol, name, *name.split()}:
+                term_postings.setdefault(term, []).append(i)
+        keys.sort()
+
+        terms = sorted(term_postings, key=lambda term: term.encode())
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(term_postings[term]) for term in terms], out=term_offsets[1:])
+        deletes = sorted((_hash(variant), term_id) for term_id, term in enumerate(terms)
+                         for variant in _deletions(term, FUZZY_INDEX_DISTANCE))
+
+        arrays = {
+            "chain_id": np.array([int(token["network"]["chainId"]) for token in rows], dtype=np.int64),
+            "decimals": np.array([int(token.get("decimals") or 0) for token in rows], dtype=np.int16),
+            "key_hash": np.array([key for key, _ in keys], dtype=np.uint64),
+            "key_token": np.array([token for _, token in keys], dtype=np.int32),
+            "term_offsets": term_offsets,
+            "term_tokens": np.array([i for term in terms for i in term_postings[term]], dtype=np.int32),
+            "delete_hash": np.array([key for key, _ in deletes], dtype=np.uint64),
+            "delete_term": np.array([term for _, term in deletes], dtype=np.int32),
+        }
+        strings = {
+            "address": _Strings.from_list([token["address"] for token in rows]),
+            "symbol": _Strings.from_list([token["symbol"] for token in rows]),
+            "name": _Strings.from_list([token["name"] for token in rows]),
+            "network": _Strings.from_list([token["network"]["name"] for token in rows]),
+            "terms": _Strings.from_list(terms),
+        }
+        return cls(arrays, strings)
+
+    @classmethod
+    def from_catalogs(cls, paths: Iterable[str]) -> "TokenIndex":
+        """Build from *.tokens.json catalog files"""
+        def tokens():
+            for path in paths:
+                with open(path, "r") as f:
+                    yield from json.load(f)["data"]
+        return cls.from_tokens(tokens())
+
+    @classmethod
+    def from_catalog_dir(cls, directory: str) -> "TokenIndex":
+        return cls.from_catalogs(sorted(glob.glob(os.path.join(directory, "*.tokens.json"))))
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {
+            "chain_id": self.chain_ids, "decimals": self.decimals,
+            "key_hash": self._key_hashes, "key_token": self._key_tokens,
+            "term_offsets": self._term_offsets, "term_tokens": self._term_tokens,
+            "delete_hash": self._delete_hashes, "delete_term": self._delete_terms,
+        }
+        for name, column in (("address", self.addresses), ("symbol", self.symbols), ("name", self.names),
+                             ("network", self.networks), ("terms", self._terms)):
+            arrays[f"{name}_buffer"] = np.frombuffer(column.buffer, dtype=np.uint8)
+            arrays[f"{name}_offsets"] = column.offsets
+        return arrays
+
+    def save(self, path: str) -> None:
+        """Write the index to path atomically"""
+        arrays = self._arrays()
+        entries, offset = [], 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            entries.append({"name": name, "dtype": array.dtype.str, "offset": offset, "length": len(array)})
+            offset += -(-array.nbytes // 8) * 8
+        header = json.dumps(entries).encode()
+        header += b" " * (-(12 + len(header)) % 8)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(MAGIC + struct.pack("<II", VERSION, len(header)) + header)
+            for array in arrays.values():
+                data = np.ascontiguousarray(array).tobytes()
+                f.write(data + b"\0" * (-len(data) % 8))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TokenIndex":
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:4] != MAGIC:
+            raise ValueError(f"{path} is not a token index file")
+        version, header_length = struct.unpack("<II", data[4:12])
+        if version != VERSION:
+            raise ValueError(f"{path} has token index version {version}, expected {VERSION}")
+        base = 12 + header_length
+        arrays = {}
+        for entry in json.loads(data[12:base]):
+            dtype = np.dtype(entry["dtype"])
+            arrays[entry["name"]] = np.frombuffer(data, dtype=dtype, count=entry["length"], offset=base + entry["offset"])
+        strings = {name: _Strings(arrays.pop(f"{name}_buffer").tobytes(), arrays.pop(f"{name}_offsets"))
+                   for name in ("address", "symbol", "name", "network", "terms")}
+        return cls(arrays, strings)
+
+    ############################################################################
+    # lookups
+    def record(self, i: int) -> TokenRecord:
+        return TokenRecord(chain_id=int(self.chain_ids[i]), network=self.networks[i], address=self.addresses[i],
+                           symbol=self.symbols[i], name=self.names[i], decimals=int(self.decimals[i]))
+
+    def chain_id_of(self, chain: ChainRef) -> Optional[int]:
+        if chain is None or isinstance(chain, int):
+            return chain
+        if chain.isdigit():
+            return int(chain)
+        chain_id = self.network_chain_ids.get(chain.lower())
+        if chain_id is None:
+            raise ValueError(f"Unknown network: {chain}")
+        return chain_id
+
+    def _exact(self, key: str) -> np.ndarray:
+        target = np.uint64(_hash(key))
+        start = np.searchsorted(self._key_hashes, target, side="left")
+        end = np.searchsorted(self._key_hashes, target, side="right")
+        return self._key_tokens[start:end]
+
+    def _filter_chain(self, tokens: Iterable[int], chain_id: Optional[int]) -> List[int]:
+        return [int(i) for i in tokens if chain_id is None or self.chain_ids[i] == chain_id]
+
+    def by_address(self, address: str, chain: ChainRef = None) -> List[TokenRecord]:
+        """Tokens with this contract address, on one chain or on every chain"""
+        chain_id = self.chain_id_of(chain)
+        address = address.lower()
+        tokens = self._exact(f"a|{'' if chain_id is None else chain_id}|{address}")
+        return [self.record(i) for i in tokens if self.addresses[i].lower() == address]
+
+    def by_symbol(self, symbol: str, chain: ChainRef = None) -> List[TokenRecord]:
+        chain_id = self.chain_id_of(chain)
+        symbol = symbol.lower()
+        tokens = self._exact(f"s|{'' if chain_id is None else chain_id}|{symbol}")
+        return [self.record(i) for i in tokens if self.symbols[i].lower() == symbol]
+
+    def by_name(self, name: str, chain: ChainRef = None) -> List[TokenRecord]:
+        chain_id = self.chain_id_of(chain)
+        name = name.lower()
+        tokens = self._exact(f"n|{'' if chain_id is None else chain_id}|{name}")
+        return [self.record(i) for i in tokens if self.names[i].lower() == name]
+
+    def _term_tokens_of(self, term_id: int) -> np.ndarray:
+        return self._term_tokens[self._term_offsets[term_id]:self._term_offsets[term_id + 1]]
+
+    def _lower_bound(self, text: bytes) -> int:
+        low, high = 0, len(self._terms)
+        buffer, offsets = self._terms.buffer, self._terms.bounds
+        while low < high:
+            mid = (low + high) // 2
+            if buffer[offsets[mid]:offsets[mid + 1]] < text:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def prefix(self, text: str, chain: ChainRef = None, limit: int = 10) -> List[TokenRecord]:
+        """Tokens whose symbol, name or a word of the name starts with text, shortest term first"""
+        chain_id = self.chain_id_of(chain)
+        needle = text.lower().encode()
+        buffer, offsets = self._terms.buffer, self._terms.bounds
+        matches = []
+        term_id = self._lower_bound(needle)
+        while term_id < len(self._terms) and buffer[offsets[term_id]:offsets[term_id + 1]].startswith(needle):
+            matches.append((offsets[term_id + 1] - offsets[term_id], term_id))
+            term_id += 1
+        return self._collect(sorted(matches), chain_id, limit)
+
+    def fuzzy(self, text: str, chain: ChainRef = None, max_distance: int = 1, limit: int = 10) -> List[TokenRecord]:
+        """Tokens with a symbol, name or name word within max_distance edits of text, closest first"""
+        if max_distance > FUZZY_INDEX_DISTANCE:
+            raise ValueError(f"max_distance must be at most {FUZZY_INDEX_DISTANCE}")
+        chain_id = self.chain_id_of(chain)
+        text = text.lower()
+        hashes = np.array(sorted(_hash(variant) for variant in _deletions(text, max_distance)), dtype=np.uint64)
+        starts = np.searchsorted(self._delete_hashes, hashes, side="left")
+        ends = np.searchsorted(self._delete_hashes, hashes, side="right")
+        candidates = {int(term) for start, end in zip(starts, ends) for term in self._delete_terms[start:end]}
+        matches = []
+        for term_id in candidates:
+            term = self._terms[term_id]
+            distance = _edit_distance(text, term, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, term, term_id))
+        return self._collect([(distance, term_id) for distance, _, term_id in sorted(matches)], chain_id, limit)
+
+    def _collect(self, ranked_terms: List[Tuple], chain_id: Optional[int], limit: int) -> List[TokenRecord]:
+        tokens: List[int] = []
+        seen = set()
+        for _, term_id in ranked_terms:
+            for i in self._filter_chain(self._term_tokens_of(term_id), chain_id):
+                if i not in seen:
+                    seen.add(i)
+                    tokens.append(i)
+                    if len(tokens) >= limit:
+                        return [self.record(i) for i in tokens]
+        return [self.record(i) for i in tokens]
+
+    def resolve(self, text: str, chain: ChainRef = None, limit: int = 5) -> List[TokenRecord]:
+        """
+        Best effort resolution of free text to tokens: address, then exact symbol, exact name,
+        prefix and finally fuzzy matches.
+        """
+        text = text.strip()
+        if text.lower().startswith("0x"):
+            return self.by_address(text, chain)[:limit]
+        for matches in (lambda: self.by_symbol(text, chain), lambda: self.by_name(text, chain),
+                        lambda: self.prefix(text, chain, limit=limit), lambda: self.fuzzy(text, chain, limit=limit)):
+            found = matches()
+            if found:
+                return found[:limit]
+        return []